@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import argparse
+import threading
+import requests
+import numpy as np
+
+SERVICE_URL = "http://localhost:8001"
+
+
+def run_client(url, audio_path, model_path, params, requests_per_client, results):
+    """
+    Submits requests one after another and waits for each result, like a single user would.
+
+    Args:
+        url: Base URL of the conversion service.
+        audio_path: Audio file uploaded with every request.
+        model_path: Path to the voice conversion model on the server.
+        params: Extra conversion parameters sent as form fields.
+        requests_per_client: Number of requests sent by this client.
+        results: Shared list the per-request results are appended to.
+    """
+    for _ in range(requests_per_client):
+        start_time = time.time()
+        try:
+            with open(audio_path, "rb") as file:
+                response = requests.post(
+                    f"{url}/convert",
+                    data={"model_path": model_path, **params},
+                    files={"audio": (os.path.basename(audio_path), file)},
+                )
+            response.raise_for_status()
+            job_id = response.json()["job_id"]
+            while True:
+                response = requests.get(f"{url}/convert/{job_id}", params={"wait": 30})
+                response.raise_for_status()
+                job = response.json()
+                if job["status"] in ("done", "failed"):
+                    break
+            if job["status"] == "done":
+                requests.get(f"{url}/convert/{job_id}/audio").raise_for_status()
+            job["client_latency"] = time.time() - start_time
+            results.append(job)
+        except Exception as error:
+            results.append(
+                {
+                    "status": "failed",
+                    "error": str(error),
+                    "client_latency": time.time() - start_time,
+                }
+            )
+
+
+def run_load(url, audio_path, model_path, params, clients, requests_per_client):
+    """
+    Drives the service with concurrent clients and returns a latency and throughput report.
+
+    Args:
+        url: Base URL of the conversion service.
+        audio_path: Audio file uploaded with every request.
+        model_path: Path to the voice conversion model on the server.
+        params: Extra conversion parameters sent as form fields.
+        clients: Number of concurrent clients.
+        requests_per_client: Number of requests sent by each client.
+    """
+    results = []
+    threads = [
+        threading.Thread(
+            target=run_client,
+            args=(url, audio_path, model_path, params, requests_per_client, results),
+        )
+        for _ in range(clients)
+    ]
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed_time = time.time() - start_time
+
+    done = [result for result in results if result["status"] == "done"]
+    latencies = np.array([result["client_latency"] for result in done])
+    report = {
+        "clients": clients,
+        "requests": len(results),
+        "completed": len(done),
+        "failed": len(results) - len(done),
+        "elapsed_seconds": elapsed_time,
+        "requests_per_second": len(done) / elapsed_time,
+        "latency": (
+            {
+                "p50": float(np.percentile(latencies, 50)),
+                "p95": float(np.percentile(latencies, 95)),
+                "max": float(latencies.max()),
+            }
+            if len(done)
+            else None
+        ),
+        "mean_batches_per_request": (
+            float(np.mean([result["batches"] for result in done])) if done else None
+        ),
+        "errors": sorted({result["error"] for result in results if "error" in result}),
+    }
+    report["server"] = requests.get(f"{url}/metrics").json()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Drive the local conversion service with concurrent requests."
+    )
+    parser.add_argument("--audio_path", type=str, required=True)
+    parser.add_argument("--model_path", type=str, required=True)
+    parser.add_argument("--url", type=str, default=SERVICE_URL)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests_per_client", type=int, default=4)
+    parser.add_argument(
+        "--params",
+        type=str,
+        default="{}",
+        help='Extra conversion parameters as JSON, e.g. \'{"pitch": 2, "f0_method": "rmvpe"}\'.',
+    )
+    args = parser.parse_args()
+    report = run_load(
+        args.url,
+        args.audio_path,
+        args.model_path,
+        {name: str(value) for name, value in json.loads(args.params).items()},
+        args.clients,
+        args.requests_per_client,
+    )
+    print(json.dumps(report, indent=2))
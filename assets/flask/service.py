@@ -0,0 +1,180 @@
+import os, sys
+import signal
+import argparse
+import tempfile
+from distutils.util import strtobool
+from flask import Flask, request, jsonify, send_file
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+from rvc.infer.infer import VoiceConverter
+from rvc.infer.profiling import profiler
+from rvc.infer.scheduler import BatchScheduler, ConversionJob, DEFAULT_PARAMS
+from rvc.lib.utils import load_audio_infer
+
+HOST = "localhost"
+PORT = 8001
+
+app = Flask(__name__)
+scheduler = None
+results_dir = None
+
+
+def parse_params(form):
+    """
+    Converts the submitted form fields to conversion parameters, typed after DEFAULT_PARAMS.
+
+    Args:
+        form: The request form.
+    """
+    params = {}
+    for name, default in DEFAULT_PARAMS.items():
+        if name not in form:
+            continue
+        value = form[name]
+        if isinstance(default, bool):
+            value = bool(strtobool(value))
+        elif isinstance(default, (int, float)):
+            value = type(default)(value)
+        elif value == "":
+            value = None if default is None else value
+        params[name] = value
+    return params
+
+
+@app.route("/convert", methods=["POST"])
+def convert():
+    model_path = request.form.get("model_path", "")
+    if not os.path.isfile(model_path):
+        return jsonify({"error": f"Model not found: {model_path}"}), 400
+    try:
+        params = parse_params(request.form)
+    except ValueError as error:
+        return jsonify({"error": f"Invalid parameter: {error}"}), 400
+
+    # decode in the request thread so the scheduler worker only runs the models
+    if "audio" in request.files:
+        upload = request.files["audio"]
+        suffix = os.path.splitext(upload.filename or "")[1] or ".wav"
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as file:
+            upload.save(file)
+            input_path = file.name
+        try:
+            with profiler.stage("load_audio"):
+                audio = load_audio_infer(input_path, 16000)
+        except RuntimeError as error:
+            return jsonify({"error": str(error)}), 400
+        finally:
+            os.remove(input_path)
+    elif "audio_path" in request.form:
+        try:
+            with profiler.stage("load_audio"):
+                audio = load_audio_infer(request.form["audio_path"], 16000)
+        except RuntimeError as error:
+            return jsonify({"error": str(error)}), 400
+    else:
+        return jsonify({"error": "No audio file or audio_path provided"}), 400
+
+    job = ConversionJob(audio, None, model_path, params)
+    job.output_path = os.path.join(results_dir, f"{job.id}.wav")
+    scheduler.submit(job)
+    return jsonify(job.to_dict()), 202
+
+
+@app.route("/convert/<job_id>", methods=["GET"])
+def status(job_id):
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    # long polling, the request returns as soon as the job finishes
+    wait = float(request.args.get("wait", 0))
+    if wait > 0:
+        job.done.wait(wait)
+    return jsonify(job.to_dict())
+
+
+@app.route("/convert/<job_id>/audio", methods=["GET"])
+def fetch(job_id):
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    wait = float(request.args.get("wait", 0))
+    if wait > 0:
+        job.done.wait(wait)
+    if job.status == "failed":
+        return jsonify(job.to_dict()), 500
+    if job.status != "done":
+        return jsonify(job.to_dict()), 409
+    return send_file(job.output_path, as_attachment=True)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify(scheduler.metrics())
+
+
+@app.route("/metrics/prometheus", methods=["GET"])
+def prometheus_metrics():
+    return profiler.metrics.to_prometheus(), 200, {
+        "Content-Type": "text/plain; version=0.0.4"
+    }
+
+
+@app.route("/shutdown", methods=["POST"])
+def shutdown():
+    print("The conversion service is shutting down...")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def start_service(
+    host: str = HOST,
+    port: int = PORT,
+    max_wait: float = 0.05,
+    max_batch_duration: float = 60.0,
+    output_dir: str = None,
+):
+    """
+    Starts the conversion service with one warm VoiceConverter behind a batching scheduler.
+
+    Args:
+        host: Host to bind to.
+        port: Port to listen on.
+        max_wait: Longest time in seconds a request waits for others to share its batch.
+        max_batch_duration: Most seconds of audio converted in one batched call.
+        output_dir: Directory for converted files, a temporary directory by default.
+    """
+    global scheduler, results_dir
+    results_dir = output_dir or tempfile.mkdtemp(prefix="rvc_service_")
+    os.makedirs(results_dir, exist_ok=True)
+    scheduler = BatchScheduler(VoiceConverter(), max_wait, max_batch_duration)
+    print(f"Conversion service listening on http://{host}:{port}")
+    app.run(host=host, port=port, threaded=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local voice conversion service.")
+    parser.add_argument("--host", type=str, default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument(
+        "--max_wait",
+        type=float,
+        default=0.05,
+        help="Longest time in seconds a request waits for others to share its batch.",
+    )
+    parser.add_argument(
+        "--max_batch_duration",
+        type=float,
+        default=60.0,
+        help="Most seconds of audio converted in one batched call.",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=None,
+        help="Directory for converted files, a temporary directory by default.",
+    )
+    args = parser.parse_args()
+    start_service(
+        args.host, args.port, args.max_wait, args.max_batch_duration, args.output_dir
+    )
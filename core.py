@@ -348,66 +348,38 @@ def run_tts_script(
     embedder_model: str,
     embedder_model_custom: str = None,
     sid: int = 0,
+    tts_backend: str = "edge",
 ):
-
-    tts_script_path = os.path.join("rvc", "lib", "tools", "tts.py")
+    from rvc.lib.tools.tts import get_tts_backend, read_tts_text
 
     if os.path.exists(output_tts_path):
         os.remove(output_tts_path)
 
-    command_tts = [
-        *map(
-            str,
-            [
-                python,
-                tts_script_path,
-                tts_file,
-                tts_text,
-                tts_voice,
-                tts_rate,
-                output_tts_path,
-            ],
-        ),
-    ]
-    subprocess.run(command_tts)
     infer_pipeline = import_voice_converter()
-    infer_pipeline.convert_audio(
+    infer_pipeline.convert_tts(
+        text=read_tts_text(tts_file, tts_text),
+        tts_backend=get_tts_backend(tts_backend, tts_voice, tts_rate),
+        audio_output_path=output_rvc_path,
+        model_path=pth_path,
+        index_path=index_path,
+        tts_output_path=output_tts_path,
         pitch=pitch,
-        filter_radius=filter_radius,
+        f0_file=f0_file,
+        f0_method=f0_method,
         index_rate=index_rate,
         volume_envelope=volume_envelope,
         protect=protect,
         hop_length=hop_length,
-        f0_method=f0_method,
-        audio_input_path=output_tts_path,
-        audio_output_path=output_rvc_path,
-        model_path=pth_path,
-        index_path=index_path,
         split_audio=split_audio,
         f0_autotune=f0_autotune,
         f0_autotune_strength=f0_autotune_strength,
+        filter_radius=filter_radius,
+        embedder_model=embedder_model,
+        embedder_model_custom=embedder_model_custom,
         clean_audio=clean_audio,
         clean_strength=clean_strength,
         export_format=export_format,
-        f0_file=f0_file,
-        embedder_model=embedder_model,
-        embedder_model_custom=embedder_model_custom,
         sid=sid,
-        formant_shifting=None,
-        formant_qfrency=None,
-        formant_timbre=None,
-        post_process=None,
-        reverb=None,
-        pitch_shift=None,
-        limiter=None,
-        gain=None,
-        distortion=None,
-        chorus=None,
-        bitcrush=None,
-        clipping=None,
-        compressor=None,
-        delay=None,
-        sliders=None,
     )
 
     return f"Text {tts_text} synthesized successfully.", output_rvc_path.replace(
@@ -562,14 +534,33 @@ def run_train_script(
 
 
 # Index
-def run_index_script(model_name: str, rvc_version: str, index_algorithm: str):
+def run_index_script(
+    model_name: str,
+    rvc_version: str,
+    index_algorithm: str,
+    index_type: str = "IVF-Flat",
+    index_params: str = "{}",
+    benchmark_index: bool = True,
+    incremental_index: bool = False,
+    speaker_partitioned_index: bool = False,
+):
     index_script_path = os.path.join("rvc", "train", "process", "extract_index.py")
     command = [
         python,
         index_script_path,
-        os.path.join(logs_path, model_name),
-        rvc_version,
-        index_algorithm,
+        *map(
+            str,
+            [
+                os.path.join(logs_path, model_name),
+                rvc_version,
+                index_algorithm,
+                index_type,
+                index_params or "{}",
+                benchmark_index,
+                incremental_index,
+                speaker_partitioned_index,
+            ],
+        ),
     ]
 
     subprocess.run(command)
@@ -649,6 +640,37 @@ def run_audio_analyzer_script(
     return audio_info, plot_path
 
 
+# Benchmark
+def run_benchmark_script(
+    lengths: str = "10",
+    configs: str = "all",
+    f0_methods: str = "all",
+    repeats: int = 3,
+    index_vectors: int = 20000,
+    device: str = "cpu",
+    output_path: str = os.path.join("logs", "benchmark.json"),
+):
+    benchmark_script_path = os.path.join("rvc", "infer", "benchmark.py")
+    command = [
+        python,
+        benchmark_script_path,
+        *map(
+            str,
+            [
+                lengths,
+                configs,
+                f0_methods,
+                repeats,
+                index_vectors,
+                device,
+                output_path,
+            ],
+        ),
+    ]
+    subprocess.run(command)
+    return f"Benchmark report saved to {output_path}."
+
+
 # Parse arguments
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -1825,6 +1847,13 @@ def parse_arguments():
         help=f0_file_description,
         default=None,
     )
+    tts_parser.add_argument(
+        "--tts_backend",
+        type=str,
+        help="Text-to-speech engine, 'edge' for Edge TTS or 'stub' for an offline test voice.",
+        choices=["edge", "stub"],
+        default="edge",
+    )
 
     # Parser for 'preprocess' mode
     preprocess_parser = subparsers.add_parser(
@@ -2108,6 +2137,42 @@ def parse_arguments():
         default="Auto",
         required=False,
     )
+    index_parser.add_argument(
+        "--index_type",
+        type=str,
+        choices=["Flat", "IVF-Flat", "IVF-PQ", "HNSW", "SQ"],
+        help="Type of the FAISS index to build.",
+        default="IVF-Flat",
+        required=False,
+    )
+    index_parser.add_argument(
+        "--index_params",
+        type=str,
+        help='JSON object with index parameters (nlist, nprobe, pq_m, pq_nbits, hnsw_m, ef_construction, ef_search, sq_type, drift_threshold, imbalance_threshold), e.g. \'{"nprobe": 4}\'.',
+        default="{}",
+        required=False,
+    )
+    index_parser.add_argument(
+        "--benchmark_index",
+        type=lambda x: bool(strtobool(x)),
+        choices=[True, False],
+        help="Measure recall@8, query latency and file size of the built index.",
+        default=True,
+    )
+    index_parser.add_argument(
+        "--incremental_index",
+        type=lambda x: bool(strtobool(x)),
+        choices=[True, False],
+        help="Add new feature files to the existing index instead of skipping it, retraining only when the data drifts.",
+        default=False,
+    )
+    index_parser.add_argument(
+        "--speaker_partitioned_index",
+        type=lambda x: bool(strtobool(x)),
+        choices=[True, False],
+        help="Store the vectors of each speaker in a contiguous id range so inference only retrieves from the target speaker.",
+        default=False,
+    )
 
     # Parser for 'model_extract' mode
     model_extract_parser = subparsers.add_parser(
@@ -2257,6 +2322,54 @@ def parse_arguments():
         "--input_path", type=str, help="Path to the input audio file.", required=True
     )
 
+    # Parser for 'benchmark' mode
+    benchmark_parser = subparsers.add_parser(
+        "benchmark",
+        help="Time every inference stage on synthetic audio with randomly initialized models.",
+    )
+    benchmark_parser.add_argument(
+        "--lengths",
+        type=str,
+        help="Comma-separated audio lengths in seconds.",
+        default="10",
+    )
+    benchmark_parser.add_argument(
+        "--configs",
+        type=str,
+        help="Comma-separated model configurations (e.g. 'v1/40000,v2/48000') or 'all'.",
+        default="all",
+    )
+    benchmark_parser.add_argument(
+        "--f0_methods",
+        type=str,
+        help="Comma-separated F0 methods (rmvpe, fcpe, crepe, crepe-tiny) or 'all'.",
+        default="all",
+    )
+    benchmark_parser.add_argument(
+        "--repeats",
+        type=int,
+        help="Timed runs per stage, the median is reported.",
+        default=3,
+    )
+    benchmark_parser.add_argument(
+        "--index_vectors",
+        type=int,
+        help="Number of random vectors in the retrieval index.",
+        default=20000,
+    )
+    benchmark_parser.add_argument(
+        "--device",
+        type=str,
+        help="Device to run the models on.",
+        default="cpu",
+    )
+    benchmark_parser.add_argument(
+        "--output_path",
+        type=str,
+        help="Path of the JSON report.",
+        default=os.path.join("logs", "benchmark.json"),
+    )
+
     return parser.parse_args()
 
 
@@ -2420,6 +2533,7 @@ def main():
                 embedder_model=args.embedder_model,
                 embedder_model_custom=args.embedder_model_custom,
                 f0_file=args.f0_file,
+                tts_backend=args.tts_backend,
             )
         elif args.mode == "preprocess":
             run_preprocess_script(
@@ -2471,6 +2585,11 @@ def main():
                 model_name=args.model_name,
                 rvc_version=args.rvc_version,
                 index_algorithm=args.index_algorithm,
+                index_type=args.index_type,
+                index_params=args.index_params,
+                benchmark_index=args.benchmark_index,
+                incremental_index=args.incremental_index,
+                speaker_partitioned_index=args.speaker_partitioned_index,
             )
         elif args.mode == "model_extract":
             run_model_extract_script(
@@ -2512,6 +2631,16 @@ def main():
             run_audio_analyzer_script(
                 input_path=args.input_path,
             )
+        elif args.mode == "benchmark":
+            run_benchmark_script(
+                lengths=args.lengths,
+                configs=args.configs,
+                f0_methods=args.f0_methods,
+                repeats=args.repeats,
+                index_vectors=args.index_vectors,
+                device=args.device,
+                output_path=args.output_path,
+            )
     except Exception as error:
         print(f"An error occurred during execution: {error}")
 
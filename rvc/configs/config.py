@@ -12,6 +12,14 @@ version_config_paths = [
 ]
 
 
+def write_file(path: str, content: str):
+    """Replaces a file at once, so processes starting in parallel never read it half written."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
 def singleton(cls):
     instances = {}
 
@@ -35,7 +43,45 @@ class Config:
         )
         self.json_config = self.load_config_json()
         self.gpu_mem = None
+        # Indexes up to this many vectors are searched exactly on the inference device
+        self.exact_retrieval_max_vectors = 250000
+        # How hybrid F0 methods combine their estimates, "median" or "weighted_mean"
+        self.hybrid_f0_reducer = "median"
+        # On CPU, RMVPE and FCPE F0 of audio longer than parallel_f0_min_seconds is estimated on
+        # overlapping windows by this many worker processes of parallel_f0_threads threads each,
+        # 1 disables it and 0 starts as many as fit on the cores
+        self.parallel_f0_workers = 1
+        self.parallel_f0_threads = 1
+        self.parallel_f0_min_seconds = 60.0
         self.x_pad, self.x_query, self.x_center, self.x_max = self.device_config()
+        # Overlap F0 estimation, feature extraction, retrieval and synthesis of one conversion,
+        # with at most pipeline_queue_size segments waiting between two stages
+        self.pipelined_inference = True
+        self.pipeline_queue_size = 2
+        # Convert through preallocated (pinned on CUDA) buffers into one result array and keep
+        # the allocator cache between segments instead of emptying it after each one
+        self.reuse_inference_buffers = True
+        # Pack the training samples into memory-mapped shards after extraction, storing the
+        # audio as "int16", "float16" or "float32"
+        self.pack_training_shards = True
+        self.training_shard_audio_dtype = "int16"
+        # Training slices per RMVPE batch during extraction, 0 picks it from the free memory
+        self.rmvpe_batch_size = 0
+        # Training slices per embedder batch during extraction, 0 uses 32 on GPUs and 8 on CPU
+        self.embedder_batch_size = 0
+        # Run the embedder in bfloat16 during extraction on CPUs with native bfloat16 support,
+        # faster but its features are about 1.5% off, while inference and the index use float32
+        # features, so the model trains on slightly different inputs than it converts
+        self.embedder_cpu_bf16 = False
+        # Extract F0 and features in one pass that reads every slice once and runs both
+        # models at the same time, instead of a pitch pass followed by an embedding pass
+        self.fused_feature_extraction = True
+        # Extraction on the CPU runs cpu_workers processes of cpu_worker_threads threads, each
+        # with its own models, a short calibration cached in logs/cpu_workers.json picks the
+        # ones left at 0, and cpu_worker_affinity pins every worker to its own cores
+        self.cpu_workers = 0
+        self.cpu_worker_threads = 0
+        self.cpu_worker_affinity = False
 
     def load_config_json(self) -> dict:
         configs = {}
@@ -66,8 +112,7 @@ class Config:
                 with open(full_config_path, "r") as f:
                     config = json.load(f)
                 config["train"]["fp16_run"] = fp16_run_value
-                with open(full_config_path, "w") as f:
-                    json.dump(config, f, indent=4)
+                write_file(full_config_path, json.dumps(config, indent=4))
             except FileNotFoundError:
                 print(f"File not found: {full_config_path}")
 
@@ -77,8 +122,7 @@ class Config:
             preprocess_content = preprocess_content.replace(
                 "3.0" if precision == "fp16" else "3.7", preprocess_target_version
             )
-            with open(preprocess_path, "w") as f:
-                f.write(preprocess_content)
+            write_file(preprocess_path, preprocess_content)
 
         return f"Overwritten preprocess and config.json to use {precision}."
 
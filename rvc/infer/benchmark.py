@@ -0,0 +1,495 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import platform
+import torch
+import faiss
+import librosa
+import torchcrepe
+import numpy as np
+import soundfile as sf
+import torch.nn.functional as F
+from scipy import signal
+from transformers import HubertConfig
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+from rvc.infer.infer import VoiceConverter
+from rvc.infer.pipeline import AudioProcessor, Pipeline, bh, ah
+from rvc.infer.retrieval import IndexRetriever
+from rvc.lib.utils import HubertModelWithFinalProj
+from rvc.lib.algorithm.synthesizers import Synthesizer
+from rvc.lib.predictors.RMVPE import RMVPE0Predictor, E2E
+from rvc.lib.predictors.FCPE import FCPEF0Predictor, FCPE
+from rvc.configs.config import Config, version_config_paths
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SOURCE_SAMPLE_RATE = 44100
+SAMPLE_RATE = 16000
+WINDOW = 160
+F0_METHODS = ["rmvpe", "fcpe", "crepe", "crepe-tiny"]
+
+# Configuration of the released FCPE checkpoint, needed to build a random one
+FCPE_CONFIG = {
+    "mel": {
+        "sampling_rate": 16000,
+        "num_mels": 128,
+        "n_fft": 1024,
+        "win_size": 1024,
+        "hop_size": 160,
+        "fmin": 0,
+        "fmax": 8000,
+    },
+    "model": {
+        "input_channel": 128,
+        "out_dims": 360,
+        "n_layers": 12,
+        "n_chans": 512,
+        "use_siren": False,
+        "use_full": False,
+        "f0_max": 1975.5,
+        "f0_min": 32.70,
+        "confidence": False,
+    },
+    "loss": {
+        "loss_mse_scale": 10,
+        "loss_l2_regularization": False,
+        "loss_l2_regularization_scale": 1,
+        "loss_grad1_mse": False,
+        "loss_grad1_mse_scale": 1,
+    },
+}
+
+
+def get_peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return peak / 1024**2 if platform.system() == "Darwin" else peak / 1024
+
+
+def generate_voiced_audio(seconds, sample_rate=SOURCE_SAMPLE_RATE, seed=0):
+    """
+    Generates a harmonic signal with a gliding, vibrato F0 contour, syllable-like amplitude and breath noise.
+
+    Args:
+        seconds: Length of the audio in seconds.
+        sample_rate: Sample rate of the audio.
+        seed: Seed of the noise generator.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    f0 = 160 + 60 * np.sin(2 * np.pi * 0.2 * t) + 4 * np.sin(2 * np.pi * 5.5 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    audio = sum(
+        np.sin(harmonic * phase) / harmonic
+        for harmonic in range(1, 16)
+        if harmonic * f0.max() < sample_rate / 2
+    )
+    envelope = np.clip(np.sin(2 * np.pi * 2.5 * t), 0, None) ** 0.5
+    audio = audio * envelope + 0.01 * rng.standard_normal(t.shape[0])
+    return (0.5 * audio / np.abs(audio).max()).astype(np.float32)
+
+
+def write_random_predictors(directory):
+    """
+    Saves randomly initialized RMVPE and FCPE checkpoints in the layout their loaders expect.
+
+    Args:
+        directory: Directory the checkpoints are written to.
+    """
+    rmvpe_path = os.path.join(directory, "rmvpe.pt")
+    torch.save(E2E(4, 1, (2, 2)).state_dict(), rmvpe_path)
+    fcpe_path = os.path.join(directory, "fcpe.pt")
+    model = FCPE(**FCPE_CONFIG["model"], **FCPE_CONFIG["loss"])
+    torch.save({"config": FCPE_CONFIG, "model": model.state_dict()}, fcpe_path)
+    return rmvpe_path, fcpe_path
+
+
+def build_synthesizer(config_path, device):
+    """
+    Builds a randomly initialized Synthesizer from a training configuration, as inference loads it.
+
+    Args:
+        config_path: Path to one of the rvc/configs/v1|v2/*.json files.
+        device: Device to run the model on.
+    """
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    sample_rate = config["data"]["sample_rate"]
+    net_g = Synthesizer(
+        config["data"]["filter_length"] // 2 + 1,
+        config["train"]["segment_size"] // config["data"]["hop_length"],
+        **config["model"],
+        use_f0=True,
+        is_half=False,
+        sr=sample_rate,
+    )
+    del net_g.enc_q
+    return net_g.eval().to(device), sample_rate
+
+
+class StageTimer:
+    """
+    Times benchmark stages and records their real-time factor and the peak RSS after each of them.
+    """
+
+    def __init__(self, audio_seconds, repeats, device):
+        self.audio_seconds = audio_seconds
+        self.repeats = repeats
+        self.device = device
+        self.stages = {}
+
+    def synchronize(self):
+        if str(self.device).startswith("cuda"):
+            torch.cuda.synchronize()
+
+    def __call__(self, name, function, *args, **kwargs):
+        """
+        Runs the function once untimed, then `repeats` times timed, and returns its result.
+
+        Args:
+            name: Name of the stage in the report.
+            function: The stage to run.
+        """
+        with torch.no_grad():
+            result = function(*args, **kwargs)
+            timings = []
+            for _ in range(self.repeats):
+                self.synchronize()
+                start_time = time.perf_counter()
+                result = function(*args, **kwargs)
+                self.synchronize()
+                timings.append(time.perf_counter() - start_time)
+        seconds = float(np.median(timings))
+        self.stages[name] = {
+            "seconds": seconds,
+            "min_seconds": float(np.min(timings)),
+            "rtf": seconds / self.audio_seconds,
+            "peak_rss_mb": get_peak_rss_mb(),
+        }
+        return result
+
+
+def batched_features_max_abs_diff(embedder, device, lengths=(2.5, 1.7, 0.9, 0.31)):
+    """
+    Embeds segments of uneven lengths in one batch, as the conversion service does, and one
+    at a time, and returns the largest difference of their features.
+
+    Args:
+        embedder: The embedder model.
+        device: Device the embedder runs on.
+        lengths: Segment lengths in seconds.
+    """
+    segments = [
+        torch.from_numpy(generate_voiced_audio(seconds, SAMPLE_RATE, seed=i)).float()
+        for i, seconds in enumerate(lengths)
+    ]
+    with torch.no_grad():
+        batched = embedder.forward_batch(segments, final_proj=True)
+        single = [
+            embedder.final_proj(
+                embedder(segment.view(1, -1).to(device))["last_hidden_state"]
+            )[0]
+            for segment in segments
+        ]
+    max_abs_diff = 0.0
+    for batch_feats, feats in zip(batched, single):
+        if batch_feats.shape != feats.shape:
+            return float("inf")
+        max_abs_diff = max(max_abs_diff, float((batch_feats - feats).abs().max()))
+    return max_abs_diff
+
+
+def check_batched_features(device="cpu", tolerance=1e-3):
+    """
+    Raises if batched features of uneven segments differ from their per-segment features
+    by more than `tolerance`, and returns the largest difference.
+
+    Args:
+        device: Device the embedder runs on.
+        tolerance: Largest allowed absolute difference.
+    """
+    torch.manual_seed(0)
+    embedder = HubertModelWithFinalProj(HubertConfig()).eval().to(device)
+    max_abs_diff = batched_features_max_abs_diff(embedder, device)
+    if max_abs_diff > tolerance:
+        raise ValueError(
+            f"Batched features differ from per-segment features by {max_abs_diff}."
+        )
+    return max_abs_diff
+
+
+def check_pipelined_conversion(seconds=12.0, seed=0, config_name="v2/40000"):
+    """
+    Converts the same audio sequentially and pipelined with the same seed, raising if the
+    outputs are not identical, and returns the number of segments compared. Like inference,
+    it needs the RMVPE weights in rvc/models/predictors.
+
+    Args:
+        seconds: Length of the audio, split into segments of a few seconds.
+        seed: Seed set before each conversion.
+        config_name: Synthesizer configuration such as "v2/40000".
+    """
+    config = Config()
+    # short segments, so the stages of several segments overlap
+    config.x_query, config.x_center, config.x_max = 1, 3, 4
+    net_g, sample_rate = build_synthesizer(
+        os.path.join("rvc", "configs", f"{config_name}.json"), config.device
+    )
+    embedder = HubertModelWithFinalProj(HubertConfig()).eval().to(config.device)
+    pipeline = Pipeline(sample_rate, config)
+    audio = generate_voiced_audio(seconds, SAMPLE_RATE)
+    outputs = {}
+    for pipelined in (False, True):
+        pipeline.pipelined_inference = pipelined
+        torch.manual_seed(seed)
+        outputs[pipelined] = pipeline.pipeline(
+            embedder,
+            net_g,
+            0,
+            audio.copy(),
+            0,
+            "rmvpe",
+            "",
+            0.0,
+            True,
+            3,
+            1,
+            config_name.split("/")[0],
+            0.5,
+            128,
+            False,
+            1.0,
+            None,
+        )
+    if not np.array_equal(outputs[False], outputs[True]):
+        raise ValueError(
+            f"Pipelined output differs from the sequential one by {np.abs(outputs[False] - outputs[True]).max()}."
+        )
+    return len(pipeline._split_audio(audio)[2])
+
+
+def run_benchmark(
+    lengths,
+    configs,
+    f0_methods,
+    repeats=3,
+    index_vectors=20000,
+    device="cpu",
+    output_path=None,
+):
+    """
+    Times every inference stage on synthetic audio with randomly initialized models.
+
+    Args:
+        lengths: Audio lengths in seconds.
+        configs: Synthesizer configurations such as "v2/40000".
+        f0_methods: F0 methods to time.
+        repeats: Timed runs per stage, the median is reported.
+        index_vectors: Number of random vectors in the retrieval index.
+        device: Device to run the models on.
+        output_path: Optional path the JSON report is written to.
+    """
+    torch.manual_seed(0)
+    work_dir = tempfile.mkdtemp(prefix="rvc_benchmark_")
+    rmvpe_path, fcpe_path = write_random_predictors(work_dir)
+    rmvpe = RMVPE0Predictor(rmvpe_path, is_half=False, device=device)
+    fcpe = FCPEF0Predictor(
+        fcpe_path,
+        f0_min=50,
+        f0_max=1100,
+        dtype=torch.float32,
+        device=device,
+        sample_rate=SAMPLE_RATE,
+        threshold=0.03,
+    )
+    embedder = HubertModelWithFinalProj(HubertConfig()).eval().to(device)
+    synthesizers = {
+        name: build_synthesizer(
+            os.path.join("rvc", "configs", f"{name}.json"), device
+        )
+        for name in configs
+    }
+    dims = sorted({768 if name.startswith("v2") else 256 for name in configs})
+    retrievers = {}
+    for dim in dims:
+        index = faiss.IndexFlatL2(dim)
+        rng = np.random.default_rng(0)
+        index.add(rng.standard_normal((index_vectors, dim), dtype=np.float32))
+        retrievers[f"retrieval_exact_{dim}"] = IndexRetriever(
+            index, device, False, max_exact_vectors=index_vectors
+        )
+        retrievers[f"retrieval_faiss_{dim}"] = IndexRetriever(
+            index, device, False, max_exact_vectors=0
+        )
+
+    report = {
+        "device": str(device),
+        "torch_version": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "repeats": repeats,
+        "index_vectors": index_vectors,
+        "lengths": [],
+    }
+    report["batched_features_max_abs_diff"] = batched_features_max_abs_diff(
+        embedder, device
+    )
+    for seconds in lengths:
+        print(f"Benchmarking {seconds} seconds of audio...")
+        timer = StageTimer(seconds, repeats, device)
+        input_path = os.path.join(work_dir, f"input_{seconds}.wav")
+        sf.write(input_path, generate_voiced_audio(seconds), SOURCE_SAMPLE_RATE)
+
+        audio, sr = timer("decode", sf.read, input_path, dtype="float32")
+        audio = timer(
+            "resample", librosa.resample, audio, orig_sr=sr, target_sr=SAMPLE_RATE
+        )
+        audio = timer("high_pass", signal.filtfilt, bh, ah, audio)
+        p_len = audio.shape[0] // WINDOW
+
+        feats = torch.from_numpy(np.ascontiguousarray(audio)).float().view(1, -1)
+        feats = feats.to(device)
+        feats = timer("embedder", lambda: embedder(feats)["last_hidden_state"])
+        features = {
+            768: feats,
+            256: timer("embedder_final_proj", lambda: embedder.final_proj(feats)),
+        }
+
+        x = audio.astype(np.float32)
+        f0 = None
+        for method in f0_methods:
+            if method == "rmvpe":
+                result = timer(
+                    "f0_rmvpe", rmvpe.infer_from_audio, x, thred=0.03
+                )
+            elif method == "fcpe":
+                result = timer("f0_fcpe", fcpe.compute_f0, x, p_len=p_len)
+            elif method in ("crepe", "crepe-tiny"):
+                audio_crepe = torch.from_numpy(x / np.quantile(np.abs(x), 0.999))
+                result = timer(
+                    f"f0_{method.replace('-', '_')}",
+                    torchcrepe.predict,
+                    audio_crepe.unsqueeze(0).to(device),
+                    SAMPLE_RATE,
+                    WINDOW,
+                    50,
+                    1100,
+                    "full" if method == "crepe" else "tiny",
+                    batch_size=WINDOW * 2,
+                    device=device,
+                    pad=True,
+                )
+                result = result.squeeze(0).cpu().numpy()
+            f0 = result if f0 is None else f0
+        f0 = np.full(p_len, 160.0) if f0 is None else np.resize(f0, p_len)
+
+        # quantize the contour the way Pipeline.get_f0 does
+        f0_mel = 1127 * np.log(1 + np.maximum(f0, 0) / 700)
+        f0_mel_min, f0_mel_max = 1127 * np.log(1 + 50 / 700), 1127 * np.log(1 + 1100 / 700)
+        f0_mel[f0_mel > 0] = (f0_mel[f0_mel > 0] - f0_mel_min) * 254 / (
+            f0_mel_max - f0_mel_min
+        ) + 1
+        f0_coarse = np.clip(np.rint(f0_mel), 1, 255).astype(int)
+
+        for name, retriever in retrievers.items():
+            dim = int(name.rsplit("_", 1)[1])
+            timer(name, retriever.retrieve, features[dim], 0.75)
+
+        models = {}
+        for name, (net_g, sample_rate) in synthesizers.items():
+            model_timer = StageTimer(seconds, repeats, device)
+            feats = features[768 if name.startswith("v2") else 256]
+            feats = F.interpolate(feats.permute(0, 2, 1), scale_factor=2).permute(
+                0, 2, 1
+            )
+            length = min(p_len, feats.shape[1])
+            pitch = torch.from_numpy(f0_coarse[:length]).unsqueeze(0).long().to(device)
+            pitchf = torch.from_numpy(f0[:length]).unsqueeze(0).float().to(device)
+            sid = torch.tensor([0], device=device).long()
+            p_lens = torch.tensor([length], device=device).long()
+            output = model_timer(
+                "infer",
+                lambda: net_g.infer(feats[:, :length], p_lens, pitch, pitchf, sid)[0][
+                    0, 0
+                ]
+                .data.cpu()
+                .float()
+                .numpy(),
+            )
+            output = model_timer(
+                "rms_matching",
+                AudioProcessor.change_rms,
+                audio,
+                SAMPLE_RATE,
+                output,
+                SAMPLE_RATE,
+                0.5,
+            )
+            model_timer(
+                "noise_reduction",
+                VoiceConverter.remove_audio_noise,
+                output,
+                sample_rate,
+                0.5,
+            )
+            output_path_wav = os.path.join(work_dir, f"output_{seconds}.wav")
+            model_timer(
+                "export", sf.write, output_path_wav, output, sample_rate, format="WAV"
+            )
+            models[name] = {
+                "stages": model_timer.stages,
+                "rtf": sum(stage["rtf"] for stage in model_timer.stages.values()),
+            }
+
+        report["lengths"].append(
+            {
+                "seconds": seconds,
+                "stages": timer.stages,
+                "models": models,
+            }
+        )
+
+    report["peak_rss_mb"] = get_peak_rss_mb()
+    shutil.rmtree(work_dir, ignore_errors=True)
+    if output_path:
+        with open(output_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Benchmark report saved to '{output_path}'")
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        max_abs_diff = check_batched_features()
+        print(f"Batched features match per-segment features within {max_abs_diff}.")
+        segments = check_pipelined_conversion()
+        print(f"Pipelined output equals the sequential output over {segments} segments.")
+        sys.exit(0)
+    lengths = [float(x) for x in sys.argv[1].split(",")] if len(sys.argv) > 1 else [10]
+    configs = (
+        sys.argv[2].split(",")
+        if len(sys.argv) > 2 and sys.argv[2] != "all"
+        else [os.path.splitext(path)[0].replace(os.sep, "/") for path in version_config_paths]
+    )
+    f0_methods = (
+        sys.argv[3].split(",") if len(sys.argv) > 3 and sys.argv[3] != "all" else F0_METHODS
+    )
+    repeats = int(sys.argv[4]) if len(sys.argv) > 4 else 3
+    index_vectors = int(sys.argv[5]) if len(sys.argv) > 5 else 20000
+    device = sys.argv[6] if len(sys.argv) > 6 else "cpu"
+    output_path = sys.argv[7] if len(sys.argv) > 7 else None
+
+    report = run_benchmark(
+        lengths, configs, f0_methods, repeats, index_vectors, device, output_path
+    )
+    print(json.dumps(report, indent=2))
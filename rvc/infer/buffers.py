@@ -0,0 +1,149 @@
+import numpy as np
+import torch
+
+
+class InferenceBuffers:
+    """
+    Reusable tensors of a Pipeline, so converting a segment does not allocate new ones.
+
+    Segments are copied to the device through one pinned host buffer and generator outputs come
+    back through another. Both are sized for the longest segment and only grow when a segment
+    does not fit. Speaker id and length tensors are kept on the device and refilled in place.
+    """
+
+    def __init__(self, device, max_input: int, max_output: int):
+        """
+        Initializes the InferenceBuffers, the buffers themselves are allocated on first use.
+
+        Args:
+            device: The inference device.
+            max_input: Samples of the longest expected input segment.
+            max_output: Samples of the longest expected generator output.
+        """
+        self.device = device
+        self.pin_memory = torch.cuda.is_available() and str(device).startswith("cuda")
+        self.max_input = max_input
+        self.max_output = max_output
+        self.host_input = None
+        self.device_input = None
+        self.host_output = None
+        self.copied = None
+        self.p_lens = None
+        self.sids = {}
+
+    def _host(self, size: int):
+        return torch.empty(size, dtype=torch.float32, pin_memory=self.pin_memory)
+
+    def to_device(self, audio: np.ndarray, dtype) -> torch.Tensor:
+        """
+        Copies a segment to the device, returning a (1, samples) view of the device buffer
+        that stays valid until the next call.
+
+        Args:
+            audio: The input audio segment.
+            dtype: The dtype of the features.
+        """
+        if audio.ndim == 2:
+            audio = audio.mean(-1)
+        size = audio.shape[0]
+        if self.host_input is None or size > self.host_input.shape[0]:
+            self.max_input = max(self.max_input, size)
+            self.host_input = self._host(self.max_input)
+            self.device_input = torch.empty(
+                self.max_input, dtype=dtype, device=self.device
+            )
+            self.copied = None
+        if self.device_input.dtype != dtype:
+            self.device_input = torch.empty(
+                self.host_input.shape[0], dtype=dtype, device=self.device
+            )
+        if self.copied is not None:
+            # the previous transfer may still read the pinned buffer
+            self.copied.synchronize()
+        self.host_input[:size].numpy()[:] = audio
+        feats = self.device_input[:size]
+        feats.copy_(self.host_input[:size], non_blocking=self.pin_memory)
+        if self.pin_memory:
+            self.copied = torch.cuda.Event()
+            self.copied.record()
+        return feats.view(1, -1)
+
+    def to_host(self, audio: torch.Tensor) -> np.ndarray:
+        """
+        Copies a generator output to the host, returning a float32 view of the host buffer
+        that stays valid until the next call.
+
+        Args:
+            audio: The one-dimensional generator output on the device.
+        """
+        size = audio.shape[0]
+        if self.host_output is None or size > self.host_output.shape[0]:
+            self.max_output = max(self.max_output, size)
+            self.host_output = self._host(self.max_output)
+        output = self.host_output[:size]
+        output.copy_(audio)
+        return output.numpy()
+
+    def sid(self, sid: int) -> torch.Tensor:
+        """
+        Returns the (1,) speaker id tensor of a speaker.
+
+        Args:
+            sid: Speaker ID.
+        """
+        if sid not in self.sids:
+            self.sids[sid] = torch.tensor([sid], device=self.device).long()
+        return self.sids[sid]
+
+    def p_len(self, p_len: int) -> torch.Tensor:
+        """
+        Returns the (1,) length tensor of a segment, refilled in place.
+
+        Args:
+            p_len: Number of frames of the segment.
+        """
+        if self.p_lens is None:
+            self.p_lens = torch.zeros(1, dtype=torch.long, device=self.device)
+        return self.p_lens.fill_(p_len)
+
+
+class SegmentWriter:
+    """
+    Joins converted segments by writing their unpadded parts into one preallocated array.
+    """
+
+    def __init__(self, buffers: InferenceBuffers, length: int, trim: int):
+        """
+        Initializes the SegmentWriter.
+
+        Args:
+            buffers: The buffers the generator outputs are copied through.
+            length: Upper bound on the samples of the joined output.
+            trim: Padding samples removed from both ends of every segment.
+        """
+        self.buffers = buffers
+        self.trim = trim
+        self.result = np.empty(max(0, length), dtype=np.float32)
+        self.offset = 0
+
+    def write(self, audio: torch.Tensor):
+        """
+        Appends the unpadded part of a generator output.
+
+        Args:
+            audio: The one-dimensional generator output on the device.
+        """
+        segment = self.buffers.to_host(audio)[self.trim : -self.trim]
+        end = self.offset + segment.shape[0]
+        if end > self.result.shape[0]:
+            self.result = np.concatenate(
+                [self.result[: self.offset], np.empty_like(segment)]
+            )
+        self.result[self.offset : end] = segment
+        self.offset = end
+
+    def array(self) -> np.ndarray:
+        """
+        Returns the joined output.
+        """
+        return self.result[: self.offset]
@@ -4,10 +4,10 @@ import time
 import torch
 import librosa
 import logging
+import tempfile
 import traceback
 import numpy as np
 import soundfile as sf
-import noisereduce as nr
 from pedalboard import (
     Pedalboard,
     Chorus,
@@ -25,9 +25,13 @@ from pedalboard import (
 now_dir = os.getcwd()
 sys.path.append(now_dir)
 
-from rvc.infer.pipeline import Pipeline as VC
+from rvc.infer.pipeline import Pipeline as VC, AudioProcessor
+from rvc.infer.profiling import profiler
 from rvc.lib.utils import load_audio_infer, load_embedding
-from rvc.lib.tools.split_audio import process_audio, merge_audio
+from rvc.lib.weights import load_weights
+from rvc.lib.spectral_gate import reduce_noise, reduce_noise_batch
+from rvc.lib.tools.split_audio import process_audio, merge_audio, crossfade_audio
+from rvc.lib.tools.tts import split_sentences, synthesize_sentences
 from rvc.lib.algorithm.synthesizers import Synthesizer
 from rvc.configs.config import Config
 
@@ -36,6 +40,9 @@ logging.getLogger("httpcore").setLevel(logging.WARNING)
 logging.getLogger("faiss").setLevel(logging.WARNING)
 logging.getLogger("faiss.loader").setLevel(logging.WARNING)
 
+# Converted TTS sentences overlap by this long where they are joined
+TTS_CROSSFADE_SECONDS = 0.01
+
 
 class VoiceConverter:
     """
@@ -60,6 +67,7 @@ class VoiceConverter:
         self.use_f0 = None  # Whether the model uses F0
         self.loaded_model = None
 
+    @profiler.timed()
     def load_hubert(self, embedder_model: str, embedder_model_custom: str = None):
         """
         Loads the HuBERT model for speaker embedding extraction.
@@ -78,9 +86,10 @@ class VoiceConverter:
         self.hubert_model.eval()
 
     @staticmethod
+    @profiler.timed()
     def remove_audio_noise(data, sr, reduction_strength=0.7):
         """
-        Removes noise from an audio file using the NoiseReduce library.
+        Removes noise from an audio file with spectral gating.
 
         Args:
             data (numpy.ndarray): The audio data as a NumPy array.
@@ -88,14 +97,29 @@ class VoiceConverter:
             reduction_strength (float): Strength of the noise reduction. Default is 0.7.
         """
         try:
-            reduced_noise = nr.reduce_noise(
-                y=data, sr=sr, prop_decrease=reduction_strength
-            )
+            reduced_noise = reduce_noise(data, sr, reduction_strength)
             return reduced_noise
         except Exception as error:
             print(f"An error occurred removing audio noise: {error}")
             return None
 
+    @staticmethod
+    @profiler.timed()
+    def remove_audio_noise_batch(signals, sr, reduction_strengths):
+        """
+        Removes noise from several audio signals sharing a sample rate, in one batch on GPUs.
+
+        Args:
+            signals (list): The audio data as NumPy arrays.
+            sr (int): The sample rate of the audio data.
+            reduction_strengths (list): Strength of the noise reduction for each signal.
+        """
+        try:
+            return reduce_noise_batch(signals, sr, reduction_strengths)
+        except Exception as error:
+            print(f"An error occurred removing audio noise: {error}")
+            return None
+
     @staticmethod
     def convert_audio_format(input_path, output_path, output_format):
         """
@@ -131,6 +155,7 @@ class VoiceConverter:
             print(f"An error occurred converting the audio format: {error}")
 
     @staticmethod
+    @profiler.timed()
     def post_process_audio(
         audio_input,
         sample_rate,
@@ -194,6 +219,7 @@ class VoiceConverter:
             board.append(delay)
         return board(audio_input, sample_rate)
 
+    @profiler.traced()
     def convert_audio(
         self,
         audio_input_path: str,
@@ -258,11 +284,13 @@ class VoiceConverter:
             start_time = time.time()
             print(f"Converting audio '{audio_input_path}'...")
 
-            audio = load_audio_infer(
-                audio_input_path,
-                16000,
-                **kwargs,
-            )
+            with profiler.stage("load_audio"):
+                audio = load_audio_infer(
+                    audio_input_path,
+                    16000,
+                    **kwargs,
+                )
+            profiler.count("audio_seconds_total", len(audio) / 16000)
             audio_max = np.abs(audio).max() / 0.95
 
             if audio_max > 1:
@@ -335,20 +363,231 @@ class VoiceConverter:
                     **kwargs,
                 )
 
-            sf.write(audio_output_path, audio_opt, self.tgt_sr, format="WAV")
-            output_path_format = audio_output_path.replace(
-                ".wav", f".{export_format.lower()}"
+            with profiler.stage("write_audio"):
+                sf.write(audio_output_path, audio_opt, self.tgt_sr, format="WAV")
+                output_path_format = audio_output_path.replace(
+                    ".wav", f".{export_format.lower()}"
+                )
+                audio_output_path = self.convert_audio_format(
+                    audio_output_path, output_path_format, export_format
+                )
+
+            elapsed_time = time.time() - start_time
+            print(
+                f"Conversion completed at '{audio_output_path}' in {elapsed_time:.2f} seconds."
+            )
+        except Exception as error:
+            print(f"An error occurred during audio conversion: {error}")
+            print(traceback.format_exc())
+
+    @staticmethod
+    def read_f0_file(f0_file):
+        """
+        Reads an F0 file of "time,f0" lines, as the pipeline does.
+
+        Args:
+            f0_file: Path to the F0 file, or an uploaded file with its path in `name`.
+        """
+        with open(getattr(f0_file, "name", f0_file), "r") as f:
+            lines = f.read().strip("\n").split("\n")
+        return np.array(
+            [[float(i) for i in line.split(",")] for line in lines], dtype="float32"
+        )
+
+    @staticmethod
+    def write_f0_slice(f0_contour, start, duration):
+        """
+        Writes the part of an F0 contour from `start` to `start + duration` seconds to a
+        temporary F0 file with its times starting at zero, and returns the open file, or
+        None when the contour ends before `start`.
+
+        Args:
+            f0_contour: The (time, f0) rows of the whole contour.
+            start: Start of the part in seconds.
+            duration: Length of the part in seconds.
+        """
+        end = min(start + duration, float(f0_contour[:, 0].max()))
+        if end <= start:
+            return None
+        times = np.arange(0, end - start, 0.01)
+        f0 = np.interp(times + start, f0_contour[:, 0], f0_contour[:, 1])
+        f0_file = tempfile.NamedTemporaryFile(
+            "w", suffix=".txt", delete=False, encoding="utf-8"
+        )
+        with f0_file:
+            f0_file.write("\n".join(f"{t:.2f},{f:.3f}" for t, f in zip(times, f0)))
+        return f0_file
+
+    @profiler.traced()
+    def convert_tts(
+        self,
+        text: str,
+        tts_backend,
+        audio_output_path: str,
+        model_path: str,
+        index_path: str,
+        tts_output_path: str = None,
+        pitch: int = 0,
+        f0_file: str = None,
+        f0_method: str = "rmvpe",
+        index_rate: float = 0.75,
+        volume_envelope: float = 1,
+        protect: float = 0.5,
+        hop_length: int = 128,
+        split_audio: bool = False,
+        f0_autotune: bool = False,
+        f0_autotune_strength: float = 1,
+        filter_radius: int = 3,
+        embedder_model: str = "contentvec",
+        embedder_model_custom: str = None,
+        clean_audio: bool = False,
+        clean_strength: float = 0.5,
+        export_format: str = "WAV",
+        sid: int = 0,
+        on_chunk=None,
+    ):
+        """
+        Synthesizes a text sentence by sentence and converts each sentence as soon as it is
+        synthesized, while the next one is being synthesized. The converted sentences are
+        crossfaded and the joined audio is normalized once.
+
+        Args:
+            text (str): Text to synthesize.
+            tts_backend (TTSBackend): In-process text-to-speech backend.
+            audio_output_path (str): Path to the output audio file.
+            model_path (str): Path to the voice conversion model.
+            index_path (str): Path to the index file.
+            tts_output_path (str, optional): Path the stitched synthesized speech is written to.
+            f0_file (str, optional): F0 contour of the stitched synthesized speech, every
+                sentence uses the part of it from the sentence's start on.
+            split_audio (bool, optional): Split each sentence at its silences for conversion.
+            on_chunk (callable, optional): Called with each converted sentence, before the
+                crossfade and normalization, and the target sample rate.
+            See convert_audio for the conversion arguments.
+        """
+        if not model_path:
+            print("No model path provided. Aborting conversion.")
+            return
+
+        self.get_vc(model_path, sid)
+
+        try:
+            start_time = time.time()
+            if not self.hubert_model or embedder_model != self.last_embedder_model:
+                self.load_hubert(embedder_model, embedder_model_custom)
+                self.last_embedder_model = embedder_model
+
+            file_index = (
+                index_path.strip()
+                .strip('"')
+                .strip("\n")
+                .strip('"')
+                .strip()
+                .replace("trained", "added")
             )
-            audio_output_path = self.convert_audio_format(
-                audio_output_path, output_path_format, export_format
+
+            f0_contour = self.read_f0_file(f0_file) if f0_file else None
+            sentences = split_sentences(text)
+            print(f"Text split into {len(sentences)} sentences for synthesis.")
+            tts_chunks, tts_sr, converted_chunks = [], None, []
+            sentence_start = 0.0
+            for sentence, tts_audio, sr in synthesize_sentences(tts_backend, sentences):
+                tts_chunks.append(tts_audio)
+                tts_sr = sr
+                audio = librosa.resample(
+                    np.asarray(tts_audio, dtype=np.float32), orig_sr=sr, target_sr=16000
+                )
+                profiler.count("audio_seconds_total", len(audio) / 16000)
+                audio_max = np.abs(audio).max() / 0.95
+                if audio_max > 1:
+                    audio /= audio_max
+
+                sentence_f0_file = None
+                if f0_contour is not None:
+                    sentence_f0_file = self.write_f0_slice(
+                        f0_contour, sentence_start, len(tts_audio) / sr
+                    )
+                sentence_start += len(tts_audio) / sr
+                if split_audio:
+                    chunks, intervals = process_audio(audio, 16000)
+                else:
+                    chunks = [audio]
+
+                try:
+                    sentence_chunks = [
+                        self.vc.pipeline(
+                            model=self.hubert_model,
+                            net_g=self.net_g,
+                            sid=sid,
+                            audio=chunk,
+                            pitch=pitch,
+                            f0_method=f0_method,
+                            file_index=file_index,
+                            index_rate=index_rate,
+                            pitch_guidance=self.use_f0,
+                            filter_radius=filter_radius,
+                            volume_envelope=volume_envelope,
+                            version=self.version,
+                            protect=protect,
+                            hop_length=hop_length,
+                            f0_autotune=f0_autotune,
+                            f0_autotune_strength=f0_autotune_strength,
+                            f0_file=sentence_f0_file,
+                            normalize=False,
+                        )
+                        for chunk in chunks
+                    ]
+                finally:
+                    if sentence_f0_file is not None:
+                        os.remove(sentence_f0_file.name)
+                if split_audio:
+                    audio_opt = merge_audio(
+                        sentence_chunks, intervals, 16000, self.tgt_sr
+                    )
+                else:
+                    audio_opt = sentence_chunks[0]
+                converted_chunks.append(audio_opt)
+                if len(converted_chunks) == 1:
+                    print(
+                        f"First sentence converted in {time.time() - start_time:.2f} seconds."
+                    )
+                if on_chunk is not None:
+                    on_chunk(audio_opt, self.tgt_sr)
+
+            if not converted_chunks:
+                print("No text to synthesize.")
+                return
+
+            if tts_output_path:
+                sf.write(tts_output_path, np.concatenate(tts_chunks), tts_sr)
+
+            audio_opt = crossfade_audio(
+                converted_chunks, int(TTS_CROSSFADE_SECONDS * self.tgt_sr)
             )
+            audio_opt = AudioProcessor.normalize_peak(audio_opt)
+            if clean_audio:
+                cleaned_audio = self.remove_audio_noise(
+                    audio_opt, self.tgt_sr, clean_strength
+                )
+                if cleaned_audio is not None:
+                    audio_opt = cleaned_audio
+
+            with profiler.stage("write_audio"):
+                sf.write(audio_output_path, audio_opt, self.tgt_sr, format="WAV")
+                output_path_format = audio_output_path.replace(
+                    ".wav", f".{export_format.lower()}"
+                )
+                audio_output_path = self.convert_audio_format(
+                    audio_output_path, output_path_format, export_format
+                )
 
             elapsed_time = time.time() - start_time
             print(
                 f"Conversion completed at '{audio_output_path}' in {elapsed_time:.2f} seconds."
             )
+            return audio_output_path
         except Exception as error:
-            print(f"An error occurred during audio conversion: {error}")
+            print(f"An error occurred during text-to-speech conversion: {error}")
             print(traceback.format_exc())
 
     def convert_audio_batch(
@@ -452,6 +691,7 @@ class VoiceConverter:
             torch.cuda.empty_cache()
         self.cpt = None
 
+    @profiler.timed()
     def load_model(self, weight_root):
         """
         Loads the model weights from the specified path.
@@ -459,11 +699,7 @@ class VoiceConverter:
         Args:
             weight_root (str): Path to the model weights.
         """
-        self.cpt = (
-            torch.load(weight_root, map_location="cpu")
-            if os.path.isfile(weight_root)
-            else None
-        )
+        self.cpt = load_weights(weight_root) if os.path.isfile(weight_root) else None
 
     def setup_network(self):
         """
@@ -485,7 +721,9 @@ class VoiceConverter:
                 vocoder=self.vocoder,
             )
             del self.net_g.enc_q
-            self.net_g.load_state_dict(self.cpt["weight"], strict=False)
+            # assign the loaded tensors instead of copying them, so weights that already
+            # have the target dtype and device stay mapped from the safetensors file
+            self.net_g.load_state_dict(self.cpt["weight"], strict=False, assign=True)
             self.net_g.eval().to(self.config.device)
             self.net_g = (
                 self.net_g.half() if self.config.is_half else self.net_g.float()
@@ -2,20 +2,26 @@ import os
 import gc
 import re
 import sys
+import queue
 import torch
+import threading
 import torch.nn.functional as F
 import torchcrepe
-import faiss
 import librosa
 import numpy as np
 from scipy import signal
 from torch import Tensor
+from concurrent.futures import ThreadPoolExecutor
 
 now_dir = os.getcwd()
 sys.path.append(now_dir)
 
 from rvc.lib.predictors.RMVPE import RMVPE0Predictor
 from rvc.lib.predictors.FCPE import FCPEF0Predictor
+from rvc.lib.predictors.parallel import parallel_f0, load_rmvpe, load_fcpe
+from rvc.infer.retrieval import load_retriever
+from rvc.infer.buffers import InferenceBuffers, SegmentWriter
+from rvc.infer.profiling import profiler
 
 import logging
 
@@ -29,7 +35,44 @@ bh, ah = signal.butter(
     N=FILTER_ORDER, Wn=CUTOFF_FREQUENCY, btype="high", fs=SAMPLE_RATE
 )
 
-input_audio_path2wav = {}
+CREPE_LOCK = threading.Lock()
+
+
+def median_f0(f0: np.ndarray, confidence: np.ndarray) -> np.ndarray:
+    """
+    Combines F0 estimates of shape (methods, frames) by majority voicing and the median of the voiced values.
+
+    Args:
+        f0: F0 estimates, 0 where a method finds the frame unvoiced.
+        confidence: Per-frame confidence of each estimate, unused.
+    """
+    voiced = f0 > 0
+    with np.errstate(all="ignore"):
+        combined = np.nanmedian(np.where(voiced, f0, np.nan), axis=0)
+    combined[voiced.sum(axis=0) * 2 < f0.shape[0]] = 0
+    return np.nan_to_num(combined)
+
+
+def weighted_mean_f0(f0: np.ndarray, confidence: np.ndarray) -> np.ndarray:
+    """
+    Combines F0 estimates of shape (methods, frames) by their confidence-weighted mean in log frequency.
+
+    A frame is voiced when the confidences of the methods voicing it add up to half the number of methods.
+
+    Args:
+        f0: F0 estimates, 0 where a method finds the frame unvoiced.
+        confidence: Per-frame confidence of each estimate in [0, 1].
+    """
+    weights = np.where(f0 > 0, confidence, 0)
+    total = weights.sum(axis=0)
+    with np.errstate(all="ignore"):
+        log_f0 = (weights * np.log(np.maximum(f0, 1e-5))).sum(axis=0) / total
+    combined = np.exp(np.nan_to_num(log_f0))
+    combined[(total * 2 < f0.shape[0]) | (total <= 0)] = 0
+    return combined
+
+
+HYBRID_F0_REDUCERS = {"median": median_f0, "weighted_mean": weighted_mean_f0}
 
 
 class AudioProcessor:
@@ -86,6 +129,19 @@ class AudioProcessor:
         )
         return adjusted_audio
 
+    def normalize_peak(audio: np.ndarray, peak: float = 0.99) -> np.ndarray:
+        """
+        Scales an audio signal down so it peaks at `peak` when it peaks above it.
+
+        Args:
+            audio: The audio signal as a NumPy array.
+            peak: The highest allowed absolute sample value.
+        """
+        audio_max = np.abs(audio).max() / peak
+        if audio_max > 1:
+            audio /= audio_max
+        return audio
+
 
 class Autotune:
     """
@@ -149,6 +205,25 @@ class Pipeline:
         self.f0_mel_min = 1127 * np.log(1 + self.f0_min / 700)
         self.f0_mel_max = 1127 * np.log(1 + self.f0_max / 700)
         self.device = config.device
+        self.exact_retrieval_max_vectors = config.exact_retrieval_max_vectors
+        self.hybrid_f0_reducer = config.hybrid_f0_reducer
+        self.parallel_f0_workers = config.parallel_f0_workers
+        self.parallel_f0_threads = config.parallel_f0_threads
+        self.parallel_f0_min_seconds = config.parallel_f0_min_seconds
+        self.pipelined_inference = config.pipelined_inference
+        self.pipeline_queue_size = config.pipeline_queue_size
+        self.buffers = (
+            InferenceBuffers(
+                self.device,
+                self.t_max + self.t_pad2 + self.window,
+                (self.t_max + self.t_pad2) // self.window * (tgt_sr // 100),
+            )
+            if config.reuse_inference_buffers
+            else None
+        )
+        self.tgt_sr = tgt_sr
+        self.retriever = None
+        self.retriever_key = None
         self.ref_freqs = [
             49.00,  # G1
             51.91,  # G#1 / Ab1
@@ -221,6 +296,7 @@ class Pipeline:
         p_len,
         hop_length,
         model="full",
+        return_confidence=False,
     ):
         """
         Estimates the fundamental frequency (F0) of a given audio signal using the Crepe model.
@@ -232,6 +308,7 @@ class Pipeline:
             p_len: Desired length of the F0 output.
             hop_length: Hop length for the Crepe model.
             model: Crepe model size to use ("full" or "tiny").
+            return_confidence: Whether to also return the periodicity of each frame.
         """
         x = x.astype(np.float32)
         x /= np.quantile(np.abs(x), 0.999)
@@ -240,28 +317,86 @@ class Pipeline:
         if audio.ndim == 2 and audio.shape[0] > 1:
             audio = torch.mean(audio, dim=0, keepdim=True).detach()
         audio = audio.detach()
-        pitch: Tensor = torchcrepe.predict(
-            audio,
-            self.sample_rate,
-            hop_length,
-            f0_min,
-            f0_max,
-            model,
-            batch_size=hop_length * 2,
-            device=self.device,
-            pad=True,
-        )
+        # torchcrepe keeps a single global model, so calls from concurrent threads take turns
+        with CREPE_LOCK:
+            pitch, periodicity = torchcrepe.predict(
+                audio,
+                self.sample_rate,
+                hop_length,
+                f0_min,
+                f0_max,
+                model,
+                batch_size=hop_length * 2,
+                device=self.device,
+                pad=True,
+                return_periodicity=True,
+            )
         p_len = p_len or x.shape[0] // hop_length
         source = np.array(pitch.squeeze(0).cpu().float().numpy())
         source[source < 0.001] = np.nan
-        target = np.interp(
-            np.arange(0, len(source) * p_len, len(source)) / p_len,
-            np.arange(0, len(source)),
-            source,
-        )
+        frames = np.arange(0, len(source) * p_len, len(source)) / p_len
+        target = np.interp(frames, np.arange(0, len(source)), source)
         f0 = np.nan_to_num(target)
+        if return_confidence:
+            periodicity = periodicity.squeeze(0).cpu().float().numpy()
+            return f0, np.interp(frames, np.arange(0, len(source)), periodicity)
         return f0
 
+    def get_f0_component(self, method, x, f0_min, f0_max, p_len, hop_length):
+        """
+        Estimates F0 with one method of a hybrid, aligned to `p_len` frames, along with a
+        per-frame confidence in [0, 1].
+
+        Crepe reports its periodicity and RMVPE its peak salience, FCPE only its voicing.
+
+        Args:
+            method: One of "crepe", "crepe-tiny", "rmvpe" or "fcpe".
+            x: The input audio signal as a NumPy array.
+            f0_min: Minimum F0 value to consider.
+            f0_max: Maximum F0 value to consider.
+            p_len: Desired length of the F0 output.
+            hop_length: Hop length for F0 estimation methods.
+        """
+        if method in ("crepe", "crepe-tiny"):
+            f0, confidence = self.get_f0_crepe(
+                x,
+                f0_min,
+                f0_max,
+                p_len,
+                int(hop_length),
+                "tiny" if method == "crepe-tiny" else "full",
+                return_confidence=True,
+            )
+        elif method == "rmvpe":
+            f0, confidence = self.model_rmvpe.infer_from_audio_with_confidence(
+                x, thred=0.03
+            )
+        elif method == "fcpe":
+            model_fcpe = FCPEF0Predictor(
+                os.path.join("rvc", "models", "predictors", "fcpe.pt"),
+                f0_min=int(f0_min),
+                f0_max=int(f0_max),
+                dtype=torch.float32,
+                device=self.device,
+                sample_rate=self.sample_rate,
+                threshold=0.03,
+            )
+            f0 = model_fcpe.compute_f0(x, p_len=p_len)
+            confidence = (f0 > 0).astype(np.float32)
+            del model_fcpe
+        else:
+            raise ValueError(f"Unknown hybrid F0 method: {method}")
+
+        # every method runs at the same 10 ms frame rate, so alignment only crops or pads
+        f0 = np.asarray(f0, dtype=np.float32)[:p_len]
+        confidence = np.clip(np.asarray(confidence, dtype=np.float32)[:p_len], 0, 1)
+        if len(f0) < p_len:
+            f0 = np.pad(f0, (0, p_len - len(f0)))
+        if len(confidence) < p_len:
+            confidence = np.pad(confidence, (0, p_len - len(confidence)))
+        confidence[f0 <= 0] = 0
+        return f0, confidence
+
     def get_f0_hybrid(
         self,
         methods_str,
@@ -270,10 +405,14 @@ class Pipeline:
         f0_max,
         p_len,
         hop_length,
+        reducer=None,
     ):
         """
         Estimates the fundamental frequency (F0) using a hybrid approach combining multiple methods.
 
+        The methods run concurrently, each on its own thread and, on CUDA, its own stream, so the
+        wall time approaches that of the slowest method.
+
         Args:
             methods_str: A string specifying the methods to combine (e.g., "hybrid[crepe+rmvpe]").
             x: The input audio signal as a NumPy array.
@@ -281,46 +420,75 @@ class Pipeline:
             f0_max: Maximum F0 value to consider.
             p_len: Desired length of the F0 output.
             hop_length: Hop length for F0 estimation methods.
+            reducer: "median" or "weighted_mean", the configured reducer by default.
         """
-        methods_str = re.search("hybrid\[(.+)\]", methods_str)
-        if methods_str:
-            methods = [method.strip() for method in methods_str.group(1).split("+")]
-        f0_computation_stack = []
+        reducer = reducer or self.hybrid_f0_reducer
+        if reducer not in HYBRID_F0_REDUCERS:
+            raise ValueError(
+                f"Unknown hybrid F0 reducer '{reducer}', expected one of {list(HYBRID_F0_REDUCERS)}"
+            )
+        methods_str = re.search(r"hybrid\[(.+)\]", methods_str)
+        if not methods_str:
+            raise ValueError(f"Invalid hybrid F0 method: {methods_str}")
+        methods = [method.strip() for method in methods_str.group(1).split("+")]
         print(f"Calculating f0 pitch estimations for methods: {', '.join(methods)}")
         x = x.astype(np.float32)
         x /= np.quantile(np.abs(x), 0.999)
-        for method in methods:
-            f0 = None
-            if method == "crepe":
-                f0 = self.get_f0_crepe_computation(
-                    x, f0_min, f0_max, p_len, int(hop_length)
+        p_len = p_len or x.shape[0] // self.window
+
+        def estimate(method):
+            if not str(self.device).startswith("cuda"):
+                return self.get_f0_component(
+                    method, x, f0_min, f0_max, p_len, hop_length
                 )
-            elif method == "rmvpe":
-                f0 = self.model_rmvpe.infer_from_audio(x, thred=0.03)
-                f0 = f0[1:]
-            elif method == "fcpe":
-                self.model_fcpe = FCPEF0Predictor(
-                    os.path.join("rvc", "models", "predictors", "fcpe.pt"),
-                    f0_min=int(f0_min),
-                    f0_max=int(f0_max),
-                    dtype=torch.float32,
-                    device=self.device,
-                    sample_rate=self.sample_rate,
-                    threshold=0.03,
+            stream = torch.cuda.Stream(device=self.device)
+            with torch.cuda.stream(stream):
+                result = self.get_f0_component(
+                    method, x, f0_min, f0_max, p_len, hop_length
                 )
-                f0 = self.model_fcpe.compute_f0(x, p_len=p_len)
-                del self.model_fcpe
-                gc.collect()
-            f0_computation_stack.append(f0)
-
-        f0_computation_stack = [fc for fc in f0_computation_stack if fc is not None]
-        f0_median_hybrid = None
-        if len(f0_computation_stack) == 1:
-            f0_median_hybrid = f0_computation_stack[0]
+            stream.synchronize()
+            return result
+
+        if len(methods) == 1:
+            estimates = [estimate(methods[0])]
         else:
-            f0_median_hybrid = np.nanmedian(f0_computation_stack, axis=0)
-        return f0_median_hybrid
+            with ThreadPoolExecutor(max_workers=len(methods)) as executor:
+                estimates = list(executor.map(estimate, methods))
+        gc.collect()
+
+        f0 = np.stack([f0 for f0, _ in estimates])
+        confidence = np.stack([confidence for _, confidence in estimates])
+        return HYBRID_F0_REDUCERS[reducer](f0, confidence)
 
+    def get_f0_windowed(self, estimate, estimator, x, n_frames):
+        """
+        Runs an F0 estimator on the whole signal, or on overlapping windows in worker processes
+        for long signals on CPU when parallel F0 extraction is enabled. Not used for crepe, whose
+        calls are serialized by CREPE_LOCK.
+
+        Args:
+            estimate: Called with audio and its number of frames, returns its F0 contour.
+            estimator: The picklable (loader, args) pair building the same estimate in a worker.
+            x: The input audio signal as a NumPy array.
+            n_frames: Number of frames of the contour.
+        """
+        if (
+            self.parallel_f0_workers == 1
+            or str(self.device) != "cpu"
+            or x.shape[0] < self.parallel_f0_min_seconds * self.sample_rate
+        ):
+            return estimate(x, n_frames)
+        return parallel_f0(
+            estimator,
+            x,
+            n_frames,
+            self.window,
+            workers=self.parallel_f0_workers or None,
+            threads=self.parallel_f0_threads,
+            sample_rate=self.sample_rate,
+        )
+
+    @profiler.timed()
     def get_f0(
         self,
         input_audio_path,
@@ -348,7 +516,7 @@ class Pipeline:
             f0_autotune: Whether to apply autotune to the F0 contour.
             inp_f0: Optional input F0 contour to use instead of estimating.
         """
-        global input_audio_path2wav
+        # crepe runs under CREPE_LOCK, so windows of it could only run one after another
         if f0_method == "crepe":
             f0 = self.get_f0_crepe(x, self.f0_min, self.f0_max, p_len, int(hop_length))
         elif f0_method == "crepe-tiny":
@@ -356,7 +524,17 @@ class Pipeline:
                 x, self.f0_min, self.f0_max, p_len, int(hop_length), "tiny"
             )
         elif f0_method == "rmvpe":
-            f0 = self.model_rmvpe.infer_from_audio(x, thred=0.03)
+            f0 = self.get_f0_windowed(
+                lambda audio, frames: self.model_rmvpe.infer_from_audio(
+                    audio, thred=0.03
+                ),
+                (
+                    load_rmvpe,
+                    (os.path.join("rvc", "models", "predictors", "rmvpe.pt"),),
+                ),
+                x,
+                x.shape[0] // self.window + 1,
+            )
         elif f0_method == "fcpe":
             self.model_fcpe = FCPEF0Predictor(
                 os.path.join("rvc", "models", "predictors", "fcpe.pt"),
@@ -367,11 +545,23 @@ class Pipeline:
                 sample_rate=self.sample_rate,
                 threshold=0.03,
             )
-            f0 = self.model_fcpe.compute_f0(x, p_len=p_len)
+            f0 = self.get_f0_windowed(
+                lambda audio, frames: self.model_fcpe.compute_f0(audio, p_len=frames),
+                (
+                    load_fcpe,
+                    (
+                        os.path.join("rvc", "models", "predictors", "fcpe.pt"),
+                        int(self.f0_min),
+                        int(self.f0_max),
+                        self.sample_rate,
+                    ),
+                ),
+                x,
+                p_len,
+            )
             del self.model_fcpe
             gc.collect()
         elif "hybrid" in f0_method:
-            input_audio_path2wav[input_audio_path] = x.astype(np.double)
             f0 = self.get_f0_hybrid(
                 f0_method,
                 x,
@@ -408,6 +598,7 @@ class Pipeline:
 
         return f0_coarse, f0bak
 
+    @profiler.timed()
     def voice_conversion(
         self,
         model,
@@ -416,15 +607,17 @@ class Pipeline:
         audio0,
         pitch,
         pitchf,
-        index,
-        big_npy,
+        retriever,
         index_rate,
         version,
         protect,
+        output=None,
     ):
         """
         Performs voice conversion on a given audio segment.
 
+        Returns the converted segment, or None when it is written to `output`.
+
         Args:
             model: The feature extractor model.
             net_g: The generative model for synthesizing speech.
@@ -432,15 +625,47 @@ class Pipeline:
             audio0: The input audio segment.
             pitch: Quantized F0 contour for pitch guidance.
             pitchf: Original F0 contour for pitch guidance.
-            index: FAISS index for speaker embedding retrieval.
-            big_npy: Speaker embeddings stored in a NumPy array.
+            retriever: IndexRetriever for speaker embedding retrieval.
             index_rate: Blending rate for speaker embedding retrieval.
             version: Model version ("v1" or "v2").
             protect: Protection level for preserving the original pitch.
+            output: Optional SegmentWriter the converted segment is appended to.
         """
         with torch.no_grad():
             pitch_guidance = pitch != None and pitchf != None
-            # prepare source audio
+            feats = self._extract_features(model, audio0, version)
+            # make a copy for pitch guidance and protection
+            feats0 = feats.clone() if pitch_guidance else None
+            if (
+                retriever
+            ):  # set by parent function, only true if index is available, loaded, and index rate > 0
+                feats = self._retrieve_speaker_embeddings(
+                    feats, retriever, index_rate
+                )
+            audio1 = self._synthesize(
+                net_g, sid, audio0, feats, feats0, pitch, pitchf, protect, output
+            )
+            # clean up
+            del feats, feats0
+            if torch.cuda.is_available() and self.buffers is None:
+                torch.cuda.empty_cache()
+        return audio1
+
+    def _extract_features(self, model, audio0, version):
+        """
+        Extracts the embedder features of an audio segment.
+
+        Args:
+            model: The feature extractor model.
+            audio0: The input audio segment.
+            version: Model version ("v1" or "v2").
+        """
+        # prepare source audio
+        if self.buffers is not None:
+            feats = self.buffers.to_device(
+                audio0, torch.float16 if self.is_half else torch.float32
+            )
+        else:
             feats = (
                 torch.from_numpy(audio0).half()
                 if self.is_half
@@ -449,72 +674,177 @@ class Pipeline:
             feats = feats.mean(-1) if feats.dim() == 2 else feats
             assert feats.dim() == 1, feats.dim()
             feats = feats.view(1, -1).to(self.device)
-            # extract features
-            feats = model(feats)["last_hidden_state"]
-            feats = (
-                model.final_proj(feats[0]).unsqueeze(0) if version == "v1" else feats
+        # extract features
+        feats = model(feats)["last_hidden_state"]
+        return model.final_proj(feats[0]).unsqueeze(0) if version == "v1" else feats
+
+    def _synthesize(
+        self, net_g, sid, audio0, feats, feats0, pitch, pitchf, protect, output=None
+    ):
+        """
+        Upsamples the features of a segment, applies pitch protection and runs the generator.
+
+        Returns the converted segment, or None when it is written to `output`.
+
+        Args:
+            net_g: The generative model for synthesizing speech.
+            sid: Speaker ID for the target voice.
+            audio0: The input audio segment.
+            feats: Features after speaker embedding retrieval.
+            feats0: Features before retrieval, None without pitch guidance.
+            pitch: Quantized F0 contour for pitch guidance.
+            pitchf: Original F0 contour for pitch guidance.
+            protect: Protection level for preserving the original pitch.
+            output: Optional SegmentWriter the converted segment is appended to.
+        """
+        pitch_guidance = pitch != None and pitchf != None
+        # feature upsampling
+        feats = F.interpolate(feats.permute(0, 2, 1), scale_factor=2).permute(0, 2, 1)
+        # adjust the length if the audio is short
+        p_len = min(audio0.shape[0] // self.window, feats.shape[1])
+        if pitch_guidance:
+            feats0 = F.interpolate(feats0.permute(0, 2, 1), scale_factor=2).permute(
+                0, 2, 1
             )
-            # make a copy for pitch guidance and protection
-            feats0 = feats.clone() if pitch_guidance else None
-            if (
-                index
-            ):  # set by parent function, only true if index is available, loaded, and index rate > 0
-                feats = self._retrieve_speaker_embeddings(
-                    feats, index, big_npy, index_rate
+            pitch, pitchf = pitch[:, :p_len], pitchf[:, :p_len]
+            # Pitch protection blending
+            if protect < 0.5:
+                pitchff = pitchf.clone()
+                pitchff[pitchf > 0] = 1
+                pitchff[pitchf < 1] = protect
+                feats = feats * pitchff.unsqueeze(-1) + feats0 * (
+                    1 - pitchff.unsqueeze(-1)
                 )
-            # feature upsampling
-            feats = F.interpolate(feats.permute(0, 2, 1), scale_factor=2).permute(
-                0, 2, 1
+                feats = feats.to(feats0.dtype)
+        else:
+            pitch, pitchf = None, None
+        p_len = (
+            self.buffers.p_len(p_len)
+            if self.buffers is not None
+            else torch.tensor([p_len], device=self.device).long()
+        )
+        audio1 = net_g.infer(feats, p_len, pitch, pitchf, sid)[0][0, 0]
+        if output is not None:
+            output.write(audio1.data)
+            return None
+        return audio1.data.cpu().float().numpy()
+
+    @profiler.timed("retrieve_speaker_embeddings")
+    def _retrieve_speaker_embeddings(self, feats, retriever, index_rate):
+        return retriever.retrieve(feats, index_rate)
+
+    def _get_retriever(self, file_index):
+        """
+        Returns the IndexRetriever for the given index file, reusing the cached one while the file is unchanged.
+
+        Args:
+            file_index: Path to the FAISS index file.
+        """
+        key = (file_index, os.path.getmtime(file_index))
+        if self.retriever_key != key:
+            self.retriever = self.retriever_key = None
+            self.retriever = load_retriever(
+                file_index,
+                self.device,
+                self.is_half,
+                self.exact_retrieval_max_vectors,
             )
-            # adjust the length if the audio is short
-            p_len = min(audio0.shape[0] // self.window, feats.shape[1])
-            if pitch_guidance:
-                feats0 = F.interpolate(feats0.permute(0, 2, 1), scale_factor=2).permute(
+            self.retriever_key = key
+        return self.retriever
+
+    @profiler.timed()
+    def voice_conversion_batch(self, model, net_g, segments, version):
+        """
+        Performs voice conversion on several audio segments of the same model in one batched call.
+
+        Segments are zero-padded to the longest one, the embedder and the generator run once over
+        the whole batch and every output is cropped back to the length of its segment. The
+        embedder masks the padding, so the features of a segment don't depend on its batch.
+
+        Args:
+            model: The feature extractor model.
+            net_g: The generative model for synthesizing speech.
+            segments: List of (sid, audio0, pitch, pitchf, retriever, index_rate, protect) tuples.
+            version: Model version ("v1" or "v2").
+        """
+        if len(segments) == 1:
+            sid, audio0, pitch, pitchf, retriever, index_rate, protect = segments[0]
+            return [
+                self.voice_conversion(
+                    model,
+                    net_g,
+                    sid,
+                    audio0,
+                    pitch,
+                    pitchf,
+                    retriever,
+                    index_rate,
+                    version,
+                    protect,
+                )
+            ]
+        with torch.no_grad():
+            # extract features, masking the padding so every segment gets the features
+            # voice_conversion would give it on its own
+            feats = model.forward_batch(
+                [torch.from_numpy(segment[1]).float() for segment in segments],
+                final_proj=version == "v1",
+            )
+
+            batch_feats, batch_pitch, batch_pitchf, p_lens = [], [], [], []
+            for i, (sid, audio0, pitch, pitchf, retriever, index_rate, protect) in (
+                enumerate(segments)
+            ):
+                pitch_guidance = pitch != None and pitchf != None
+                item = feats[i].unsqueeze(0)
+                item0 = item.clone() if pitch_guidance else None
+                if retriever:
+                    item = self._retrieve_speaker_embeddings(item, retriever, index_rate)
+                item = F.interpolate(item.permute(0, 2, 1), scale_factor=2).permute(
                     0, 2, 1
                 )
-                pitch, pitchf = pitch[:, :p_len], pitchf[:, :p_len]
-                # Pitch protection blending
-                if protect < 0.5:
-                    pitchff = pitchf.clone()
-                    pitchff[pitchf > 0] = 1
-                    pitchff[pitchf < 1] = protect
-                    feats = feats * pitchff.unsqueeze(-1) + feats0 * (
-                        1 - pitchff.unsqueeze(-1)
+                p_len = min(audio0.shape[0] // self.window, item.shape[1])
+                if pitch_guidance:
+                    item0 = F.interpolate(item0.permute(0, 2, 1), scale_factor=2).permute(
+                        0, 2, 1
                     )
-                    feats = feats.to(feats0.dtype)
+                    pitch, pitchf = pitch[:, :p_len], pitchf[:, :p_len]
+                    item, item0 = item[:, :p_len], item0[:, :p_len]
+                    if protect < 0.5:
+                        pitchff = pitchf.clone()
+                        pitchff[pitchf > 0] = 1
+                        pitchff[pitchf < 1] = protect
+                        item = item * pitchff.unsqueeze(-1) + item0 * (
+                            1 - pitchff.unsqueeze(-1)
+                        )
+                        item = item.to(item0.dtype)
+                    batch_pitch.append(pitch[0])
+                    batch_pitchf.append(pitchf[0])
+                batch_feats.append(item[0])
+                p_lens.append(p_len)
+
+            feats = torch.nn.utils.rnn.pad_sequence(batch_feats, batch_first=True)
+            if batch_pitch:
+                pitch = torch.nn.utils.rnn.pad_sequence(batch_pitch, batch_first=True)
+                pitchf = torch.nn.utils.rnn.pad_sequence(batch_pitchf, batch_first=True)
             else:
                 pitch, pitchf = None, None
-            p_len = torch.tensor([p_len], device=self.device).long()
-            audio1 = (
-                (net_g.infer(feats, p_len, pitch, pitchf, sid)[0][0, 0])
-                .data.cpu()
-                .float()
-                .numpy()
-            )
+            sid = torch.cat([segment[0] for segment in segments])
+            p_lens = torch.tensor(p_lens, device=self.device).long()
+            audio1 = net_g.infer(feats, p_lens, pitch, pitchf, sid)[0][:, 0]
+            hop = audio1.shape[1] // feats.shape[1]
+            audio1 = audio1.data.cpu().float().numpy()
+            outputs = [
+                audio1[i, : batch_feats[i].shape[0] * hop] for i in range(len(segments))
+            ]
             # clean up
-            del feats, feats0, p_len
-            if torch.cuda.is_available():
+            del feats, pitch, pitchf, p_lens, audio1
+            if torch.cuda.is_available() and self.buffers is None:
                 torch.cuda.empty_cache()
-        return audio1
-
-    def _retrieve_speaker_embeddings(self, feats, index, big_npy, index_rate):
-        npy = feats[0].cpu().numpy()
-        npy = npy.astype("float32") if self.is_half else npy
-        score, ix = index.search(npy, k=8)
-        weight = np.square(1 / score)
-        weight /= weight.sum(axis=1, keepdims=True)
-        npy = np.sum(big_npy[ix] * np.expand_dims(weight, axis=2), axis=1)
-        npy = npy.astype("float16") if self.is_half else npy
-        feats = (
-            torch.from_numpy(npy).unsqueeze(0).to(self.device) * index_rate
-            + (1 - index_rate) * feats
-        )
-        return feats
+        return outputs
 
-    def pipeline(
+    def prepare_segments(
         self,
-        model,
-        net_g,
         sid,
         audio,
         pitch,
@@ -523,8 +853,6 @@ class Pipeline:
         index_rate,
         pitch_guidance,
         filter_radius,
-        volume_envelope,
-        version,
         protect,
         hop_length,
         f0_autotune,
@@ -532,38 +860,94 @@ class Pipeline:
         f0_file,
     ):
         """
-        The main pipeline function for performing voice conversion.
+        Filters the input audio, estimates its F0 and splits it into the segments passed to voice_conversion.
+
+        Returns the filtered audio and a list of (sid, audio0, pitch, pitchf, retriever, index_rate,
+        protect) tuples.
 
         Args:
-            model: The feature extractor model.
-            net_g: The generative model for synthesizing speech.
             sid: Speaker ID for the target voice.
             audio: The input audio signal.
-            input_audio_path: Path to the input audio file.
             pitch: Key to adjust the pitch of the F0 contour.
             f0_method: Method to use for F0 estimation.
             file_index: Path to the FAISS index file for speaker embedding retrieval.
             index_rate: Blending rate for speaker embedding retrieval.
             pitch_guidance: Whether to use pitch guidance during voice conversion.
             filter_radius: Radius for median filtering the F0 contour.
-            tgt_sr: Target sampling rate for the output audio.
-            resample_sr: Resampling rate for the output audio.
-            volume_envelope: Blending rate for adjusting the RMS level of the output audio.
-            version: Model version.
             protect: Protection level for preserving the original pitch.
             hop_length: Hop length for F0 estimation methods.
             f0_autotune: Whether to apply autotune to the F0 contour.
             f0_file: Path to a file containing an F0 contour to use.
         """
+        retriever = self._load_retriever(file_index, index_rate, sid)
+        audio, audio_pad, bounds = self._split_audio(audio)
+        sid = self._sid_tensor(sid)
+        if pitch_guidance:
+            pitch, pitchf = self._get_pitch(
+                audio_pad,
+                pitch,
+                f0_method,
+                filter_radius,
+                hop_length,
+                f0_autotune,
+                f0_autotune_strength,
+                f0_file,
+            )
+        segments = []
+        for start, end, f0_start, f0_end in bounds:
+            segments.append(
+                (
+                    sid,
+                    audio_pad[start:end],
+                    pitch[:, f0_start:f0_end] if pitch_guidance else None,
+                    pitchf[:, f0_start:f0_end] if pitch_guidance else None,
+                    retriever,
+                    index_rate,
+                    protect,
+                )
+            )
+        return audio, segments
+
+    def _sid_tensor(self, sid):
+        if self.buffers is not None:
+            return self.buffers.sid(sid)
+        return torch.tensor(sid, device=self.device).unsqueeze(0).long()
+
+    def _segment_writer(self, lengths):
+        """
+        Returns a SegmentWriter sized for segments of the given input lengths, or None when
+        buffers are not reused.
+
+        Args:
+            lengths: Samples of each input segment.
+        """
+        if self.buffers is None:
+            return None
+        hop = self.tgt_sr // 100
+        return SegmentWriter(
+            self.buffers,
+            sum(length // self.window * hop - 2 * self.t_pad_tgt for length in lengths),
+            self.t_pad_tgt,
+        )
+
+    def _load_retriever(self, file_index, index_rate, sid):
         if file_index != "" and os.path.exists(file_index) and index_rate > 0:
             try:
-                index = faiss.read_index(file_index)
-                big_npy = index.reconstruct_n(0, index.ntotal)
+                return self._get_retriever(file_index).for_speaker(sid)
             except Exception as error:
                 print(f"An error occurred reading the FAISS index: {error}")
-                index = big_npy = None
-        else:
-            index = big_npy = None
+        return None
+
+    def _split_audio(self, audio):
+        """
+        Filters the input audio, pads it and finds the quietest points to split it at.
+
+        Returns the filtered audio, the padded audio and the (start, end, f0_start, f0_end)
+        bounds of each segment, where None ends a segment at the end of the audio.
+
+        Args:
+            audio: The input audio signal.
+        """
         audio = signal.filtfilt(bh, ah, audio)
         audio_pad = np.pad(audio, (self.window // 2, self.window // 2), mode="reflect")
         opt_ts = []
@@ -580,10 +964,47 @@ class Pipeline:
                         == np.abs(audio_sum[t - self.t_query : t + self.t_query]).min()
                     )[0][0]
                 )
-        s = 0
-        audio_opt = []
-        t = None
         audio_pad = np.pad(audio, (self.t_pad, self.t_pad), mode="reflect")
+        s = 0
+        bounds = []
+        for t in opt_ts:
+            t = t // self.window * self.window
+            bounds.append(
+                (
+                    s,
+                    t + self.t_pad2 + self.window,
+                    s // self.window,
+                    (t + self.t_pad2) // self.window,
+                )
+            )
+            s = t
+        bounds.append((s, None, s // self.window, None))
+        return audio, audio_pad, bounds
+
+    def _get_pitch(
+        self,
+        audio_pad,
+        pitch,
+        f0_method,
+        filter_radius,
+        hop_length,
+        f0_autotune,
+        f0_autotune_strength,
+        f0_file,
+    ):
+        """
+        Estimates the F0 of the padded audio and returns the quantized and the original contour as tensors.
+
+        Args:
+            audio_pad: The padded input audio returned by _split_audio.
+            pitch: Key to adjust the pitch of the F0 contour.
+            f0_method: Method to use for F0 estimation.
+            filter_radius: Radius for median filtering the F0 contour.
+            hop_length: Hop length for F0 estimation methods.
+            f0_autotune: Whether to apply autotune to the F0 contour.
+            f0_autotune_strength: Strength of the autotune.
+            f0_file: Path to a file containing an F0 contour to use.
+        """
         p_len = audio_pad.shape[0] // self.window
         inp_f0 = None
         if hasattr(f0_file, "name"):
@@ -596,94 +1017,183 @@ class Pipeline:
                 inp_f0 = np.array(inp_f0, dtype="float32")
             except Exception as error:
                 print(f"An error occurred reading the F0 file: {error}")
-        sid = torch.tensor(sid, device=self.device).unsqueeze(0).long()
-        if pitch_guidance:
-            pitch, pitchf = self.get_f0(
-                "input_audio_path",  # questionable purpose of making a key for an array
-                audio_pad,
-                p_len,
-                pitch,
-                f0_method,
-                filter_radius,
-                hop_length,
-                f0_autotune,
-                f0_autotune_strength,
-                inp_f0,
-            )
-            pitch = pitch[:p_len]
-            pitchf = pitchf[:p_len]
-            if self.device == "mps":
-                pitchf = pitchf.astype(np.float32)
-            pitch = torch.tensor(pitch, device=self.device).unsqueeze(0).long()
-            pitchf = torch.tensor(pitchf, device=self.device).unsqueeze(0).float()
-        for t in opt_ts:
-            t = t // self.window * self.window
+        pitch, pitchf = self.get_f0(
+            "input_audio_path",  # questionable purpose of making a key for an array
+            audio_pad,
+            p_len,
+            pitch,
+            f0_method,
+            filter_radius,
+            hop_length,
+            f0_autotune,
+            f0_autotune_strength,
+            inp_f0,
+        )
+        pitch = pitch[:p_len]
+        pitchf = pitchf[:p_len]
+        if self.device == "mps":
+            pitchf = pitchf.astype(np.float32)
+        pitch = torch.tensor(pitch, device=self.device).unsqueeze(0).long()
+        pitchf = torch.tensor(pitchf, device=self.device).unsqueeze(0).float()
+        return pitch, pitchf
+
+    def pipelined_conversion(
+        self,
+        model,
+        net_g,
+        sid,
+        audio,
+        pitch,
+        f0_method,
+        file_index,
+        index_rate,
+        pitch_guidance,
+        filter_radius,
+        version,
+        protect,
+        hop_length,
+        f0_autotune,
+        f0_autotune_strength,
+        f0_file,
+    ):
+        """
+        Converts the segments of an audio with its stages overlapped, returning the filtered audio
+        and the converted segments, joined in a SegmentWriter when buffers are reused.
+
+        F0 estimation runs on one worker thread while the embedder extracts the features of the
+        following segments on another, and speaker embedding retrieval on a third, connected by
+        bounded queues. The generator runs on the calling thread in segment order, and the
+        embedder draws from a generator of its own, so the synthesis draws the same random
+        numbers as in a sequential run and the output is identical for a fixed seed.
+
+        See pipeline for the arguments.
+        """
+        retriever = self._load_retriever(file_index, index_rate, sid)
+        audio, audio_pad, bounds = self._split_audio(audio)
+        sid = self._sid_tensor(sid)
+        num_threads = torch.get_num_threads()
+        features = queue.Queue(maxsize=self.pipeline_queue_size)
+        retrieved = queue.Queue(maxsize=self.pipeline_queue_size)
+        stop = threading.Event()
+
+        def put(stage_queue, item):
+            while not stop.is_set():
+                try:
+                    stage_queue.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def get(stage_queue):
+            while not stop.is_set():
+                try:
+                    return stage_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            raise RuntimeError("The conversion pipeline was stopped.")
+
+        def worker(function):
+            # the same intra-op thread count as the caller keeps results identical
+            def run(*args):
+                torch.set_num_threads(num_threads)
+                with torch.no_grad():
+                    return function(*args)
+
+            return run
+
+        def extract():
+            try:
+                for start, end, _, _ in bounds:
+                    if stop.is_set():
+                        return
+                    audio0 = audio_pad[start:end]
+                    feats = self._extract_features(model, audio0, version)
+                    feats0 = feats.clone() if pitch_guidance else None
+                    put(features, (audio0, feats, feats0))
+                put(features, None)
+            except Exception as error:
+                put(features, error)
+
+        def retrieve():
+            try:
+                while True:
+                    item = get(features)
+                    if item is None or isinstance(item, Exception):
+                        put(retrieved, item)
+                        return
+                    audio0, feats, feats0 = item
+                    if retriever:
+                        feats = self._retrieve_speaker_embeddings(
+                            feats, retriever, index_rate
+                        )
+                    put(retrieved, (audio0, feats, feats0))
+            except Exception as error:
+                put(retrieved, error)
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
             if pitch_guidance:
-                audio_opt.append(
-                    self.voice_conversion(
-                        model,
-                        net_g,
-                        sid,
-                        audio_pad[s : t + self.t_pad2 + self.window],
-                        pitch[:, s // self.window : (t + self.t_pad2) // self.window],
-                        pitchf[:, s // self.window : (t + self.t_pad2) // self.window],
-                        index,
-                        big_npy,
-                        index_rate,
-                        version,
-                        protect,
-                    )[self.t_pad_tgt : -self.t_pad_tgt]
+                pitch_future = executor.submit(
+                    worker(self._get_pitch),
+                    audio_pad,
+                    pitch,
+                    f0_method,
+                    filter_radius,
+                    hop_length,
+                    f0_autotune,
+                    f0_autotune_strength,
+                    f0_file,
                 )
-            else:
-                audio_opt.append(
-                    self.voice_conversion(
-                        model,
-                        net_g,
-                        sid,
-                        audio_pad[s : t + self.t_pad2 + self.window],
-                        None,
-                        None,
-                        index,
-                        big_npy,
-                        index_rate,
-                        version,
-                        protect,
-                    )[self.t_pad_tgt : -self.t_pad_tgt]
+            executor.submit(worker(extract))
+            executor.submit(worker(retrieve))
+            try:
+                pitch, pitchf = (
+                    pitch_future.result() if pitch_guidance else (None, None)
                 )
-            s = t
-        if pitch_guidance:
-            audio_opt.append(
-                self.voice_conversion(
-                    model,
-                    net_g,
-                    sid,
-                    audio_pad[t:],
-                    pitch[:, t // self.window :] if t is not None else pitch,
-                    pitchf[:, t // self.window :] if t is not None else pitchf,
-                    index,
-                    big_npy,
-                    index_rate,
-                    version,
-                    protect,
-                )[self.t_pad_tgt : -self.t_pad_tgt]
-            )
+                output = self._segment_writer(
+                    [audio_pad[start:end].shape[0] for start, end, _, _ in bounds]
+                )
+                audio_opt = []
+                for _, _, f0_start, f0_end in bounds:
+                    item = get(retrieved)
+                    if isinstance(item, Exception):
+                        raise item
+                    audio0, feats, feats0 = item
+                    with torch.no_grad():
+                        audio1 = self._synthesize(
+                            net_g,
+                            sid,
+                            audio0,
+                            feats,
+                            feats0,
+                            pitch[:, f0_start:f0_end] if pitch_guidance else None,
+                            pitchf[:, f0_start:f0_end] if pitch_guidance else None,
+                            protect,
+                            output,
+                        )
+                    if output is None:
+                        audio_opt.append(audio1)
+                    del item, feats, feats0
+            finally:
+                stop.set()
+        return audio, audio_opt if output is None else output
+
+    def merge_segments(self, audio, audio_opt, volume_envelope, normalize=True):
+        """
+        Trims the padding of the converted segments, joins them and applies the volume envelope.
+
+        Args:
+            audio: The filtered input audio signal returned by prepare_segments.
+            audio_opt: List of converted segments in order, or a SegmentWriter holding them
+                already trimmed and joined.
+            volume_envelope: Blending rate for adjusting the RMS level of the output audio.
+            normalize: Scale the output down when it peaks above 0.99.
+        """
+        if isinstance(audio_opt, SegmentWriter):
+            audio_opt = audio_opt.array()
         else:
-            audio_opt.append(
-                self.voice_conversion(
-                    model,
-                    net_g,
-                    sid,
-                    audio_pad[t:],
-                    None,
-                    None,
-                    index,
-                    big_npy,
-                    index_rate,
-                    version,
-                    protect,
-                )[self.t_pad_tgt : -self.t_pad_tgt]
+            audio_opt = np.concatenate(
+                [segment[self.t_pad_tgt : -self.t_pad_tgt] for segment in audio_opt]
             )
-        audio_opt = np.concatenate(audio_opt)
         if volume_envelope != 1:
             audio_opt = AudioProcessor.change_rms(
                 audio, self.sample_rate, audio_opt, self.sample_rate, volume_envelope
@@ -697,12 +1207,110 @@ class Pipeline:
         # if audio_max > 1:
         #    max_int16 /= audio_max
         # audio_opt = (audio_opt * 32768).astype(np.int16)
-        audio_max = np.abs(audio_opt).max() / 0.99
-        if audio_max > 1:
-            audio_opt /= audio_max
-        if pitch_guidance:
-            del pitch, pitchf
-        del sid
+        if normalize:
+            audio_opt = AudioProcessor.normalize_peak(audio_opt)
+        return audio_opt
+
+    def pipeline(
+        self,
+        model,
+        net_g,
+        sid,
+        audio,
+        pitch,
+        f0_method,
+        file_index,
+        index_rate,
+        pitch_guidance,
+        filter_radius,
+        volume_envelope,
+        version,
+        protect,
+        hop_length,
+        f0_autotune,
+        f0_autotune_strength,
+        f0_file,
+        normalize=True,
+    ):
+        """
+        The main pipeline function for performing voice conversion.
+
+        Args:
+            model: The feature extractor model.
+            net_g: The generative model for synthesizing speech.
+            sid: Speaker ID for the target voice.
+            audio: The input audio signal.
+            pitch: Key to adjust the pitch of the F0 contour.
+            f0_method: Method to use for F0 estimation.
+            file_index: Path to the FAISS index file for speaker embedding retrieval.
+            index_rate: Blending rate for speaker embedding retrieval.
+            pitch_guidance: Whether to use pitch guidance during voice conversion.
+            filter_radius: Radius for median filtering the F0 contour.
+            volume_envelope: Blending rate for adjusting the RMS level of the output audio.
+            version: Model version.
+            protect: Protection level for preserving the original pitch.
+            hop_length: Hop length for F0 estimation methods.
+            f0_autotune: Whether to apply autotune to the F0 contour.
+            f0_file: Path to a file containing an F0 contour to use.
+            normalize: Scale the output down when it peaks above 0.99, callers joining several
+                outputs normalize the joined audio instead.
+        """
+        if self.pipelined_inference:
+            audio, audio_opt = self.pipelined_conversion(
+                model,
+                net_g,
+                sid,
+                audio,
+                pitch,
+                f0_method,
+                file_index,
+                index_rate,
+                pitch_guidance,
+                filter_radius,
+                version,
+                protect,
+                hop_length,
+                f0_autotune,
+                f0_autotune_strength,
+                f0_file,
+            )
+        else:
+            audio, segments = self.prepare_segments(
+                sid,
+                audio,
+                pitch,
+                f0_method,
+                file_index,
+                index_rate,
+                pitch_guidance,
+                filter_radius,
+                protect,
+                hop_length,
+                f0_autotune,
+                f0_autotune_strength,
+                f0_file,
+            )
+            output = self._segment_writer([segment[1].shape[0] for segment in segments])
+            audio_opt = []
+            for sid, audio0, pitch, pitchf, retriever, index_rate, protect in segments:
+                audio1 = self.voice_conversion(
+                    model,
+                    net_g,
+                    sid,
+                    audio0,
+                    pitch,
+                    pitchf,
+                    retriever,
+                    index_rate,
+                    version,
+                    protect,
+                    output,
+                )
+                if output is None:
+                    audio_opt.append(audio1)
+            if output is not None:
+                audio_opt = output
+        audio_opt = self.merge_segments(audio, audio_opt, volume_envelope, normalize)
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
         return audio_opt
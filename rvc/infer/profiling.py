@@ -0,0 +1,363 @@
+import os
+import json
+import time
+import uuid
+import random
+import threading
+import functools
+import contextlib
+import torch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds of the Prometheus histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+NULL_CONTEXT = contextlib.nullcontext()
+
+
+class Metrics:
+    """
+    Process-wide stage histograms and counters, rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.errors = {}
+        self.counters = {}
+
+    def observe(self, name: str, seconds: float, error: bool = False):
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {
+                    "count": 0,
+                    "sum": 0.0,
+                    "buckets": [0] * len(BUCKETS),
+                }
+            stage["count"] += 1
+            stage["sum"] += seconds
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stage["buckets"][i] += 1
+            if error:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def increment(self, name: str, value: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_prometheus(self) -> str:
+        lines = [
+            "# HELP rvc_stage_seconds Time spent in each inference stage.",
+            "# TYPE rvc_stage_seconds histogram",
+        ]
+        with self.lock:
+            for name, stage in sorted(self.stages.items()):
+                for bound, count in zip(BUCKETS, stage["buckets"]):
+                    lines.append(
+                        f'rvc_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'rvc_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {stage["count"]}'
+                )
+                lines.append(f'rvc_stage_seconds_sum{{stage="{name}"}} {stage["sum"]}')
+                lines.append(
+                    f'rvc_stage_seconds_count{{stage="{name}"}} {stage["count"]}'
+                )
+            lines.append("# HELP rvc_stage_errors_total Stages that raised an exception.")
+            lines.append("# TYPE rvc_stage_errors_total counter")
+            for name, count in sorted(self.errors.items()):
+                lines.append(f'rvc_stage_errors_total{{stage="{name}"}} {count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE rvc_{name} counter")
+                lines.append(f"rvc_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class JsonLinesSink:
+    """
+    Appends one JSON object per finished request to a file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def emit(self, record: dict):
+        line = json.dumps(record)
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+class TorchProfilerSink:
+    """
+    Captures a torch.profiler trace for a sampled fraction of requests.
+    """
+
+    def __init__(self, trace_dir: str, sample_rate: float):
+        self.trace_dir = trace_dir
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+        self.active = False
+        os.makedirs(trace_dir, exist_ok=True)
+
+    def start(self):
+        # only one trace at a time, the profiler is process-wide
+        with self.lock:
+            if self.active or random.random() >= self.sample_rate:
+                return None
+            self.active = True
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        profile = torch.profiler.profile(
+            activities=activities, record_shapes=True, with_stack=False
+        )
+        profile.__enter__()
+        return profile
+
+    def stop(self, profile, request_id: str) -> str:
+        try:
+            profile.__exit__(None, None, None)
+            trace_path = os.path.join(self.trace_dir, f"{request_id}.json")
+            profile.export_chrome_trace(trace_path)
+            return trace_path
+        finally:
+            with self.lock:
+                self.active = False
+
+
+class Profiler:
+    """
+    Timers and counters around the inference stages, disabled unless configured.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.synchronize = False
+        self.metrics = Metrics()
+        self.sinks = []
+        self.trace_sink = None
+        self.local = threading.local()
+
+    def configure(
+        self,
+        jsonl_path: str = None,
+        trace_dir: str = None,
+        trace_sample_rate: float = 0.0,
+        synchronize: bool = True,
+    ):
+        """
+        Enables profiling and sets up the sinks.
+
+        Args:
+            jsonl_path: File the per-request JSON lines are appended to.
+            trace_dir: Directory for sampled torch.profiler traces.
+            trace_sample_rate: Fraction of requests traced with torch.profiler.
+            synchronize: Whether to wait for CUDA kernels before stopping a timer.
+        """
+        self.sinks = [JsonLinesSink(jsonl_path)] if jsonl_path else []
+        self.trace_sink = (
+            TorchProfilerSink(trace_dir, trace_sample_rate)
+            if trace_dir and trace_sample_rate > 0
+            else None
+        )
+        self.synchronize = synchronize and torch.cuda.is_available()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def _stop_clock(self, start_time: float) -> float:
+        if self.synchronize:
+            torch.cuda.synchronize()
+        return time.perf_counter() - start_time
+
+    @contextlib.contextmanager
+    def _stage(self, name: str):
+        start_time = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            seconds = self._stop_clock(start_time)
+            self.metrics.observe(name, seconds, error)
+            record = getattr(self.local, "record", None)
+            if record is not None:
+                stage = record["stages"].setdefault(name, {"count": 0, "seconds": 0.0})
+                stage["count"] += 1
+                stage["seconds"] += seconds
+
+    def stage(self, name: str):
+        """
+        Returns a context manager timing one stage, a shared no-op one when disabled.
+
+        Args:
+            name: Name of the stage.
+        """
+        return self._stage(name) if self.enabled else NULL_CONTEXT
+
+    @contextlib.contextmanager
+    def _request(self, name: str, info: dict):
+        if getattr(self.local, "record", None) is not None:
+            # nested requests are reported as stages of the outer one
+            with self._stage(name):
+                yield
+            return
+        record = {
+            "request_id": uuid.uuid4().hex,
+            "name": name,
+            "start": time.time(),
+            "stages": {},
+            "counters": {},
+            **info,
+        }
+        self.local.record = record
+        profile = self.trace_sink.start() if self.trace_sink else None
+        start_time = time.perf_counter()
+        try:
+            yield record
+        except BaseException as error:
+            record["error"] = str(error)
+            raise
+        finally:
+            record["duration"] = self._stop_clock(start_time)
+            self.local.record = None
+            self.metrics.observe(name, record["duration"], "error" in record)
+            self.metrics.increment("requests_total")
+            if profile is not None:
+                try:
+                    record["trace"] = self.trace_sink.stop(profile, record["request_id"])
+                except Exception as error:
+                    print(f"An error occurred saving the profiler trace: {error}")
+            for sink in self.sinks:
+                try:
+                    sink.emit(record)
+                except Exception as error:
+                    print(f"An error occurred writing the profiling record: {error}")
+
+    def request(self, name: str, **info):
+        """
+        Returns a context manager collecting the stages of one request and emitting them to the sinks.
+
+        Args:
+            name: Name of the request type.
+            **info: Extra fields stored in the request record.
+        """
+        return self._request(name, info) if self.enabled else NULL_CONTEXT
+
+    def count(self, name: str, value: float = 1):
+        """
+        Increments a counter globally and in the current request record.
+
+        Args:
+            name: Name of the counter.
+            value: Amount to add.
+        """
+        if not self.enabled:
+            return
+        self.metrics.increment(name, value)
+        record = getattr(self.local, "record", None)
+        if record is not None:
+            record["counters"][name] = record["counters"].get(name, 0) + value
+
+    def timed(self, name: str = None):
+        """
+        Decorates a function so each call is timed as a stage.
+
+        Args:
+            name: Name of the stage, the function name by default.
+        """
+
+        def decorator(function):
+            stage_name = name or function.__name__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self._stage(stage_name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def traced(self, name: str = None):
+        """
+        Decorates a function so each call is recorded as a request.
+
+        Args:
+            name: Name of the request type, the function name by default.
+        """
+
+        def decorator(function):
+            request_name = name or function.__name__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self._request(request_name, {}):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+class PrometheusHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = profiler.metrics.to_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_prometheus_server(port: int, host: str = "localhost"):
+    """
+    Serves the collected metrics at http://host:port/metrics from a daemon thread.
+
+    Args:
+        port: Port to listen on.
+        host: Host to bind to.
+    """
+    server = ThreadingHTTPServer((host, port), PrometheusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def configure_from_environment():
+    """
+    Enables profiling when one of the RVC_PROFILE_* environment variables is set.
+    """
+    jsonl_path = os.environ.get("RVC_PROFILE_JSONL")
+    prometheus_port = os.environ.get("RVC_PROFILE_PROMETHEUS_PORT")
+    trace_dir = os.environ.get("RVC_PROFILE_TRACE_DIR")
+    trace_sample_rate = float(os.environ.get("RVC_PROFILE_TRACE_SAMPLE_RATE", 0.01))
+    if not (jsonl_path or prometheus_port or trace_dir):
+        return
+    profiler.configure(jsonl_path, trace_dir, trace_sample_rate)
+    if prometheus_port:
+        try:
+            start_prometheus_server(int(prometheus_port))
+        except OSError as error:
+            print(f"An error occurred starting the Prometheus endpoint: {error}")
+
+
+profiler = Profiler()
+configure_from_environment()
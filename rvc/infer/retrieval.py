@@ -0,0 +1,225 @@
+import os
+import json
+import faiss
+import numpy as np
+import torch
+
+
+class IndexRetriever:
+    """
+    Retrieves speaker embeddings from a FAISS index and blends them into the input features.
+
+    Indexes up to `max_exact_vectors` are held as a tensor on the inference device and searched
+    exactly with a batched matmul top-k, larger ones fall back to the FAISS index itself.
+    Speaker-partitioned indexes restrict the search to the id ranges of the target speaker.
+    """
+
+    def __init__(
+        self,
+        index,
+        device,
+        is_half: bool,
+        max_exact_vectors: int,
+        k: int = 8,
+        max_batch_elements: int = 2**26,
+        speaker_ranges: dict = None,
+    ):
+        """
+        Initializes the IndexRetriever with a loaded FAISS index.
+
+        Args:
+            index: The loaded FAISS index.
+            device: The device the features live on.
+            is_half: Whether to store the exact-search vectors in fp16.
+            max_exact_vectors: Largest index size searched exactly on the device.
+            k: Number of neighbours blended per frame.
+            max_batch_elements: Upper bound on the size of one query x index distance block.
+            speaker_ranges: Optional mapping of speaker id to a list of [start, end) id ranges.
+        """
+        self.index = index
+        self.device = device
+        self.is_half = is_half
+        self.k = min(k, index.ntotal)
+        self.max_batch_elements = max_batch_elements
+        self.speaker_ranges = speaker_ranges or {}
+        self.partitions = {}
+        self.use_exact = index.ntotal <= max_exact_vectors
+
+        big_npy = index.reconstruct_n(0, index.ntotal)
+        if self.use_exact:
+            self.big_npy = None
+            self.big_tensor = torch.from_numpy(big_npy).to(
+                self.device, torch.float16 if self.is_half else torch.float32
+            )
+            self.big_norms = self.big_tensor.float().pow(2).sum(dim=1)
+        else:
+            self.big_npy = big_npy
+            self.big_tensor = self.big_norms = None
+
+    def _get_partition(self, sid):
+        """
+        Returns the (vectors, norms, ids) of a speaker partition, or None when the index is not partitioned.
+
+        Args:
+            sid: Target speaker id.
+        """
+        ranges = self.speaker_ranges.get(str(sid))
+        if not ranges:
+            return None
+        if sid not in self.partitions:
+            ids = np.concatenate([np.arange(start, end) for start, end in ranges])
+            if self.use_exact:
+                if len(ranges) == 1:
+                    start, end = ranges[0]
+                    vectors = self.big_tensor[start:end]
+                    norms = self.big_norms[start:end]
+                else:
+                    rows = torch.from_numpy(ids).to(self.device)
+                    vectors = self.big_tensor[rows]
+                    norms = self.big_norms[rows]
+                self.partitions[sid] = (vectors, norms, ids)
+            else:
+                self.partitions[sid] = (None, None, ids)
+        return self.partitions[sid]
+
+    def _blend_exact(self, queries: torch.Tensor, partition=None) -> torch.Tensor:
+        """
+        Searches the device tensor exactly and returns the weighted blend of the neighbours.
+
+        Args:
+            queries: Query features of shape (frames, dim).
+            partition: Optional speaker partition to search instead of the whole index.
+        """
+        vectors, norms = (
+            (self.big_tensor, self.big_norms) if partition is None else partition[:2]
+        )
+        k = min(self.k, vectors.shape[0])
+        queries = queries.to(vectors.dtype)
+        query_norms = queries.float().pow(2).sum(dim=1, keepdim=True)
+        chunk_size = max(1, self.max_batch_elements // vectors.shape[0])
+        blended = []
+        for start in range(0, queries.shape[0], chunk_size):
+            chunk = queries[start : start + chunk_size]
+            # squared L2 distance, the same metric FAISS returns for flat and IVF indexes
+            score = (
+                query_norms[start : start + chunk_size]
+                + norms.unsqueeze(0)
+                - 2 * torch.matmul(chunk, vectors.T).float()
+            )
+            score, ix = torch.topk(score, k, dim=1, largest=False)
+            weight = torch.square(1 / score.clamp_min(1e-6))
+            weight /= weight.sum(dim=1, keepdim=True)
+            blended.append((vectors[ix].float() * weight.unsqueeze(2)).sum(dim=1))
+        return torch.cat(blended, dim=0)
+
+    def _search_params(self, ids: np.ndarray):
+        """
+        Returns FAISS search parameters restricting the search to the given ids.
+
+        Args:
+            ids: Sorted ids of the speaker partition.
+        """
+        if ids[-1] - ids[0] + 1 == ids.size:
+            selector = faiss.IDSelectorRange(int(ids[0]), int(ids[-1]) + 1)
+        else:
+            selector = faiss.IDSelectorBatch(ids.astype("int64"))
+        try:
+            ivf = faiss.extract_index_ivf(self.index)
+            return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+        except RuntimeError:
+            pass
+        if hasattr(self.index, "hnsw"):
+            return faiss.SearchParametersHNSW(
+                sel=selector, efSearch=self.index.hnsw.efSearch
+            )
+        return faiss.SearchParameters(sel=selector)
+
+    def _blend_faiss(self, queries: torch.Tensor, partition=None) -> torch.Tensor:
+        """
+        Searches the FAISS index on the host and returns the weighted blend of the neighbours.
+
+        Args:
+            queries: Query features of shape (frames, dim).
+            partition: Optional speaker partition to search instead of the whole index.
+        """
+        npy = queries.float().cpu().numpy()
+        if partition is None:
+            score, ix = self.index.search(npy, k=self.k)
+        else:
+            score, ix = self.index.search(
+                npy, k=self.k, params=self._search_params(partition[2])
+            )
+            # frames whose probed lists or graph neighbourhood hold no vector of the
+            # speaker are searched exactly within the partition instead
+            missing = ix[:, 0] < 0
+            if missing.any():
+                ids = partition[2]
+                k = min(self.k, ids.size)
+                score[missing] = np.inf
+                ix[missing] = -1
+                score[missing, :k], sub_ix = faiss.knn(npy[missing], self.big_npy[ids], k)
+                ix[missing, :k] = ids[sub_ix]
+            score[ix < 0] = np.inf
+        weight = np.square(1 / score)
+        weight /= weight.sum(axis=1, keepdims=True)
+        npy = np.sum(self.big_npy[ix] * np.expand_dims(weight, axis=2), axis=1)
+        return torch.from_numpy(npy).to(self.device)
+
+    def retrieve(self, feats: torch.Tensor, index_rate: float, sid=None) -> torch.Tensor:
+        """
+        Blends the retrieved speaker embeddings into the given features.
+
+        Args:
+            feats: Features of shape (1, frames, dim).
+            index_rate: Blending rate for speaker embedding retrieval.
+            sid: Optional target speaker id of a speaker-partitioned index.
+        """
+        partition = self._get_partition(sid) if sid is not None else None
+        if self.use_exact:
+            npy = self._blend_exact(feats[0], partition)
+        else:
+            npy = self._blend_faiss(feats[0], partition)
+        return npy.unsqueeze(0).to(feats.dtype) * index_rate + (1 - index_rate) * feats
+
+    def for_speaker(self, sid):
+        """
+        Returns a view of this retriever that only searches the vectors of one speaker.
+
+        Args:
+            sid: Target speaker id.
+        """
+        return SpeakerRetriever(self, sid)
+
+
+class SpeakerRetriever:
+    """
+    An IndexRetriever bound to a target speaker.
+    """
+
+    def __init__(self, retriever: IndexRetriever, sid):
+        self.retriever = retriever
+        self.sid = sid
+
+    def retrieve(self, feats: torch.Tensor, index_rate: float) -> torch.Tensor:
+        return self.retriever.retrieve(feats, index_rate, self.sid)
+
+
+def load_retriever(file_index: str, device, is_half: bool, max_exact_vectors: int):
+    """
+    Reads a FAISS index and the speaker ranges of its manifest from disk and wraps them in an IndexRetriever.
+
+    Args:
+        file_index: Path to the FAISS index file.
+        device: The device the features live on.
+        is_half: Whether to store the exact-search vectors in fp16.
+        max_exact_vectors: Largest index size searched exactly on the device.
+    """
+    index = faiss.read_index(file_index)
+    speaker_ranges = None
+    manifest_path = os.path.splitext(file_index)[0] + ".json"
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            speaker_ranges = json.load(f).get("speaker_ranges")
+    return IndexRetriever(
+        index, device, is_half, max_exact_vectors, speaker_ranges=speaker_ranges
+    )
@@ -0,0 +1,419 @@
+import time
+import uuid
+import threading
+import traceback
+import collections
+import numpy as np
+import soundfile as sf
+
+from rvc.infer.profiling import profiler
+
+SAMPLE_RATE = 16000
+
+DEFAULT_PARAMS = {
+    "pitch": 0,
+    "f0_method": "rmvpe",
+    "index_path": "",
+    "index_rate": 0.75,
+    "volume_envelope": 1.0,
+    "protect": 0.5,
+    "hop_length": 128,
+    "f0_autotune": False,
+    "f0_autotune_strength": 1.0,
+    "filter_radius": 3,
+    "embedder_model": "contentvec",
+    "embedder_model_custom": None,
+    "clean_audio": False,
+    "clean_strength": 0.5,
+    "export_format": "WAV",
+    "sid": 0,
+}
+
+
+class ConversionJob:
+    """
+    A single conversion request waiting in, or processed by, the BatchScheduler.
+    """
+
+    def __init__(self, audio, output_path: str, model_path: str, params: dict = None):
+        """
+        Initializes the job.
+
+        Args:
+            audio: The input audio decoded at 16 kHz.
+            output_path: Path of the WAV file the result is written to.
+            model_path: Path to the voice conversion model.
+            params: Conversion parameters overriding DEFAULT_PARAMS.
+        """
+        self.id = uuid.uuid4().hex
+        self.audio = audio
+        self.output_path = output_path
+        self.model_path = model_path
+        self.params = {**DEFAULT_PARAMS, **(params or {})}
+        self.status = "queued"
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.batches = 0
+        self.done = threading.Event()
+
+    @property
+    def key(self):
+        # jobs sharing the generator and the embedder can run in the same batch
+        return (
+            self.model_path,
+            self.params["embedder_model"],
+            self.params["embedder_model_custom"],
+        )
+
+    @property
+    def duration(self) -> float:
+        return len(self.audio) / SAMPLE_RATE
+
+    def finish(self, status: str, error: str = None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self.audio = None
+        self.done.set()
+
+    def to_dict(self) -> dict:
+        info = {
+            "job_id": self.id,
+            "status": self.status,
+            "model_path": self.model_path,
+            "submitted_at": self.submitted_at,
+        }
+        if self.started_at is not None:
+            info["queue_wait"] = self.started_at - self.submitted_at
+        if self.finished_at is not None:
+            info["latency"] = self.finished_at - self.submitted_at
+            info["batches"] = self.batches
+        if self.status == "done":
+            info["output_path"] = self.output_path
+        if self.error:
+            info["error"] = self.error
+        return info
+
+
+class BatchScheduler:
+    """
+    Runs conversion jobs on one warm VoiceConverter, coalescing concurrent jobs for the same model.
+
+    The worker waits up to `max_wait` seconds after the oldest queued job arrives for more jobs of
+    the same model, then converts their segments in batched voice_conversion calls holding at most
+    `max_batch_duration` seconds of audio each.
+    """
+
+    def __init__(
+        self,
+        converter,
+        max_wait: float = 0.05,
+        max_batch_duration: float = 60.0,
+        history: int = 1000,
+    ):
+        """
+        Initializes the scheduler and starts its worker thread.
+
+        Args:
+            converter: The VoiceConverter holding the warm models.
+            max_wait: Longest time in seconds a job waits for others to share its batch.
+            max_batch_duration: Most seconds of audio converted in one batched call.
+            history: Number of finished jobs and latency samples kept for lookups and metrics.
+        """
+        self.converter = converter
+        self.max_wait = max_wait
+        self.max_batch_duration = max_batch_duration
+        self.history = history
+        self.pending = collections.deque()
+        self.jobs = collections.OrderedDict()
+        self.condition = threading.Condition()
+        self.running = True
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.queue_waits = collections.deque(maxlen=history)
+        self.processing_times = collections.deque(maxlen=history)
+        self.latencies = collections.deque(maxlen=history)
+        self.batch_sizes = collections.deque(maxlen=history)
+        self.batch_durations = collections.deque(maxlen=history)
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, job: ConversionJob) -> ConversionJob:
+        with self.condition:
+            self.pending.append(job)
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.history:
+                oldest = next(iter(self.jobs.values()))
+                if not oldest.done.is_set():
+                    break
+                self.jobs.popitem(last=False)
+            self.condition.notify_all()
+        return job
+
+    def get(self, job_id: str):
+        with self.condition:
+            return self.jobs.get(job_id)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.worker.join()
+
+    def metrics(self) -> dict:
+        """
+        Returns queue depth, throughput counters and latency percentiles in seconds.
+        """
+
+        def summarize(values):
+            if not values:
+                return {"p50": None, "p95": None, "p99": None, "mean": None}
+            values = np.array(values)
+            return {
+                "p50": float(np.percentile(values, 50)),
+                "p95": float(np.percentile(values, 95)),
+                "p99": float(np.percentile(values, 99)),
+                "mean": float(values.mean()),
+            }
+
+        with self.condition:
+            depth_by_model = collections.Counter(job.model_path for job in self.pending)
+            return {
+                "queue_depth": len(self.pending),
+                "queue_depth_by_model": dict(depth_by_model),
+                "queued_audio_seconds": sum(job.duration for job in self.pending),
+                "active_jobs": self.active,
+                "completed_jobs": self.completed,
+                "failed_jobs": self.failed,
+                "batches": len(self.batch_sizes),
+                "mean_batch_size": (
+                    float(np.mean(self.batch_sizes)) if self.batch_sizes else None
+                ),
+                "mean_batch_duration": (
+                    float(np.mean(self.batch_durations))
+                    if self.batch_durations
+                    else None
+                ),
+                "queue_wait": summarize(list(self.queue_waits)),
+                "processing_time": summarize(list(self.processing_times)),
+                "latency": summarize(list(self.latencies)),
+            }
+
+    def _take_group(self):
+        """
+        Waits for work and removes the next group of same-model jobs from the queue.
+        """
+        with self.condition:
+            while self.running and not self.pending:
+                self.condition.wait()
+            if not self.running:
+                return []
+            first = self.pending[0]
+            while self.running:
+                queued = sum(
+                    job.duration for job in self.pending if job.key == first.key
+                )
+                remaining = first.submitted_at + self.max_wait - time.time()
+                if remaining <= 0 or queued >= self.max_batch_duration:
+                    break
+                self.condition.wait(remaining)
+            group, duration = [], 0.0
+            for job in list(self.pending):
+                if job.key != first.key:
+                    continue
+                if group and duration + job.duration > self.max_batch_duration:
+                    break
+                group.append(job)
+                duration += job.duration
+            for job in group:
+                self.pending.remove(job)
+            self.active = len(group)
+            return group
+
+    def _run(self):
+        while self.running:
+            group = self._take_group()
+            if not group:
+                continue
+            try:
+                self._process(group)
+            except Exception as error:
+                # a failure outside the guarded stages must not stop the worker thread
+                print(f"An error occurred processing a batch: {error}")
+                print(traceback.format_exc())
+                for job in group:
+                    if not job.done.is_set():
+                        self._finish(job, "failed", str(error))
+            finally:
+                with self.condition:
+                    self.active = 0
+
+    @profiler.traced("service_batch")
+    def _process(self, jobs):
+        """
+        Converts a group of jobs that share the same model.
+
+        Args:
+            jobs: Jobs with the same model key.
+        """
+        converter = self.converter
+        start_time = time.time()
+        for job in jobs:
+            job.status = "running"
+            job.started_at = start_time
+
+        params = jobs[0].params
+        try:
+            converter.get_vc(jobs[0].model_path, params["sid"])
+            if converter.net_g is None:
+                raise FileNotFoundError(f"Model not found: {jobs[0].model_path}")
+            if (
+                not converter.hubert_model
+                or params["embedder_model"] != converter.last_embedder_model
+            ):
+                converter.load_hubert(
+                    params["embedder_model"], params["embedder_model_custom"]
+                )
+                converter.last_embedder_model = params["embedder_model"]
+        except Exception as error:
+            print(f"An error occurred loading the model: {error}")
+            for job in jobs:
+                self._finish(job, "failed", str(error))
+            return
+
+        vc = converter.vc
+        profiler.count("audio_seconds_total", sum(job.duration for job in jobs))
+        prepared = []
+        for job in jobs:
+            try:
+                audio = job.audio
+                audio_max = np.abs(audio).max() / 0.95
+                if audio_max > 1:
+                    audio = audio / audio_max
+                file_index = (
+                    job.params["index_path"]
+                    .strip()
+                    .strip('"')
+                    .strip("\n")
+                    .strip('"')
+                    .strip()
+                    .replace("trained", "added")
+                )
+                audio, segments = vc.prepare_segments(
+                    job.params["sid"],
+                    audio,
+                    job.params["pitch"],
+                    job.params["f0_method"],
+                    file_index,
+                    job.params["index_rate"],
+                    converter.use_f0,
+                    job.params["filter_radius"],
+                    job.params["protect"],
+                    job.params["hop_length"],
+                    job.params["f0_autotune"],
+                    job.params["f0_autotune_strength"],
+                    None,
+                )
+                prepared.append((job, audio, segments, [None] * len(segments)))
+            except Exception as error:
+                print(f"An error occurred preparing job {job.id}: {error}")
+                self._finish(job, "failed", str(error))
+
+        # pack the segments of all jobs into batches of bounded audio duration, longest
+        # first so that segments of similar length share a batch and padding stays small
+        segments = [(item, i) for item in prepared for i in range(len(item[2]))]
+        segments.sort(key=lambda segment: -len(segment[0][2][segment[1]][1]))
+        batches, batch, duration = [], [], 0.0
+        for item, i in segments:
+            seconds = len(item[2][i][1]) / SAMPLE_RATE
+            if batch and duration + seconds > self.max_batch_duration:
+                batches.append(batch)
+                batch, duration = [], 0.0
+            batch.append((item, i))
+            duration += seconds
+        if batch:
+            batches.append(batch)
+
+        for batch in batches:
+            batch = [(item, i) for item, i in batch if item[0].status == "running"]
+            if not batch:
+                continue
+            try:
+                outputs = vc.voice_conversion_batch(
+                    converter.hubert_model,
+                    converter.net_g,
+                    [item[2][i] for item, i in batch],
+                    converter.version,
+                )
+            except Exception as error:
+                print(f"An error occurred converting a batch: {error}")
+                print(traceback.format_exc())
+                for item, _ in batch:
+                    self._finish(item[0], "failed", str(error))
+                continue
+            for (item, i), output in zip(batch, outputs):
+                item[3][i] = output
+            for job in {id(item[0]): item[0] for item, _ in batch}.values():
+                job.batches += 1
+            with self.condition:
+                self.batch_sizes.append(len({id(item[0]) for item, _ in batch}))
+                self.batch_durations.append(
+                    sum(len(item[2][i][1]) for item, i in batch) / SAMPLE_RATE
+                )
+
+        merged = []
+        for job, audio, segments, outputs in prepared:
+            if job.status != "running":
+                continue
+            try:
+                audio_opt = vc.merge_segments(
+                    audio, outputs, job.params["volume_envelope"]
+                )
+                merged.append((job, audio_opt))
+            except Exception as error:
+                print(f"An error occurred merging job {job.id}: {error}")
+                self._finish(job, "failed", str(error))
+
+        # the noise reduction of all jobs asking for it runs as one batch
+        cleaning = [i for i, (job, _) in enumerate(merged) if job.params["clean_audio"]]
+        if cleaning:
+            cleaned = converter.remove_audio_noise_batch(
+                [merged[i][1] for i in cleaning],
+                converter.tgt_sr,
+                [merged[i][0].params["clean_strength"] for i in cleaning],
+            )
+            if cleaned is not None:
+                for i, cleaned_audio in zip(cleaning, cleaned):
+                    merged[i] = (merged[i][0], cleaned_audio)
+
+        for job, audio_opt in merged:
+            try:
+                with profiler.stage("write_audio"):
+                    sf.write(
+                        job.output_path, audio_opt, converter.tgt_sr, format="WAV"
+                    )
+                    export_format = job.params["export_format"]
+                    output_path = job.output_path.replace(
+                        ".wav", f".{export_format.lower()}"
+                    )
+                    job.output_path = converter.convert_audio_format(
+                        job.output_path, output_path, export_format
+                    )
+                self._finish(job, "done")
+            except Exception as error:
+                print(f"An error occurred writing job {job.id}: {error}")
+                self._finish(job, "failed", str(error))
+
+    def _finish(self, job: ConversionJob, status: str, error: str = None):
+        job.finish(status, error)
+        with self.condition:
+            if status == "done":
+                self.completed += 1
+                self.queue_waits.append(job.started_at - job.submitted_at)
+                self.processing_times.append(job.finished_at - job.started_at)
+                self.latencies.append(job.finished_at - job.submitted_at)
+            else:
+                self.failed += 1
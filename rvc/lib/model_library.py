@@ -0,0 +1,299 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+from collections import namedtuple
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+LIBRARY_PATH = os.path.join(now_dir, "assets", "model_library.db")
+MODEL_EXTENSIONS = (".pth", ".onnx", ".safetensors", ".index")
+AUDIO_EXTENSIONS = (
+    "wav",
+    "mp3",
+    "flac",
+    "ogg",
+    "opus",
+    "m4a",
+    "mp4",
+    "aac",
+    "alac",
+    "wma",
+    "aiff",
+    "webm",
+    "ac3",
+)
+DEFAULT_ROOTS = {
+    "logs": MODEL_EXTENSIONS,
+    os.path.join("assets", "audios"): AUDIO_EXTENSIONS,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    subdirectories TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_root ON files (root);
+CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+CREATE TABLE IF NOT EXISTS metadata (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+
+LibraryFile = namedtuple("LibraryFile", ["path", "directory", "name", "size", "mtime_ns"])
+
+
+def read_model_metadata(path: str) -> dict:
+    """
+    Reads the metadata fields of a .pth or .safetensors model, leaving out its weights.
+
+    Zip checkpoints are memory-mapped and safetensors headers are read on their own,
+    so the weights are never read from disk.
+
+    Args:
+        path: Path to the model.
+    """
+    import torch
+
+    if path.endswith(".safetensors"):
+        from rvc.lib.weights import read_safetensors_metadata
+
+        return read_safetensors_metadata(path)
+    try:
+        model = torch.load(path, map_location="cpu", mmap=True)
+    except RuntimeError:
+        # legacy checkpoints can not be memory-mapped
+        model = torch.load(path, map_location="cpu")
+    return {
+        key: value
+        for key, value in model.items()
+        if key != "weight"
+        and isinstance(value, (str, int, float, bool, list, tuple, type(None)))
+    }
+
+
+class ModelLibrary:
+    """
+    Persistent SQLite registry of the models, indexes and audios under a set of directories.
+
+    A refresh only lists the directories whose modification time changed since the previous one
+    and stats the rest, so listing thousands of models takes milliseconds. Model metadata is read
+    once per file and kept until the size or modification time of the file changes.
+    """
+
+    def __init__(
+        self,
+        database: str = LIBRARY_PATH,
+        roots: dict = None,
+        refresh_interval: float = 0.5,
+    ):
+        """
+        Initializes the ModelLibrary, creating the database when needed.
+
+        Args:
+            database: Path to the SQLite database.
+            roots: Mapping of directories, relative to the working directory, to the file
+                extensions registered under them.
+            refresh_interval: Seconds during which a refresh reuses the previous one.
+        """
+        self.database = database
+        self.roots = DEFAULT_ROOTS if roots is None else roots
+        self.refresh_interval = refresh_interval
+        self.last_refresh = 0.0
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(database)), exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.database, timeout=30)
+
+    def refresh(self, force: bool = False) -> dict:
+        """
+        Brings the registry up to date with the directories, returning the number of
+        directories listed again and the number of directories checked.
+
+        Args:
+            force: Refresh even when the previous refresh is more recent than refresh_interval.
+        """
+        with self.lock:
+            if not force and time.monotonic() - self.last_refresh < self.refresh_interval:
+                return {"listed": 0, "checked": 0}
+            stats = {"listed": 0, "checked": 0}
+            with self._connect() as connection:
+                for root, extensions in self.roots.items():
+                    self._scan(connection, root, tuple(extensions), stats)
+            self.last_refresh = time.monotonic()
+            return stats
+
+    def _scan(self, connection, root, extensions, stats):
+        known = {
+            path: (mtime_ns, json.loads(subdirectories))
+            for path, mtime_ns, subdirectories in connection.execute(
+                "SELECT path, mtime_ns, subdirectories FROM directories WHERE root = ?",
+                (root,),
+            )
+        }
+        seen = set()
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            seen.add(directory)
+            stats["checked"] += 1
+            if directory in known and known[directory][0] == mtime_ns:
+                stack.extend(known[directory][1])
+                continue
+            stats["listed"] += 1
+            subdirectories, files = [], []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        path = os.path.join(directory, entry.name)
+                        if entry.is_dir():
+                            if not entry.is_symlink():
+                                subdirectories.append(path)
+                        elif entry.name.endswith(extensions):
+                            stat = entry.stat()
+                            files.append(
+                                (
+                                    path,
+                                    root,
+                                    directory,
+                                    entry.name,
+                                    stat.st_size,
+                                    stat.st_mtime_ns,
+                                )
+                            )
+            except OSError:
+                continue
+            connection.execute("DELETE FROM files WHERE directory = ?", (directory,))
+            connection.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", files
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?)",
+                (directory, root, mtime_ns, json.dumps(subdirectories)),
+            )
+            stack.extend(subdirectories)
+        removed = [(directory,) for directory in known if directory not in seen]
+        connection.executemany("DELETE FROM files WHERE directory = ?", removed)
+        connection.executemany("DELETE FROM directories WHERE path = ?", removed)
+
+    def files(
+        self, root: str, extensions: tuple = None, recursive: bool = True
+    ) -> list:
+        """
+        Returns the registered files under a root as LibraryFile tuples sorted by path.
+
+        Args:
+            root: One of the registered directories.
+            extensions: Optional name endings to keep.
+            recursive: Whether to include files in subdirectories.
+        """
+        self.refresh()
+        query = "SELECT path, directory, name, size, mtime_ns FROM files WHERE root = ?"
+        arguments = (root,)
+        if not recursive:
+            query += " AND directory = ?"
+            arguments = (root, root)
+        with self._connect() as connection:
+            rows = connection.execute(query + " ORDER BY path", arguments).fetchall()
+        return [
+            LibraryFile(*row)
+            for row in rows
+            if extensions is None or row[2].endswith(tuple(extensions))
+        ]
+
+    def metadata(self, path: str) -> dict:
+        """
+        Returns the metadata of a .pth or .safetensors model, read from the registry unless the file changed.
+
+        Args:
+            path: Path to the model.
+        """
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT size, mtime_ns, data FROM metadata WHERE path = ?", (key,)
+            ).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return json.loads(row[2])
+        data = read_model_metadata(key)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)",
+                (key, stat.st_size, stat.st_mtime_ns, json.dumps(data, default=str)),
+            )
+        return data
+
+    def prune_metadata(self) -> int:
+        """
+        Removes the metadata of models that no longer exist, returning how many were removed.
+        """
+        with self._connect() as connection:
+            paths = [
+                path
+                for (path,) in connection.execute("SELECT path FROM metadata")
+                if not os.path.exists(path)
+            ]
+            connection.executemany(
+                "DELETE FROM metadata WHERE path = ?", [(path,) for path in paths]
+            )
+        return len(paths)
+
+
+model_library = None
+model_library_lock = threading.Lock()
+
+
+def get_model_library() -> ModelLibrary:
+    """
+    Returns the shared ModelLibrary of the working directory.
+    """
+    global model_library
+    with model_library_lock:
+        if model_library is None:
+            model_library = ModelLibrary()
+        return model_library
+
+
+if __name__ == "__main__":
+    library = get_model_library()
+    start_time = time.perf_counter()
+    stats = library.refresh(force=True)
+    elapsed = time.perf_counter() - start_time
+    models = library.files("logs", (".pth", ".onnx", ".safetensors"))
+    indexes = library.files("logs", (".index",))
+    print(
+        f"Checked {stats['checked']} directories, listed {stats['listed']} in {elapsed * 1000:.1f} ms"
+    )
+    print(f"{len(models)} models and {len(indexes)} indexes registered")
+    if len(sys.argv) > 1 and sys.argv[1] == "metadata":
+        for model in models:
+            if model.name.endswith((".pth", ".safetensors")):
+                try:
+                    library.metadata(model.path)
+                except Exception as error:
+                    print(f"Could not read {model.path}: {error}")
+        print(f"Removed metadata of {library.prune_metadata()} missing models")
@@ -1,3 +1,4 @@
+import os
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -9,6 +10,10 @@ from typing import List
 # Constants for readability
 N_MELS = 128
 N_CLASS = 360
+# Peak activation memory of the E2E model per input frame in float32, measured on CPU
+BYTES_PER_FRAME = 160_000
+# Larger batches stop paying off on CPUs, where the activations fall out of the caches
+MAX_BATCH_SIZE = {"cuda": 64, "cpu": 16}
 
 
 # Define a helper function for creating convolutional blocks
@@ -432,6 +437,24 @@ class MelSpectrogram(torch.nn.Module):
         return log_mel_spec
 
 
+def get_available_memory():
+    """
+    Returns the memory available to new allocations on the host in bytes.
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        # no way to tell, assume 4 GB
+        return 4 << 30
+
+
 # Define a class for the RMVPE0 predictor
 class RMVPE0Predictor:
     """
@@ -494,6 +517,16 @@ class RMVPE0Predictor:
         """
         Infers F0 from audio.
 
+        Args:
+            audio (np.ndarray): Audio signal.
+            thred (float, optional): Threshold for salience. Defaults to 0.03.
+        """
+        return self.infer_from_audio_with_confidence(audio, thred=thred)[0]
+
+    def infer_from_audio_with_confidence(self, audio, thred=0.03):
+        """
+        Infers F0 from audio along with the peak salience of each frame.
+
         Args:
             audio (np.ndarray): Audio signal.
             thred (float, optional): Threshold for salience. Defaults to 0.03.
@@ -505,7 +538,72 @@ class RMVPE0Predictor:
         if self.is_half == True:
             hidden = hidden.astype("float32")
         f0 = self.decode(hidden, thred=thred)
-        return f0
+        return f0, hidden.max(axis=1)
+
+    def auto_batch_size(self, n_frames, memory_fraction=0.5):
+        """
+        Returns how many signals of n_frames padded mel frames fit in a fraction of the
+        free memory of the device, between 1 and the MAX_BATCH_SIZE of the device type.
+
+        Args:
+            n_frames (int): Padded number of mel frames of the signals.
+            memory_fraction (float, optional): Fraction of the free memory to use. Defaults to 0.5.
+        """
+        device = torch.device(self.device or "cpu")
+        if device.type == "cuda":
+            available = torch.cuda.mem_get_info(device)[0]
+        else:
+            available = get_available_memory()
+        bytes_per_frame = BYTES_PER_FRAME // 2 if self.is_half else BYTES_PER_FRAME
+        size = int(available * memory_fraction) // (bytes_per_frame * n_frames)
+        return max(1, min(MAX_BATCH_SIZE.get(device.type, 16), size))
+
+    def infer_from_audio_batch(self, audios, thred=0.03, batch_size=None):
+        """
+        Infers F0 of several signals, running the model once per batch of signals whose mel
+        frames pad to the same multiple of 32.
+
+        Every signal gets the reflect padding infer_from_audio gives it, so the F0 is the
+        same as inferring the signals one by one.
+
+        Args:
+            audios (list): Audio signals as np.ndarray.
+            thred (float, optional): Threshold for salience. Defaults to 0.03.
+            batch_size (int, optional): Signals per batch, from the free memory by default.
+        """
+        groups = {}
+        mels = []
+        with torch.no_grad():
+            for i, audio in enumerate(audios):
+                audio = torch.from_numpy(audio).float().to(self.device).unsqueeze(0)
+                mel = self.mel_extractor(audio, center=True)
+                mels.append(mel)
+                n_frames = mel.shape[-1]
+                groups.setdefault(32 * ((n_frames - 1) // 32 + 1), []).append(i)
+
+        f0s = [None] * len(audios)
+        for padded_frames, indices in groups.items():
+            size = batch_size or self.auto_batch_size(padded_frames)
+            for start in range(0, len(indices), size):
+                chunk = indices[start : start + size]
+                with torch.no_grad():
+                    mel = torch.cat(
+                        [
+                            F.pad(
+                                mels[i],
+                                (0, padded_frames - mels[i].shape[-1]),
+                                mode="reflect",
+                            )
+                            for i in chunk
+                        ]
+                    )
+                    hidden = self.model(mel).cpu().numpy()
+                if self.is_half == True:
+                    hidden = hidden.astype("float32")
+                for j, i in enumerate(chunk):
+                    f0s[i] = self.decode(hidden[j, : mels[i].shape[-1]], thred=thred)
+                    mels[i] = None
+        return f0s
 
     def to_local_average_cents(self, salience, thred=0.05):
         """
@@ -0,0 +1,376 @@
+import os
+import sys
+import time
+import threading
+import multiprocessing as mp
+import torch
+import numpy as np
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+from rvc.train.cpu_workers import (
+    get_cpu_cores,
+    init_cpu_worker,
+    worker_thread_environment,
+)
+
+# the worker pool of the last estimator, kept so its processes only load their model once
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+# the estimator of a worker process
+_estimate = None
+
+
+def split_windows(n_frames: int, window_frames: int, overlap_frames: int) -> list:
+    """
+    Splits a contour into windows, returning (start, end, core_start, core_end) frames.
+
+    Each window extends its core by `overlap_frames` on both sides, so neighbouring windows
+    overlap by twice that and their cores meet at the midpoint of the overlap.
+
+    Args:
+        n_frames: Number of frames of the whole contour.
+        window_frames: Frames in the core of each window.
+        overlap_frames: Context frames added on each side of a core.
+    """
+    windows = []
+    for core_start in range(0, n_frames, window_frames):
+        core_end = min(core_start + window_frames, n_frames)
+        windows.append(
+            (
+                max(0, core_start - overlap_frames),
+                min(n_frames, core_end + overlap_frames),
+                core_start,
+                core_end,
+            )
+        )
+    return windows
+
+
+def load_rmvpe(model_path: str, thred: float = 0.03):
+    """
+    Returns an RMVPE estimator on the CPU.
+
+    Args:
+        model_path: Path to the RMVPE weights.
+        thred: Voicing threshold.
+    """
+    from rvc.lib.predictors.RMVPE import RMVPE0Predictor
+
+    model = RMVPE0Predictor(model_path, is_half=False, device="cpu")
+    return lambda audio, frames: model.infer_from_audio(audio, thred=thred)
+
+
+def load_fcpe(
+    model_path: str,
+    f0_min: int,
+    f0_max: int,
+    sample_rate: int = 16000,
+    threshold: float = 0.03,
+):
+    """
+    Returns an FCPE estimator on the CPU.
+
+    Args:
+        model_path: Path to the FCPE weights.
+        f0_min: Lowest F0.
+        f0_max: Highest F0.
+        sample_rate: Sample rate of the audio.
+        threshold: Voicing threshold.
+    """
+    from rvc.lib.predictors.FCPE import FCPEF0Predictor
+
+    model = FCPEF0Predictor(
+        model_path,
+        f0_min=f0_min,
+        f0_max=f0_max,
+        dtype=torch.float32,
+        device="cpu",
+        sample_rate=sample_rate,
+        threshold=threshold,
+    )
+    return lambda audio, frames: model.compute_f0(audio, p_len=frames)
+
+
+def load_crepe(model: str = "tiny", hop_length: int = 160, sample_rate: int = 16000):
+    """
+    Returns a torchcrepe estimator on the CPU.
+
+    Args:
+        model: "full" or "tiny".
+        hop_length: Samples per frame.
+        sample_rate: Sample rate of the audio.
+    """
+    import torchcrepe
+
+    def estimate(audio, frames):
+        pitch = torchcrepe.predict(
+            torch.from_numpy(audio)[None].float(),
+            sample_rate,
+            hop_length,
+            50,
+            1100,
+            model,
+            batch_size=512,
+            device="cpu",
+            pad=True,
+        )
+        return pitch[0].numpy()
+
+    return estimate
+
+
+def load_zero_crossing(hop_length: int = 160):
+    """
+    Returns the zero crossing estimator, see zero_crossing_f0.
+
+    Args:
+        hop_length: Samples per frame.
+    """
+    return lambda audio, frames: zero_crossing_f0(audio, frames, hop_length)
+
+
+def _init_worker(threads, loader, loader_args):
+    global _estimate
+    init_cpu_worker(threads)
+    _estimate = loader(*loader_args)
+
+
+def _run_window(audio, frames):
+    return np.asarray(_estimate(audio, frames))
+
+
+def get_worker_count(workers: int = None, threads: int = 1, cores: int = None) -> int:
+    """
+    Returns how many workers of `threads` threads fit on the cores, at most `workers`.
+
+    Args:
+        workers: Wanted number of workers, as many as fit by default.
+        threads: Threads of every worker.
+        cores: Cores to use, the ones this process may run on by default.
+    """
+    fitting = max(1, (cores or len(get_cpu_cores())) // threads)
+    return min(workers, fitting) if workers else fitting
+
+
+def get_worker_pool(estimator: tuple, workers: int, threads: int):
+    """
+    Returns a pool of spawned worker processes that each build the estimator once, limited to
+    `threads` torch, OpenMP and BLAS threads. The pool is kept for the next call with the same
+    estimator and layout, the pool of a different one is terminated.
+
+    Args:
+        estimator: A picklable (loader, args) pair, loader(*args) returns the estimate function.
+        workers: Number of worker processes.
+        threads: Threads of every worker.
+    """
+    global _pool, _pool_key
+    key = (estimator, workers, threads)
+    with _pool_lock:
+        if _pool_key != key:
+            if _pool is not None:
+                _pool.terminate()
+                _pool = None
+            # forked workers hang on the OpenMP pool of a parent that already ran torch
+            with worker_thread_environment(threads):
+                _pool = mp.get_context("spawn").Pool(
+                    workers, _init_worker, (threads, *estimator)
+                )
+            _pool_key = key
+        return _pool
+
+
+def parallel_f0(
+    estimator: tuple,
+    x: np.ndarray,
+    n_frames: int,
+    hop_length: int = 160,
+    workers: int = None,
+    threads: int = 1,
+    cores: int = None,
+    window_seconds: float = 20.0,
+    overlap_seconds: float = 1.0,
+    sample_rate: int = 16000,
+) -> np.ndarray:
+    """
+    Estimates an F0 contour on overlapping windows in worker processes and stitches the windows
+    at the midpoints of their overlaps. Every worker is limited to `threads` threads and at most
+    `cores // threads` of them run, so they never use more threads than there are cores.
+
+    Args:
+        estimator: A picklable (loader, args) pair, loader(*args) returns a function called with
+            a window of audio and its number of frames, returning the window's contour with
+            frame i centered on sample i * hop_length of the window.
+        x: The input audio signal as a NumPy array.
+        n_frames: Number of frames of the stitched contour.
+        hop_length: Samples per frame.
+        workers: Number of worker processes, as many as fit on the cores by default.
+        threads: Threads of every worker.
+        cores: Cores to use, the ones this process may run on by default.
+        window_seconds: Length of the core of each window.
+        overlap_seconds: Context added on each side of a core, half the overlap of two windows.
+        sample_rate: Sample rate of `x`.
+    """
+    workers = get_worker_count(workers, threads, cores)
+    window_frames = max(1, int(window_seconds * sample_rate / hop_length))
+    overlap_frames = int(overlap_seconds * sample_rate / hop_length)
+    windows = split_windows(n_frames, window_frames, overlap_frames)
+
+    tasks = []
+    for start, end, _, _ in windows:
+        # the last window keeps the samples after its final frame
+        stop = len(x) if end == n_frames else end * hop_length
+        tasks.append((x[start * hop_length : stop], end - start))
+    pool = get_worker_pool(estimator, workers, threads)
+    cores_f0 = []
+    for (start, _, core_start, core_end), f0 in zip(
+        windows, pool.starmap(_run_window, tasks)
+    ):
+        core = f0[core_start - start : core_end - start]
+        if len(core) < core_end - core_start:
+            core = np.pad(core, (0, core_end - core_start - len(core)), mode="edge")
+        cores_f0.append(core)
+    return np.concatenate(cores_f0)
+
+
+def zero_crossing_f0(
+    x: np.ndarray,
+    n_frames: int,
+    hop_length: int = 160,
+    half_window: int = 512,
+    sample_rate: int = 16000,
+) -> np.ndarray:
+    """
+    A crude F0 estimate from the zero crossings around every frame, each frame only depends
+    on the `half_window` samples on either side of its center.
+
+    Args:
+        x: The input audio signal as a NumPy array.
+        n_frames: Number of frames, frame i is centered on sample i * hop_length.
+        hop_length: Samples per frame.
+        half_window: Samples counted on each side of a frame center.
+        sample_rate: Sample rate of `x`.
+    """
+    crossings = np.abs(np.diff(np.signbit(x).astype(np.int8)))
+    cumulative = np.concatenate([[0], np.cumsum(crossings)])
+    centers = np.arange(n_frames) * hop_length
+    ends = np.clip(centers + half_window, 0, len(crossings))
+    starts = np.clip(centers - half_window, 0, len(crossings))
+    return (cumulative[ends] - cumulative[starts]) * sample_rate / (4 * half_window)
+
+
+def check_stitching(seconds: float = 150.0, workers: int = None, hop_length: int = 160):
+    """
+    Checks that the windowed contour of an estimator whose frames see less than the window
+    overlap equals its whole-signal contour frame for frame, raising a ValueError otherwise.
+
+    Args:
+        seconds: Length of the synthetic signal, several windows long.
+        workers: Number of worker processes.
+        hop_length: Samples per frame.
+    """
+    from rvc.infer.benchmark import generate_voiced_audio
+
+    x = generate_voiced_audio(seconds, 16000)
+    n_frames = len(x) // hop_length + 1
+    whole = zero_crossing_f0(x, n_frames, hop_length)
+    stitched = parallel_f0(
+        (load_zero_crossing, (hop_length,)), x, n_frames, hop_length, workers=workers
+    )
+    if stitched.shape != whole.shape:
+        raise ValueError(
+            f"Stitched contour has {stitched.shape[0]} frames, expected {whole.shape[0]}."
+        )
+    mismatches = np.flatnonzero(stitched != whole)
+    if mismatches.size:
+        raise ValueError(
+            f"Stitched contour differs from the whole-signal one in {mismatches.size} frames, first at frame {mismatches[0]}."
+        )
+    return {"seconds": seconds, "frames": int(n_frames), "mismatched_frames": 0}
+
+
+def benchmark(
+    seconds: float = 120.0,
+    f0_method: str = "rmvpe",
+    workers: int = None,
+    threads: int = 1,
+):
+    """
+    Compares the whole-file contour of a synthetic signal, estimated with every core, with the
+    windowed one, and their run times. The worker pool is started before the timed run.
+
+    RMVPE and FCPE are randomly initialized, so for them only the timing and the stitching agreement
+    are meaningful, crepe uses its released tiny model.
+
+    Args:
+        seconds: Length of the signal.
+        f0_method: "rmvpe", "fcpe" or "crepe".
+        workers: Number of worker processes.
+        threads: Threads of every worker.
+    """
+    import tempfile
+    from rvc.infer.benchmark import write_random_predictors, generate_voiced_audio
+
+    x = generate_voiced_audio(seconds, 16000)
+    hop = 160
+    cores = len(get_cpu_cores())
+    workers = get_worker_count(workers, threads)
+    with tempfile.TemporaryDirectory() as directory:
+        rmvpe_path, fcpe_path = write_random_predictors(directory)
+        if f0_method == "rmvpe":
+            estimator = (load_rmvpe, (rmvpe_path,))
+            n_frames = len(x) // hop + 1
+        elif f0_method == "fcpe":
+            estimator = (load_fcpe, (fcpe_path, 50, 1100))
+            n_frames = len(x) // hop
+        else:
+            estimator = (load_crepe, ("tiny", hop))
+            n_frames = len(x) // hop + 1
+
+        torch.set_num_threads(cores)
+        estimate = estimator[0](*estimator[1])
+        start_time = time.perf_counter()
+        whole = np.asarray(estimate(x, n_frames))[:n_frames]
+        whole_time = time.perf_counter() - start_time
+        # start the workers and load their models outside the timed run
+        pool = get_worker_pool(estimator, workers, threads)
+        pool.starmap(_run_window, [(x[: 16000 * 2], 2 * 16000 // hop + 1)] * workers)
+        start_time = time.perf_counter()
+        stitched = parallel_f0(
+            estimator, x, n_frames, hop, workers=workers, threads=threads
+        )
+        parallel_time = time.perf_counter() - start_time
+
+    voiced = (whole > 0) & (stitched > 0)
+    cents = 1200 * np.abs(np.log2(stitched[voiced] / whole[voiced]))
+    return {
+        "seconds": seconds,
+        "f0_method": f0_method,
+        "cores": cores,
+        "workers": workers,
+        "threads": threads,
+        "whole_seconds": whole_time,
+        "parallel_seconds": parallel_time,
+        "speedup": whole_time / parallel_time,
+        "frames": int(n_frames),
+        "voicing_agreement": float(np.mean((whole > 0) == (stitched > 0))),
+        "median_cents_difference": float(np.median(cents)) if cents.size else 0.0,
+        "p99_cents_difference": (
+            float(np.percentile(cents, 99)) if cents.size else 0.0
+        ),
+    }
+
+
+if __name__ == "__main__":
+    import json
+
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        print(json.dumps(check_stitching(), indent=2))
+        sys.exit(0)
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 120.0
+    f0_method = sys.argv[2] if len(sys.argv) > 2 else "rmvpe"
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    threads = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    print(json.dumps(benchmark(seconds, f0_method, workers, threads), indent=2))
@@ -0,0 +1,394 @@
+import os
+import sys
+import time
+import torch
+import numpy as np
+import torch.nn.functional as F
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+
+def get_smoothing_filter(n_grad_freq: int, n_grad_time: int):
+    """
+    Returns the triangular mask smoothing kernel used by noisereduce, split into its
+    frequency and time factors so it can be applied as two 1D convolutions.
+
+    Args:
+        n_grad_freq: Number of frequency bins to smooth over on each side.
+        n_grad_time: Number of frames to smooth over on each side.
+    """
+
+    def triangle(n):
+        return torch.cat(
+            [
+                torch.linspace(0, 1, n + 2, dtype=torch.float64)[:-1],
+                torch.linspace(1, 0, n + 2, dtype=torch.float64),
+            ]
+        )[1:-1]
+
+    freq_filter, time_filter = triangle(n_grad_freq), triangle(n_grad_time)
+    return (freq_filter / freq_filter.sum()).float(), (
+        time_filter / time_filter.sum()
+    ).float()
+
+
+class SpectralGate:
+    """
+    Non-stationary spectral gating on torch STFTs, following noisereduce's default algorithm.
+
+    Each bin is compared to its noise floor, a forward-backward first-order low-pass of the
+    magnitude over time; the sigmoid mask is smoothed and blended with `prop_decrease`.
+    Signals are processed as one zero-padded batch, and long inputs block by block with the
+    forward noise floor carried from one block to the next.
+
+    Up to 600000 samples the output matches noisereduce to float precision. noisereduce
+    gates longer inputs in independent chunks of that length, restarting the noise floor at
+    every chunk, while this gate carries it across the whole signal: on a 60 s input the
+    outputs differ by about -22 dB overall and -16 dB near noisereduce's chunk boundaries.
+    """
+
+    def __init__(
+        self,
+        sr: int,
+        n_fft: int = 1024,
+        win_length: int = None,
+        hop_length: int = None,
+        time_constant_s: float = 2.0,
+        freq_mask_smooth_hz: float = 500,
+        time_mask_smooth_ms: float = 50,
+        thresh_n_mult: float = 2,
+        sigmoid_slope: float = 10,
+        padding: int = 30000,
+        block_seconds: float = 30.0,
+        lookahead_seconds: float = 2.0,
+        device=None,
+    ):
+        """
+        Initializes the spectral gate.
+
+        Args:
+            sr: Sample rate of the signals.
+            n_fft: FFT size.
+            win_length: Window length, n_fft by default.
+            hop_length: Hop length, win_length // 4 by default.
+            time_constant_s: Time constant of the noise floor estimate in seconds.
+            freq_mask_smooth_hz: Frequency range the mask is smoothed over.
+            time_mask_smooth_ms: Time range the mask is smoothed over.
+            thresh_n_mult: How far above the noise floor, relative to it, a bin counts as signal.
+            sigmoid_slope: Slope of the sigmoid turning that distance into a mask.
+            padding: Zero samples added on both sides of each signal, as noisereduce pads its chunks.
+            block_seconds: Length of the blocks long inputs are processed in.
+            lookahead_seconds: Context after each block used by the backward noise floor pass.
+            device: Device to run on, CUDA when available by default.
+        """
+        self.sr = sr
+        self.n_fft = n_fft
+        self.win_length = win_length or n_fft
+        self.hop_length = hop_length or self.win_length // 4
+        self.thresh_n_mult = thresh_n_mult
+        self.sigmoid_slope = sigmoid_slope
+        self.padding = padding
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+
+        t_frames = time_constant_s * sr / float(self.hop_length)
+        self.b = (np.sqrt(1 + 4 * t_frames**2) - 1) / (2 * t_frames**2)
+        # (1 - b) ** -scan_chunk has to stay well inside float64 range
+        self.scan_chunk = int(max(1, min(512, 30 / -np.log(1 - self.b))))
+
+        n_grad_freq = max(1, int(freq_mask_smooth_hz / (sr / (n_fft / 2))))
+        n_grad_time = max(
+            1, int(time_mask_smooth_ms / ((self.hop_length / sr) * 1000))
+        )
+        self.smoothing_filter = None
+        if n_grad_freq > 1 or n_grad_time > 1:
+            freq_filter, time_filter = get_smoothing_filter(n_grad_freq, n_grad_time)
+            self.smoothing_filter = (
+                freq_filter.view(1, 1, -1, 1).to(self.device),
+                time_filter.view(1, 1, 1, -1).to(self.device),
+            )
+
+        window = torch.hann_window(self.win_length, dtype=torch.float32)
+        pad = (n_fft - self.win_length) // 2
+        self.window = F.pad(window, (pad, n_fft - self.win_length - pad)).to(
+            self.device
+        )
+        # frames on each side of a block needed by the mask smoothing and the overlap-add
+        self.context = n_grad_time + n_fft // self.hop_length
+        self.block_frames = max(1, int(block_seconds * sr / self.hop_length))
+        self.lookahead_frames = int(lookahead_seconds * sr / self.hop_length)
+
+    def _smooth_forward(self, magnitude, state, lengths):
+        """
+        First-order low-pass over time, started from `state` or from the first frame.
+
+        Args:
+            magnitude: Magnitudes of shape (batch, bins, frames).
+            state: Output of the previous frame, of shape (batch, bins), or None.
+            lengths: Valid frames per signal, the output is held after the last one.
+        """
+        # scan within chunks of frames in closed form, then carry the state across chunks
+        b, a = self.b, 1.0 - self.b
+        batch, bins, n_frames = magnitude.shape
+        chunk = self.scan_chunk
+        n_chunks = -(-n_frames // chunk)
+        x = F.pad(magnitude.double(), (0, n_chunks * chunk - n_frames))
+        x = x.view(batch, bins, n_chunks, chunk)
+        powers = a ** torch.arange(chunk, dtype=torch.float64, device=x.device)
+        scanned = torch.cumsum(x * (b / powers), dim=3) * powers
+        state = magnitude[:, :, 0] if state is None else state
+        state = state.double()[:, :, None]
+        for i in range(n_chunks):
+            scanned[:, :, i] += (a * powers) * state
+            state = scanned[:, :, i, -1:]
+        smoothed = scanned.view(batch, bins, -1)[:, :, :n_frames].float()
+        # hold the last valid value over the padding of shorter signals
+        index = torch.minimum(
+            torch.arange(n_frames, device=x.device)[None],
+            (lengths - 1).clamp_min(0)[:, None],
+        )
+        return torch.gather(smoothed, 2, index[:, None].expand_as(smoothed))
+
+    @staticmethod
+    def _reverse(x, lengths):
+        """
+        Reverses the valid frames of each signal in place of the time axis, keeping the padding last.
+
+        Args:
+            x: Tensor of shape (batch, bins, frames).
+            lengths: Valid frames per signal.
+        """
+        frames = torch.arange(x.shape[2], device=x.device)
+        index = torch.where(
+            frames[None] < lengths[:, None], lengths[:, None] - 1 - frames[None], frames[None]
+        )
+        return torch.gather(x, 2, index[:, None].expand_as(x))
+
+    def _mask(self, magnitude, forward, lengths, prop_decrease):
+        """
+        Computes the blended gating mask of a block.
+
+        Args:
+            magnitude: Magnitudes of shape (batch, bins, frames).
+            forward: Forward pass of the noise floor over the same frames.
+            lengths: Valid frames per signal in the block.
+            prop_decrease: Proportion to reduce the noise by, of shape (batch, 1, 1).
+        """
+        # the backward pass starts from the last valid forward value, as filtfilt does
+        lengths = lengths.clamp_min(1)
+        noise_floor = self._reverse(
+            self._smooth_forward(self._reverse(forward, lengths), None, lengths),
+            lengths,
+        ).clamp_min(1e-10)
+        above = (magnitude - noise_floor) / noise_floor
+        mask = torch.sigmoid((above - self.thresh_n_mult) * self.sigmoid_slope)
+        if self.smoothing_filter is not None:
+            freq_filter, time_filter = self.smoothing_filter
+            mask = F.conv2d(
+                mask.unsqueeze(1), freq_filter, padding=(freq_filter.shape[2] // 2, 0)
+            )
+            mask = F.conv2d(
+                mask, time_filter, padding=(0, time_filter.shape[3] // 2)
+            ).squeeze(1)
+        return mask * prop_decrease + (1.0 - prop_decrease)
+
+    @torch.no_grad()
+    def __call__(self, signals, prop_decrease=1.0):
+        """
+        Reduces the noise of a batch of signals.
+
+        Args:
+            signals: List of 1D arrays, or a single 1D array.
+            prop_decrease: Proportion to reduce the noise by (1.0 = 100%), one value or one per signal.
+        """
+        single = isinstance(signals, np.ndarray) and signals.ndim == 1
+        signals = [signals] if single else list(signals)
+        dtypes = [np.asarray(signal).dtype for signal in signals]
+        batch = len(signals)
+        n_fft, hop = self.n_fft, self.hop_length
+
+        # center the frames on zero padding, like scipy.signal.stft
+        offset = n_fft // 2 + self.padding
+        sample_lengths = torch.tensor(
+            [len(signal) + 2 * self.padding for signal in signals]
+        )
+        n_frames = int(sample_lengths.max()) // hop + 1
+        padded = torch.zeros(batch, (n_frames - 1) * hop + n_fft)
+        for i, signal in enumerate(signals):
+            padded[i, offset : offset + len(signal)] = torch.as_tensor(
+                np.asarray(signal, dtype=np.float32)
+            )
+        padded = padded.to(self.device)
+        frame_lengths = (sample_lengths // hop + 1).to(self.device)
+        prop_decrease = torch.as_tensor(
+            np.broadcast_to(np.asarray(prop_decrease, dtype=np.float32), (batch,)).copy(),
+            device=self.device,
+        )[:, None, None]
+
+        output = torch.zeros(batch, padded.shape[1], device=self.device)
+        state = None
+        for start in range(0, n_frames, self.block_frames):
+            end = min(start + self.block_frames, n_frames)
+            first = max(0, start - self.context)
+            last = min(n_frames, end + self.context + self.lookahead_frames)
+
+            frames = padded[:, first * hop : (last - 1) * hop + n_fft]
+            frames = frames.unfold(1, n_fft, hop) * self.window
+            spectrum = torch.fft.rfft(frames, dim=2).transpose(1, 2)
+            magnitude = spectrum.abs()
+
+            lengths = (frame_lengths - first).clamp(0, last - first)
+            forward = self._smooth_forward(magnitude, state, lengths)
+            # carry the noise floor of the frame before the next block's context
+            next_first = end - self.context
+            if end < n_frames:
+                state = forward[:, :, next_first - 1 - first]
+
+            mask = self._mask(magnitude, forward, lengths, prop_decrease)
+            # frames past the end of a shorter signal are dropped, as in a lone call
+            valid = (
+                torch.arange(last - first, device=self.device)[None] < lengths[:, None]
+            ).float()[:, None]
+            frames = torch.fft.irfft((spectrum * mask).transpose(1, 2), n=n_fft, dim=2)
+            frames = (frames * self.window).transpose(1, 2) * valid
+
+            # overlap-add, normalized by the summed squared window of each signal
+            n_samples = (last - first - 1) * hop + n_fft
+            block = F.fold(
+                frames, (1, n_samples), kernel_size=(1, n_fft), stride=(1, hop)
+            ).view(batch, n_samples)
+            envelope = F.fold(
+                (self.window**2)[None, :, None] * valid,
+                (1, n_samples),
+                kernel_size=(1, n_fft),
+                stride=(1, hop),
+            ).view(batch, n_samples)
+            block = block / envelope.clamp_min(1e-8)
+            # the last block also keeps the tail of its final frame
+            stop = end * hop if end < n_frames else padded.shape[1]
+            output[:, start * hop : stop] = block[
+                :, (start - first) * hop : stop - first * hop
+            ]
+
+        output = output[:, offset:].cpu().numpy()
+        results = [
+            output[i, : len(signal)].astype(dtypes[i])
+            for i, signal in enumerate(signals)
+        ]
+        return results[0] if single else results
+
+
+def reduce_noise(y, sr, prop_decrease=1.0, device=None, **kwargs):
+    """
+    Reduces the noise of one signal, a drop-in replacement for noisereduce.reduce_noise.
+    On the CPU noisereduce itself is faster, so it runs there unless SpectralGate parameters
+    are given.
+
+    Args:
+        y: The audio data as a 1D array.
+        sr: The sample rate of the audio data.
+        prop_decrease: Proportion to reduce the noise by (1.0 = 100%).
+        device: Device to run on, CUDA when available by default.
+        **kwargs: Further SpectralGate parameters.
+    """
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    if torch.device(device).type == "cpu" and not kwargs:
+        import noisereduce as nr
+
+        return nr.reduce_noise(y=y, sr=sr, prop_decrease=prop_decrease)
+    return SpectralGate(sr, device=device, **kwargs)(np.asarray(y), prop_decrease)
+
+
+def reduce_noise_batch(signals, sr, prop_decrease=1.0, device=None, **kwargs):
+    """
+    Reduces the noise of several signals sharing a sample rate in one batch. On the CPU,
+    where batching does not make up for the torch gate being slower than noisereduce, the
+    signals go through reduce_noise one at a time instead.
+
+    Args:
+        signals: List of 1D arrays.
+        sr: The sample rate of the audio data.
+        prop_decrease: Proportion to reduce the noise by, one value or one per signal.
+        device: Device to run on, CUDA when available by default.
+        **kwargs: Further SpectralGate parameters.
+    """
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    if torch.device(device).type == "cpu" and not kwargs:
+        prop_decreases = np.broadcast_to(np.asarray(prop_decrease), (len(signals),))
+        return [
+            reduce_noise(signal, sr, float(strength), device)
+            for signal, strength in zip(signals, prop_decreases)
+        ]
+    return SpectralGate(sr, device=device, **kwargs)(signals, prop_decrease)
+
+
+def benchmark(seconds=10.0, batch_size=8, sr=40000, prop_decrease=0.7, repeats=3):
+    """
+    Compares run time and output of noisereduce with the torch spectral gate on CPU.
+
+    Args:
+        seconds: Length of each synthetic signal.
+        batch_size: Number of signals in the batched run.
+        sr: Sample rate of the signals.
+        prop_decrease: Proportion to reduce the noise by.
+        repeats: Timed runs, the fastest is reported.
+    """
+    import noisereduce as nr
+
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sr)) / sr
+    signals = []
+    for i in range(batch_size):
+        f0 = 120 + 20 * i + 30 * np.sin(2 * np.pi * 0.3 * t)
+        phase = 2 * np.pi * np.cumsum(f0) / sr
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 10))
+        envelope = np.clip(np.sin(2 * np.pi * 2 * t + i), 0, None)
+        noise = 0.05 * rng.standard_normal(t.shape[0])
+        signals.append((0.3 * voiced * envelope + noise).astype(np.float32))
+
+    def fastest(function):
+        timings = []
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - start_time)
+        return min(timings), result
+
+    gate = SpectralGate(sr, device="cpu")
+    nr_time, reference = fastest(
+        lambda: nr.reduce_noise(y=signals[0], sr=sr, prop_decrease=prop_decrease)
+    )
+    single_time, single = fastest(lambda: gate(signals[0], prop_decrease))
+    nr_batch_time, _ = fastest(
+        lambda: [
+            nr.reduce_noise(y=signal, sr=sr, prop_decrease=prop_decrease)
+            for signal in signals
+        ]
+    )
+    batch_time, _ = fastest(lambda: gate(signals, prop_decrease))
+    error = reference - single
+    report = {
+        "seconds": seconds,
+        "batch_size": batch_size,
+        "sample_rate": sr,
+        "torch_threads": torch.get_num_threads(),
+        "noisereduce_seconds": nr_time,
+        "spectral_gate_seconds": single_time,
+        "noisereduce_batch_seconds": nr_batch_time,
+        "spectral_gate_batch_seconds": batch_time,
+        "speedup": nr_time / single_time,
+        "batch_speedup": nr_batch_time / batch_time,
+        "relative_difference_db": float(
+            10 * np.log10(np.sum(error**2) / np.sum(reference**2) + 1e-20)
+        ),
+    }
+    return report
+
+
+if __name__ == "__main__":
+    import json
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    sr = int(sys.argv[3]) if len(sys.argv) > 3 else 40000
+    print(json.dumps(benchmark(seconds, batch_size, sr), indent=2))
@@ -54,3 +54,26 @@ def merge_audio(audio_segments, intervals, sr_orig, sr_new):
         merged_audio = np.concatenate((merged_audio, silence, audio_segments[i]))
 
     return merged_audio
+
+
+def crossfade_audio(audio_segments, fade_length):
+    """
+    Joins consecutive audio segments, fading each one out while the next fades in.
+
+    Parameters:
+    - audio_segments (list of np.ndarray): The segments in order.
+    - fade_length (int): Samples the segments overlap by at each join.
+
+    Returns:
+    - np.ndarray: The joined audio signal.
+    """
+    merged_audio = audio_segments[0]
+    for segment in audio_segments[1:]:
+        fade = min(fade_length, len(merged_audio), len(segment))
+        if fade == 0:
+            merged_audio = np.concatenate((merged_audio, segment))
+            continue
+        ramp = np.linspace(0, 1, fade + 2, dtype=merged_audio.dtype)[1:-1]
+        joint = merged_audio[-fade:] * (1 - ramp) + segment[:fade] * ramp
+        merged_audio = np.concatenate((merged_audio[:-fade], joint, segment[fade:]))
+    return merged_audio
@@ -1,29 +1,238 @@
+import io
+import os
+import re
 import sys
+import queue
 import asyncio
-import edge_tts
-import os
+import threading
+import numpy as np
+import soundfile as sf
 
+SENTENCE_END = re.compile(r"(?<=[.!?;。！？；…])\s+|\n+")
+CLAUSE_END = re.compile(r"(?<=[,:，、：])\s+")
 
-async def main():
-    # Parse command line arguments
-    tts_file = str(sys.argv[1])
-    text = str(sys.argv[2])
-    voice = str(sys.argv[3])
-    rate = int(sys.argv[4])
-    output_file = str(sys.argv[5])
 
-    rates = f"+{rate}%" if rate >= 0 else f"{rate}%"
+def read_tts_text(tts_file: str, text: str) -> str:
+    """
+    Returns the text of `tts_file` when it exists, `text` otherwise.
+
+    Args:
+        tts_file: Path to a text file, may be empty.
+        text: Text used when there is no file.
+    """
     if tts_file and os.path.exists(tts_file):
-        text = ""
         try:
             with open(tts_file, "r", encoding="utf-8") as file:
-                text = file.read()
+                return file.read()
         except UnicodeDecodeError:
             with open(tts_file, "r") as file:
-                text = file.read()
-    await edge_tts.Communicate(text, voice, rate=rates).save(output_file)
-    # print(f"TTS with {voice} completed. Output TTS file: '{output_file}'")
+                return file.read()
+    return text
+
+
+def split_sentences(text: str, min_chars: int = 20, max_chars: int = 300) -> list:
+    """
+    Splits a text into sentences for incremental synthesis.
+
+    Sentences shorter than `min_chars` are joined with the next one, since every request
+    has a fixed cost, and sentences longer than `max_chars` are split at clauses or words.
+
+    Args:
+        text: The text to split.
+        min_chars: Shortest piece synthesized on its own.
+        max_chars: Longest piece synthesized on its own.
+    """
+    pieces = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        while len(sentence) > max_chars:
+            cut = max(
+                (
+                    match.start()
+                    for match in CLAUSE_END.finditer(sentence, 0, max_chars)
+                ),
+                default=sentence.rfind(" ", 0, max_chars),
+            )
+            if cut <= 0:
+                cut = max_chars
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        pieces.append(sentence)
+
+    sentences = []
+    for piece in pieces:
+        if (
+            sentences
+            and len(sentences[-1]) < min_chars
+            and len(sentences[-1]) + len(piece) < max_chars
+        ):
+            sentences[-1] = f"{sentences[-1]} {piece}"
+        else:
+            sentences.append(piece)
+    return sentences
+
+
+class TTSBackend:
+    """
+    Text-to-speech engine running in the current process.
+
+    Subclasses implement `synthesize`, returning the audio of a text and its sample rate.
+    """
+
+    name = None
+
+    def synthesize(self, text: str):
+        raise NotImplementedError
+
+
+class EdgeTTSBackend(TTSBackend):
+    """
+    Microsoft Edge online text-to-speech through the edge_tts package.
+    """
+
+    name = "edge"
+
+    def __init__(self, voice: str, rate: int = 0):
+        """
+        Initializes the backend.
+
+        Args:
+            voice: Name of the edge_tts voice.
+            rate: Speaking rate change in percent.
+        """
+        import edge_tts
+
+        self.edge_tts = edge_tts
+        self.voice = voice
+        self.rate = f"+{rate}%" if rate >= 0 else f"{rate}%"
+
+    async def _stream(self, text: str) -> bytes:
+        data = bytearray()
+        communicate = self.edge_tts.Communicate(text, self.voice, rate=self.rate)
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                data.extend(chunk["data"])
+        return bytes(data)
+
+    def synthesize(self, text: str):
+        # the MP3 stream is decoded in memory, no intermediate file is written
+        data = asyncio.run(self._stream(text))
+        audio, sr = sf.read(io.BytesIO(data), dtype="float32")
+        if audio.ndim > 1:
+            audio = audio.mean(axis=1)
+        return audio, sr
+
+
+class StubTTSBackend(TTSBackend):
+    """
+    Offline stand-in producing a deterministic voiced tone per word, for testing without network access.
+    """
+
+    name = "stub"
+
+    def __init__(self, voice: str = None, rate: int = 0, sample_rate: int = 24000):
+        """
+        Initializes the backend.
+
+        Args:
+            voice: Ignored, accepted for compatibility with the other backends.
+            rate: Speaking rate change in percent.
+            sample_rate: Sample rate of the generated audio.
+        """
+        self.sample_rate = sample_rate
+        self.word_seconds = 0.3 / (1 + rate / 100)
+
+    def synthesize(self, text: str):
+        sr = self.sample_rate
+        words = text.split() or [""]
+        word_length = int(self.word_seconds * sr)
+        t = np.arange(word_length) / sr
+        envelope = np.sin(np.pi * np.arange(word_length) / word_length) ** 2
+        audio = []
+        for word in words:
+            f0 = 100 + sum(map(ord, word)) % 120
+            phase = 2 * np.pi * f0 * t
+            voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+            audio.append(0.3 * voiced * envelope)
+            audio.append(np.zeros(word_length // 4))
+        return np.concatenate(audio).astype(np.float32), sr
+
+
+TTS_BACKENDS = {
+    EdgeTTSBackend.name: EdgeTTSBackend,
+    StubTTSBackend.name: StubTTSBackend,
+}
+
+
+def get_tts_backend(name: str, voice: str = None, rate: int = 0) -> TTSBackend:
+    """
+    Creates a text-to-speech backend by name.
+
+    Args:
+        name: One of TTS_BACKENDS.
+        voice: Voice used by the backend.
+        rate: Speaking rate change in percent.
+    """
+    if name not in TTS_BACKENDS:
+        raise ValueError(
+            f"Unknown TTS backend '{name}', expected one of {list(TTS_BACKENDS)}"
+        )
+    return TTS_BACKENDS[name](voice, rate)
+
+
+def synthesize_sentences(backend: TTSBackend, sentences: list, prefetch: int = 1):
+    """
+    Yields the audio of each sentence while the following ones are synthesized in a background thread.
+
+    Args:
+        backend: The text-to-speech backend.
+        sentences: Sentences in reading order.
+        prefetch: Number of synthesized sentences kept ready ahead of the consumer.
+    """
+    results = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for sentence in sentences:
+                if stop.is_set():
+                    return
+                results.put(("audio", sentence, *backend.synthesize(sentence)))
+        except Exception as error:
+            results.put(("error", error, None, None))
+            return
+        results.put(("done", None, None, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, value, audio, sr = results.get()
+            if kind == "error":
+                raise value
+            if kind == "done":
+                return
+            yield value, audio, sr
+    finally:
+        # unblock the producer when the consumer stops early
+        stop.set()
+        while thread.is_alive():
+            try:
+                results.get_nowait()
+            except queue.Empty:
+                thread.join(0.05)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    tts_file = str(sys.argv[1])
+    text = str(sys.argv[2])
+    voice = str(sys.argv[3])
+    rate = int(sys.argv[4])
+    output_file = str(sys.argv[5])
+    backend_name = str(sys.argv[6]) if len(sys.argv) > 6 else "edge"
+
+    backend = get_tts_backend(backend_name, voice, rate)
+    audio, sr = backend.synthesize(read_tts_text(tts_file, text))
+    sf.write(output_file, audio, sr)
@@ -8,7 +8,10 @@ import wget
 import subprocess
 from pydub import AudioSegment
 import tempfile
+import torch
 from torch import nn
+from torch.nn.utils.rnn import pad_sequence
+from torch.overrides import TorchFunctionMode
 
 import logging
 from transformers import HubertModel
@@ -29,11 +32,93 @@ base_path = os.path.join(now_dir, "rvc", "models", "formant", "stftpitchshift")
 stft = base_path + ".exe" if sys.platform == "win32" else base_path
 
 
+class OwnGenerator(TorchFunctionMode):
+    """
+    Makes the CPU random functions called without a generator draw from a given one instead
+    of the default generator. Torch function modes are per thread, so the random numbers
+    other threads draw at the same time are left alone.
+    """
+
+    RANDOM_FUNCTIONS = (torch.rand, torch.randn, torch.randint, torch.randperm)
+
+    def __init__(self, generator):
+        super().__init__()
+        self.generator = generator
+
+    def __torch_function__(self, func, types, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        if (
+            func in self.RANDOM_FUNCTIONS
+            and kwargs.get("generator") is None
+            and torch.device(kwargs.get("device") or "cpu").type == "cpu"
+        ):
+            kwargs["generator"] = self.generator
+        return func(*args, **kwargs)
+
+
 class HubertModelWithFinalProj(HubertModel):
     def __init__(self, config):
         super().__init__(config)
         self.final_proj = nn.Linear(config.hidden_size, config.classifier_proj_size)
 
+    def forward(self, *args, **kwargs):
+        # the encoder draws its layer drop probabilities even in eval mode, from a generator
+        # of its own they leave the random numbers of the synthesis unchanged
+        with OwnGenerator(torch.Generator().manual_seed(0)):
+            return super().forward(*args, **kwargs)
+
+    def forward_batch(self, audios, final_proj=False):
+        """
+        Returns the features of 16 kHz signals of different lengths, run as one padded batch.
+
+        The padding is masked in the attention and in the group norm of the first
+        convolution, so every signal gets the features it would get on its own.
+
+        Args:
+            audios (list): 1-D float tensors.
+            final_proj (bool, optional): Apply the final projection, as v1 models expect.
+        """
+        parameter = next(self.parameters())
+        lengths = [audio.shape[-1] for audio in audios]
+        waves = pad_sequence(list(audios), batch_first=True)
+        waves = waves.to(parameter.device, parameter.dtype)
+        attention_mask = (
+            torch.arange(waves.shape[1], device=waves.device)[None]
+            < torch.tensor(lengths, device=waves.device)[:, None]
+        ).long()
+
+        hook = None
+        first_layer = self.feature_extractor.conv_layers[0]
+        if isinstance(getattr(first_layer, "layer_norm", None), nn.GroupNorm):
+            conv = first_layer.conv
+            conv_lengths = [
+                (length - conv.kernel_size[0]) // conv.stride[0] + 1
+                for length in lengths
+            ]
+
+            def masked_group_norm(module, inputs, output):
+                output = torch.zeros_like(inputs[0])
+                for i, length in enumerate(conv_lengths):
+                    output[i, :, :length] = nn.functional.group_norm(
+                        inputs[0][i : i + 1, :, :length],
+                        module.num_groups,
+                        module.weight,
+                        module.bias,
+                        module.eps,
+                    )[0]
+                return output
+
+            hook = first_layer.layer_norm.register_forward_hook(masked_group_norm)
+        try:
+            feats = self(waves, attention_mask=attention_mask)["last_hidden_state"]
+        finally:
+            if hook is not None:
+                hook.remove()
+        if final_proj:
+            feats = self.final_proj(feats)
+        feat_lengths = self._get_feat_extract_output_lengths(torch.tensor(lengths))
+        return [feats[i, :length] for i, length in enumerate(feat_lengths.tolist())]
+
 
 def load_audio(file, sample_rate):
     try:
@@ -0,0 +1,377 @@
+import gc
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import torch
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+# keys of the non-tensor fields in the safetensors header
+STRUCTURE_KEY = "rvc_structure"
+FORMAT_KEY = "rvc_format"
+FORMAT_VERSION = "1"
+
+
+def _encode(value, path, tensors):
+    if torch.is_tensor(value):
+        name = "/".join(path)
+        tensors[name] = value
+        return {"__tensor__": name}
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {
+                "__dict__": {
+                    key: _encode(item, path + [key], tensors)
+                    for key, item in value.items()
+                }
+            }
+        # optimizer states are keyed by parameter index
+        return {
+            "__items__": [
+                [key, _encode(item, path + [str(key)], tensors)]
+                for key, item in value.items()
+            ]
+        }
+    if isinstance(value, tuple):
+        return {
+            "__tuple__": [
+                _encode(item, path + [str(i)], tensors) for i, item in enumerate(value)
+            ]
+        }
+    if isinstance(value, list):
+        return [_encode(item, path + [str(i)], tensors) for i, item in enumerate(value)]
+    return value
+
+
+def _decode(value, tensors):
+    if isinstance(value, list):
+        return [_decode(item, tensors) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "__tensor__" in value:
+        return tensors[value["__tensor__"]] if tensors is not None else None
+    if "__dict__" in value:
+        return {key: _decode(item, tensors) for key, item in value["__dict__"].items()}
+    if "__items__" in value:
+        return {key: _decode(item, tensors) for key, item in value["__items__"]}
+    return tuple(_decode(item, tensors) for item in value["__tuple__"])
+
+
+def save_safetensors(data: dict, path: str):
+    """
+    Saves a voice model or a G/D checkpoint as safetensors, with its non-tensor fields in the header.
+
+    Tensors are stored under their path in the nested dictionaries joined with "/",
+    e.g. "weight/emb_g.weight" or "optimizer/state/0/exp_avg".
+
+    Args:
+        data: The model or checkpoint dictionary as saved in a .pth file.
+        path: Path to the output file.
+    """
+    from safetensors.torch import save_file
+
+    tensors = {}
+    structure = _encode(data, [], tensors)
+    seen = set()
+    for name, tensor in tensors.items():
+        tensor = tensor.detach().cpu().contiguous()
+        # tensors sharing memory have to be written separately
+        key = (tensor.untyped_storage().data_ptr(), tensor.storage_offset())
+        tensors[name] = tensor.clone() if key in seen else tensor
+        seen.add(key)
+    save_file(
+        tensors,
+        path,
+        metadata={
+            FORMAT_KEY: FORMAT_VERSION,
+            STRUCTURE_KEY: json.dumps(structure, default=str),
+        },
+    )
+
+
+def _read_header(file) -> tuple:
+    (header_size,) = struct.unpack("<Q", file.read(8))
+    return json.loads(file.read(header_size)), 8 + header_size
+
+
+def read_safetensors_metadata(path: str) -> dict:
+    """
+    Returns the non-tensor fields of a safetensors model from its header, without touching the weights.
+
+    Args:
+        path: Path to the .safetensors file.
+    """
+    with open(path, "rb") as file:
+        header, _ = _read_header(file)
+    metadata = header.get("__metadata__", {})
+    if STRUCTURE_KEY not in metadata:
+        return {}
+    structure = json.loads(metadata[STRUCTURE_KEY])
+    # leave out the fields holding tensors, such as the weights and the optimizer state
+    return {
+        key: _decode(value, None)
+        for key, value in structure["__dict__"].items()
+        if '"__tensor__"' not in json.dumps(value)
+    }
+
+
+def load_safetensors(path: str) -> dict:
+    """
+    Loads a safetensors model or checkpoint with every tensor mapped from the file.
+
+    The file is mapped copy-on-write, so weights are only read when used and processes
+    loading the same file share its pages while they use the tensors as they are. Copying
+    them into a model's parameters, or converting them to another dtype or device, makes
+    a private copy, so models should assign them with load_state_dict(..., assign=True).
+
+    Args:
+        path: Path to the .safetensors file.
+    """
+    with open(path, "rb") as file:
+        header, data_start = _read_header(file)
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    metadata = header.pop("__metadata__", {})
+    tensors = {}
+    for name, info in header.items():
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        begin, end = info["data_offsets"]
+        if end == begin:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        tensors[name] = torch.frombuffer(
+            buffer,
+            dtype=dtype,
+            count=(end - begin) // dtype.itemsize,
+            offset=data_start + begin,
+        ).view(info["shape"])
+    if STRUCTURE_KEY not in metadata:
+        # plain safetensors state dict written by other tools
+        return {"weight": tensors, **metadata}
+    return _decode(json.loads(metadata[STRUCTURE_KEY]), tensors)
+
+
+def to_pth_layout(data: dict) -> dict:
+    """
+    Renames weight norm parametrizations to the weight_v/weight_g keys of the .pth files.
+
+    Args:
+        data: The model or checkpoint dictionary.
+    """
+    from rvc.train.utils import replace_keys_in_dict
+
+    return replace_keys_in_dict(
+        replace_keys_in_dict(data, ".parametrizations.weight.original1", ".weight_v"),
+        ".parametrizations.weight.original0",
+        ".weight_g",
+    )
+
+
+def to_parametrizations_layout(data: dict) -> dict:
+    """
+    Renames the weight_v/weight_g keys of the .pth files to weight norm parametrizations.
+
+    Args:
+        data: The model or checkpoint dictionary.
+    """
+    from rvc.train.utils import replace_keys_in_dict
+
+    return replace_keys_in_dict(
+        replace_keys_in_dict(data, ".weight_v", ".parametrizations.weight.original1"),
+        ".weight_g",
+        ".parametrizations.weight.original0",
+    )
+
+
+def load_weights(path: str, pth_layout: bool = False) -> dict:
+    """
+    Loads a voice model or a G/D checkpoint from a .pth or a .safetensors file on the CPU.
+
+    Args:
+        path: Path to the model.
+        pth_layout: Whether safetensors files should be returned with the weight_v/weight_g
+            keys of the .pth files, for code comparing or copying keys between files.
+    """
+    if path.endswith(".safetensors"):
+        data = load_safetensors(path)
+        return to_pth_layout(data) if pth_layout else data
+    return torch.load(path, map_location="cpu")
+
+
+def pth_to_safetensors(pth_path: str, output_path: str = None) -> str:
+    """
+    Converts a .pth voice model or checkpoint to safetensors, returning the output path.
+
+    Args:
+        pth_path: Path to the .pth file.
+        output_path: Path to the output file, next to the input by default.
+    """
+    output_path = output_path or os.path.splitext(pth_path)[0] + ".safetensors"
+    data = torch.load(pth_path, map_location="cpu")
+    save_safetensors(to_parametrizations_layout(data), output_path)
+    return output_path
+
+
+def safetensors_to_pth(safetensors_path: str, output_path: str = None) -> str:
+    """
+    Converts a safetensors voice model or checkpoint back to a .pth file, returning the output path.
+
+    Args:
+        safetensors_path: Path to the .safetensors file.
+        output_path: Path to the output file, next to the input by default.
+    """
+    output_path = output_path or os.path.splitext(safetensors_path)[0] + ".pth"
+    data = to_pth_layout(load_safetensors(safetensors_path))
+    torch.save(data, output_path)
+    return output_path
+
+
+def _memory_usage() -> dict:
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup") as file:
+            for line in file:
+                key, value = line.split(":", 1)
+                if key in ("Rss", "Anonymous"):
+                    usage[key] = int(value.split()[0]) * 1024
+    except OSError:
+        import resource
+
+        usage["Rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return usage
+
+
+def _trim_heap():
+    try:
+        import ctypes
+
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def _setup_synthesizer(data: dict, dtype: torch.dtype):
+    # mirrors VoiceConverter.setup_network on the CPU
+    from rvc.lib.algorithm.synthesizers import Synthesizer
+
+    config = list(data["config"])
+    config[-3] = data["weight"]["emb_g.weight"].shape[0]
+    net_g = Synthesizer(
+        *config,
+        use_f0=data.get("f0", 1),
+        text_enc_hidden_dim=768 if data.get("version", "v1") == "v2" else 256,
+        is_half=dtype == torch.float16,
+        vocoder=data.get("vocoder", "HiFi-GAN"),
+    )
+    del net_g.enc_q
+    net_g.load_state_dict(data["weight"], strict=False, assign=True)
+    return net_g.eval().to(dtype)
+
+
+def _measure(path: str, touch: bool, setup_dtype, connection):
+    if setup_dtype is not None:
+        # import the model code first so its modules are not counted
+        import rvc.lib.algorithm.synthesizers
+    before = _memory_usage()
+    start_time = time.perf_counter()
+    data = load_weights(path)
+    elapsed = time.perf_counter() - start_time
+    tensors = data.get("weight", data.get("model", {}))
+    if touch:
+        # read every weight once, as moving the model to a device does
+        for tensor in tensors.values():
+            tensor.float().sum()
+    after = _memory_usage()
+    result = {
+        "seconds": elapsed,
+        "rss_bytes": after["Rss"] - before["Rss"],
+        "anonymous_bytes": after.get("Anonymous", 0) - before.get("Anonymous", 0),
+    }
+    if setup_dtype is not None:
+        start_time = time.perf_counter()
+        net_g = _setup_synthesizer(data, getattr(torch, setup_dtype))
+        # free the initial parameters replaced by the loaded ones and return them to the
+        # system, so the allocator's cache is not counted as model memory
+        gc.collect()
+        _trim_heap()
+        after = _memory_usage()
+        result["setup_seconds"] = time.perf_counter() - start_time
+        result["setup_rss_bytes"] = after["Rss"] - before["Rss"]
+        result["setup_anonymous_bytes"] = after.get("Anonymous", 0) - before.get(
+            "Anonymous", 0
+        )
+        del net_g
+    connection.send(result)
+
+
+def benchmark(pth_path: str, touch: bool = True) -> dict:
+    """
+    Compares loading a .pth file with torch.load and its safetensors conversion, each in a fresh process.
+
+    Anonymous bytes are the memory not backed by the file, which every process loading the
+    model holds its own copy of, while the file pages are shared. For voice models, the
+    memory is also measured after building the synthesizer as inference does, once in the
+    dtype of the stored weights and once in float32: only weights that keep their dtype
+    stay shared, converting them allocates a private copy whatever the file format.
+
+    Args:
+        pth_path: Path to a voice model or a G/D checkpoint.
+        touch: Whether to read every weight after loading.
+    """
+    import tempfile
+    import multiprocessing
+
+    context = multiprocessing.get_context("spawn")
+    data = torch.load(pth_path, map_location="cpu")
+    setup_dtypes = [None]
+    if "weight" in data and "config" in data:
+        stored_dtype = str(data["weight"]["emb_g.weight"].dtype).split(".")[-1]
+        setup_dtypes += sorted({stored_dtype, "float32"})
+    del data
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        safetensors_path = pth_to_safetensors(
+            pth_path, os.path.join(directory, "model.safetensors")
+        )
+        for name, path in (("torch.load", pth_path), ("safetensors", safetensors_path)):
+            for setup_dtype in setup_dtypes:
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(
+                    target=_measure, args=(path, touch, setup_dtype, sender)
+                )
+                process.start()
+                process.join()
+                if not receiver.poll():
+                    raise RuntimeError(f"Loading {path} failed in the benchmark process.")
+                key = name if setup_dtype is None else f"{name} + setup ({setup_dtype})"
+                results[key] = receiver.recv()
+        results["pth_bytes"] = os.path.getsize(pth_path)
+        results["safetensors_bytes"] = os.path.getsize(safetensors_path)
+    return results
+
+
+if __name__ == "__main__":
+    command = sys.argv[1]
+    if command == "to_safetensors":
+        print(pth_to_safetensors(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None))
+    elif command == "to_pth":
+        print(safetensors_to_pth(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None))
+    elif command == "benchmark":
+        print(json.dumps(benchmark(sys.argv[2]), indent=2))
+    else:
+        print(f"Unknown command '{command}', expected to_safetensors, to_pth or benchmark")
@@ -0,0 +1,248 @@
+import os
+import sys
+import json
+import queue
+import contextlib
+import multiprocessing as mp
+import torch
+
+try:
+    import threadpoolctl
+except ImportError:  # optional, the environment variables cover pools created later
+    threadpoolctl = None
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+# thread pools of OpenMP, MKL, OpenBLAS, numexpr and Accelerate, read when they start
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+CALIBRATION_PATH = os.path.join(now_dir, "logs", "cpu_workers.json")
+
+
+def get_cpu_cores() -> list:
+    """
+    Returns the CPU cores this process may run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def get_worker_layouts(cores: int, max_workers: int = None) -> list:
+    """
+    Returns the (workers, threads) layouts splitting cores between worker processes,
+    with power of two thread counts and one worker using every core.
+
+    Args:
+        cores (int): Number of cores to use.
+        max_workers (int, optional): Most worker processes, for example to fit their models in memory.
+    """
+    thread_counts = {cores}
+    threads = 1
+    while threads < cores:
+        thread_counts.add(threads)
+        threads *= 2
+    layouts = []
+    for threads in sorted(thread_counts):
+        workers = cores // threads
+        if max_workers:
+            workers = max(1, min(workers, max_workers))
+        if (workers, threads) not in layouts:
+            layouts.append((workers, threads))
+    return layouts
+
+
+@contextlib.contextmanager
+def worker_thread_environment(threads: int):
+    """
+    Sets the thread count variables of the native pools while worker processes start, so
+    their libraries size the pools at import, and restores them afterwards.
+
+    Args:
+        threads (int): Threads of every worker.
+    """
+    saved = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+    os.environ.update({name: str(threads) for name in THREAD_ENV_VARS})
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def init_cpu_worker(threads: int, cores: list = None):
+    """
+    Limits the torch, OpenMP and BLAS threads of a worker process and optionally pins it.
+
+    Args:
+        threads (int): Threads of the worker.
+        cores (list, optional): Cores to pin the worker to, where the platform allows it.
+    """
+    os.environ.update({name: str(threads) for name in THREAD_ENV_VARS})
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # only possible before the first inter-op parallel work of the process
+        pass
+    if threadpoolctl is not None:
+        threadpoolctl.threadpool_limits(threads)
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+
+def run_cpu_worker(threads, cores, target, args, results=None):
+    init_cpu_worker(threads, cores)
+    result = target(*args)
+    if results is not None:
+        results.put(result)
+
+
+def start_cpu_workers(
+    target, worker_args: list, threads: int, affinity: bool = False, results=None
+) -> list:
+    """
+    Starts one process per entry of worker_args running target with limited threads.
+
+    Args:
+        target (callable): Picklable function run by every worker.
+        worker_args (list): Argument tuple of each worker.
+        threads (int): Threads of every worker.
+        affinity (bool, optional): Pin every worker to its own cores.
+        results (multiprocessing.Queue, optional): Receives the return value of every worker.
+    """
+    cores = get_cpu_cores()
+    processes = []
+    with worker_thread_environment(threads):
+        for i, args in enumerate(worker_args):
+            worker_cores = cores[i * threads : (i + 1) * threads] if affinity else None
+            process = mp.Process(
+                target=run_cpu_worker,
+                args=(threads, worker_cores, target, args, results),
+            )
+            process.start()
+            processes.append(process)
+    return processes
+
+
+def load_calibrations() -> dict:
+    if not os.path.exists(CALIBRATION_PATH):
+        return {}
+    try:
+        with open(CALIBRATION_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def calibrate_cpu_workers(
+    benchmark, args: tuple, layouts: list, affinity: bool = False
+) -> tuple:
+    """
+    Runs benchmark in the workers of every layout and returns the layout with the highest
+    throughput and the measured throughputs.
+
+    Args:
+        benchmark (callable): Picklable function returning (items, seconds) of its timed
+            part, so loading models is left out.
+        args (tuple): Arguments of benchmark.
+        layouts (list): The (workers, threads) layouts to try.
+        affinity (bool, optional): Pin every worker to its own cores.
+    """
+    throughputs = {}
+    for workers, threads in layouts:
+        results = mp.Queue()
+        processes = start_cpu_workers(
+            benchmark, [args] * workers, threads, affinity, results
+        )
+        timings = []
+        while len(timings) < workers:
+            try:
+                timings.append(results.get(timeout=1))
+            except queue.Empty:
+                # a worker that died, for example out of memory, never reports
+                if not any(process.is_alive() for process in processes):
+                    break
+        for process in processes:
+            process.join()
+        if len(timings) < workers:
+            print(f"  {workers} workers x {threads} threads failed.")
+            throughputs[(workers, threads)] = 0.0
+            continue
+        items = sum(count for count, _ in timings)
+        seconds = max(elapsed for _, elapsed in timings)
+        throughputs[(workers, threads)] = items / seconds if seconds > 0 else 0.0
+    return max(throughputs, key=throughputs.get), throughputs
+
+
+def plan_cpu_workers(
+    task: str,
+    cores: int,
+    benchmark,
+    args: tuple,
+    workers: int = 0,
+    threads: int = 0,
+    max_workers: int = None,
+    affinity: bool = False,
+) -> tuple:
+    """
+    Returns the (workers, threads) layout for a task on the CPU. Layouts not fixed by the
+    arguments are calibrated once per task and core count and cached in logs/cpu_workers.json,
+    max_workers then caps the workers of the cached layout.
+
+    Args:
+        task (str): Name of the task the calibration is cached under.
+        cores (int): Number of cores to use.
+        benchmark (callable): Picklable function returning (items, seconds), see calibrate_cpu_workers.
+        args (tuple): Arguments of benchmark.
+        workers (int, optional): Fixed number of workers, 0 to calibrate it.
+        threads (int, optional): Fixed threads per worker, 0 to calibrate them.
+        max_workers (int, optional): Most worker processes.
+        affinity (bool, optional): Pin every worker to its own cores.
+    """
+    cores = max(1, min(cores, len(get_cpu_cores())))
+    if workers and threads:
+        return workers, threads
+    layouts = [
+        (layout_workers, layout_threads)
+        for layout_workers, layout_threads in get_worker_layouts(cores, max_workers)
+        if (not workers or layout_workers == workers)
+        and (not threads or layout_threads == threads)
+    ]
+    if not layouts:
+        return workers or 1, threads or max(1, cores // (workers or 1))
+    if len(layouts) == 1:
+        return layouts[0]
+
+    # max_workers follows the free memory of the moment, so it is applied to the cached layout
+    key = f"{task}:{cores}:{workers}:{threads}"
+    calibrations = load_calibrations()
+    if key in calibrations:
+        layout_workers, layout_threads = calibrations[key]
+    else:
+        print(f"Calibrating CPU workers for {task} on {cores} cores...")
+        layout, throughputs = calibrate_cpu_workers(
+            benchmark, args, layouts, affinity
+        )
+        for (layout_workers, layout_threads), throughput in throughputs.items():
+            print(
+                f"  {layout_workers} workers x {layout_threads} threads: {throughput:.2f} items/s"
+            )
+        layout_workers, layout_threads = layout
+        calibrations[key] = list(layout)
+        os.makedirs(os.path.dirname(CALIBRATION_PATH), exist_ok=True)
+        with open(CALIBRATION_PATH + ".tmp", "w") as f:
+            json.dump(calibrations, f, indent=4)
+        os.replace(CALIBRATION_PATH + ".tmp", CALIBRATION_PATH)
+    if max_workers:
+        layout_workers = max(1, min(layout_workers, max_workers))
+    return layout_workers, layout_threads
@@ -5,6 +5,13 @@ import torch.utils.data
 
 from mel_processing import spectrogram_torch
 from utils import load_filepaths_and_text, load_wav_to_torch
+from rvc.train.shards import ShardReader
+from rvc.train.extract.spectrograms import (
+    get_spec_dir,
+    get_spec_path,
+    load_spectrogram,
+    spectrograms_are_current,
+)
 
 
 class TextAudioLoaderMultiNSFsid(torch.utils.data.Dataset):
@@ -25,6 +32,8 @@ class TextAudioLoaderMultiNSFsid(torch.utils.data.Dataset):
         self.sample_rate = hparams.sample_rate
         self.min_text_len = getattr(hparams, "min_text_len", 1)
         self.max_text_len = getattr(hparams, "max_text_len", 5000)
+        self.spec_dir = get_spec_dir(os.path.dirname(hparams.training_files))
+        self.use_spec_dir = spectrograms_are_current(self.spec_dir, hparams)
         self._filter()
 
     def _filter(self):
@@ -71,6 +80,20 @@ class TextAudioLoaderMultiNSFsid(torch.utils.data.Dataset):
         spec, wav = self.get_audio(file)
         dv = self.get_sid(dv)
 
+        return self.match_lengths(spec, wav, phone, pitch, pitchf, dv)
+
+    def match_lengths(self, spec, wav, phone, pitch, pitchf, dv):
+        """
+        Trims the spectrogram, audio and labels of a sample to a common number of frames.
+
+        Args:
+            spec (torch.Tensor): Spectrogram.
+            wav (torch.Tensor): Audio.
+            phone (torch.Tensor): Phoneme features.
+            pitch (torch.Tensor): Coarse pitch.
+            pitchf (torch.Tensor): Fine pitch.
+            dv (torch.Tensor): Speaker ID.
+        """
         len_phone = phone.size()[0]
         len_spec = spec.size()[-1]
         if len_phone != len_spec:
@@ -122,22 +145,11 @@ class TextAudioLoaderMultiNSFsid(torch.utils.data.Dataset):
             )
         audio_norm = audio
         audio_norm = audio_norm.unsqueeze(0)
-        spec_filename = filename.replace(".wav", ".spec.pt")
-        if os.path.exists(spec_filename):
-            try:
-                spec = torch.load(spec_filename)
-            except Exception as error:
-                print(f"An error occurred getting spec from {spec_filename}: {error}")
-                spec = spectrogram_torch(
-                    audio_norm,
-                    self.filter_length,
-                    self.hop_length,
-                    self.win_length,
-                    center=False,
-                )
-                spec = torch.squeeze(spec, 0)
-                torch.save(spec, spec_filename, _use_new_zipfile_serialization=False)
+        spec_filename = get_spec_path(self.spec_dir, filename)
+        if self.use_spec_dir and os.path.exists(spec_filename):
+            spec = load_spectrogram(spec_filename)
         else:
+            # not precomputed by extract.py, computed here without writing it
             spec = spectrogram_torch(
                 audio_norm,
                 self.filter_length,
@@ -146,7 +158,6 @@ class TextAudioLoaderMultiNSFsid(torch.utils.data.Dataset):
                 center=False,
             )
             spec = torch.squeeze(spec, 0)
-            torch.save(spec, spec_filename, _use_new_zipfile_serialization=False)
         return spec, audio_norm
 
     def __getitem__(self, index):
@@ -165,6 +176,57 @@ class TextAudioLoaderMultiNSFsid(torch.utils.data.Dataset):
         return len(self.audiopaths_and_text)
 
 
+class TextAudioShardLoaderMultiNSFsid(TextAudioLoaderMultiNSFsid):
+    """
+    Dataset that reads the samples of filelist.txt from packed, memory-mapped shards.
+
+    Args:
+        hparams: Hyperparameters.
+        shard_dir (str): Directory of the shards packed from hparams.training_files.
+    """
+
+    def __init__(self, hparams, shard_dir):
+        self.hop_length = hparams.hop_length
+        self.sample_rate = hparams.sample_rate
+        self.reader = ShardReader(shard_dir)
+        index = self.reader.index
+        if index["sample_rate"] != self.sample_rate:
+            raise ValueError(
+                f"{index['sample_rate']} SR doesn't match target {self.sample_rate} SR"
+            )
+        self.samples = index["samples"]
+        # same bucketing lengths as the file-based dataset
+        self.lengths = [
+            index["blocks"][block_id]["file_size"] // (3 * self.hop_length)
+            for block_id, _ in self.samples
+        ]
+
+    def __getitem__(self, index):
+        """
+        Returns a single audio-text pair.
+
+        Args:
+            index (int): Index of the data sample.
+        """
+        block_id, dv = self.samples[index]
+        arrays = self.reader.read(block_id)
+        n_num = min(arrays["phone"].shape[0] * 2, 900)
+        phone = torch.from_numpy(
+            np.repeat(arrays["phone"], 2, axis=0)[:n_num].astype(np.float32)
+        )
+        pitch = torch.from_numpy(arrays["pitch"][:n_num].astype(np.int64))
+        pitchf = torch.from_numpy(arrays["pitchf"][:n_num])
+        spec = torch.from_numpy(arrays["spec"].astype(np.float32))
+        wav = torch.from_numpy(arrays["audio"]).unsqueeze(0)
+        return self.match_lengths(spec, wav, phone, pitch, pitchf, self.get_sid(dv))
+
+    def __len__(self):
+        """
+        Returns the length of the dataset.
+        """
+        return len(self.samples)
+
+
 class TextAudioCollateMultiNSFsid:
     """
     Collates text and audio data for training.
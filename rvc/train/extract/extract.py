@@ -20,7 +20,12 @@ import rvc.lib.zluda
 
 from rvc.lib.utils import load_audio, load_embedding
 from rvc.train.extract.preparing_files import generate_config, generate_filelist
-from rvc.lib.predictors.RMVPE import RMVPE0Predictor
+from rvc.train.preprocess.manifest import get_slice_names
+from rvc.train.extract.spectrograms import extract_spectrograms
+from rvc.train.shards import pack_shards
+from rvc.train.cpu_workers import plan_cpu_workers, start_cpu_workers
+from rvc.lib.predictors.RMVPE import RMVPE0Predictor, get_available_memory
+from rvc.lib.predictors.parallel import parallel_f0, load_rmvpe
 from rvc.configs.config import Config
 
 # Load config
@@ -28,6 +33,11 @@ config = Config()
 
 mp.set_start_method("spawn", force=True)
 
+# memory a CPU extraction worker needs for its models and batches
+CPU_WORKER_MEMORY = 2 << 30
+# median sized slices every worker extracts in the CPU calibration
+CALIBRATION_SLICES = 8
+
 
 class FeatureInput:
     """Class for F0 extraction."""
@@ -47,10 +57,29 @@ class FeatureInput:
         """Extract F0 using the specified method."""
         if f0_method == "crepe":
             return self.get_crepe(np_arr, hop_length)
-        elif f0_method == "rmvpe":
-            return self.model_rmvpe.infer_from_audio(np_arr, thred=0.03)
-        else:
+        if f0_method != "rmvpe":
             raise ValueError(f"Unknown F0 method: {f0_method}")
+        n_frames = np_arr.size // self.hop + 1
+
+        # long files on CPU are split into overlapping windows extracted in parallel, by
+        # single-threaded processes sharing the cores of this extraction worker
+        cores = torch.get_num_threads()
+        if (
+            config.parallel_f0_workers == 1
+            or str(self.device) != "cpu"
+            or cores < 2
+            or np_arr.size < config.parallel_f0_min_seconds * self.fs
+        ):
+            return self.model_rmvpe.infer_from_audio(np_arr, thred=0.03)
+        return parallel_f0(
+            (load_rmvpe, (os.path.join("rvc", "models", "predictors", "rmvpe.pt"),)),
+            np_arr,
+            n_frames,
+            self.hop,
+            workers=config.parallel_f0_workers or None,
+            cores=cores,
+            sample_rate=self.fs,
+        )
 
     def get_crepe(self, x, hop_length):
         """Extract F0 using CREPE."""
@@ -109,10 +138,43 @@ class FeatureInput:
                 f"An error occurred extracting file {inp_path} on {self.device}: {error}"
             )
 
-    def process_files(
-        self, files, f0_method, hop_length, device_num, device, n_threads
-    ):
-        """Process multiple files."""
+    def compute_f0_batch(self, audios, f0_method, hop_length):
+        """Extract F0 of several slices, RMVPE running on batches, None on errors."""
+        f0s = [None] * len(audios)
+        batch = []
+        for i, np_arr in enumerate(audios):
+            # long unsliced files keep the windowed extraction
+            if (
+                f0_method == "rmvpe"
+                and np_arr.size < config.parallel_f0_min_seconds * self.fs
+            ):
+                batch.append(i)
+                continue
+            try:
+                f0s[i] = self.compute_f0(np_arr, f0_method, hop_length)
+            except Exception as error:
+                print(f"An error occurred extracting F0 on {self.device}: {error}")
+        if batch:
+            try:
+                batch_f0s = self.model_rmvpe.infer_from_audio_batch(
+                    [audios[i] for i in batch],
+                    thred=0.03,
+                    batch_size=config.rmvpe_batch_size or None,
+                )
+            except Exception as error:
+                print(f"An error occurred extracting F0 on {self.device}: {error}")
+                batch_f0s = [None] * len(batch)
+            for i, f0 in zip(batch, batch_f0s):
+                f0s[i] = f0
+        return f0s
+
+    def save_f0(self, file_info, feature_pit):
+        """Save the fine and coarse F0 of a slice."""
+        np.save(file_info[2], feature_pit, allow_pickle=False)
+        np.save(file_info[1], self.coarse_f0(feature_pit), allow_pickle=False)
+
+    def load_model(self, f0_method, device):
+        """Load the F0 predictor of a method on a device."""
         self.device = device
         if f0_method == "rmvpe":
             self.model_rmvpe = RMVPE0Predictor(
@@ -120,10 +182,19 @@ class FeatureInput:
                 is_half=False,
                 device=device,
             )
-        else:
+
+    def process_files(
+        self, files, f0_method, hop_length, device_num, device, n_threads
+    ):
+        """Process multiple files."""
+        self.load_model(f0_method, device)
+        if f0_method != "rmvpe":
             n_threads = 1
 
         n_threads = 1 if n_threads == 0 else n_threads
+        if f0_method == "rmvpe":
+            self.process_files_rmvpe(files, device_num, n_threads)
+            return
 
         def process_file_wrapper(file_info):
             self.process_file(file_info, f0_method, hop_length)
@@ -140,6 +211,56 @@ class FeatureInput:
                 for future in concurrent.futures.as_completed(futures):
                     pbar.update(1)
 
+    def process_files_rmvpe(self, files, device_num, n_threads, chunk_size=256):
+        """Extract F0 with RMVPE on batches of slices of similar length."""
+        files = [
+            file_info
+            for file_info in files
+            if not (os.path.exists(file_info[1]) and os.path.exists(file_info[2]))
+        ]
+        # neighbouring slices have similar lengths, so batches fill up
+        sort_by_size(files)
+
+        with tqdm.tqdm(total=len(files), leave=True, position=device_num) as pbar:
+            # threads only read the audio, the model runs on whole batches
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=n_threads
+            ) as executor:
+                for start in range(0, len(files), chunk_size):
+                    chunk = files[start : start + chunk_size]
+                    loaded = [
+                        (file_info, np_arr)
+                        for file_info, np_arr in zip(
+                            chunk, executor.map(load_slice, chunk)
+                        )
+                        if np_arr is not None
+                    ]
+                    f0s = self.compute_f0_batch(
+                        [np_arr for _, np_arr in loaded], "rmvpe", self.hop
+                    )
+                    for (file_info, _), feature_pit in zip(loaded, f0s):
+                        if feature_pit is not None:
+                            self.save_f0(file_info, feature_pit)
+                    pbar.update(len(chunk))
+
+
+def sort_by_size(files):
+    """Sort file infos by the size of their slice, missing slices first."""
+    files.sort(
+        key=lambda file_info: (
+            os.path.getsize(file_info[0]) if os.path.exists(file_info[0]) else 0
+        )
+    )
+
+
+def load_slice(file_info):
+    """Load the 16 kHz audio of a slice, None when it can't be read."""
+    try:
+        return load_audio(file_info[0], 16000)
+    except Exception as error:
+        print(f"An error occurred loading file {file_info[0]}: {error}")
+        return None
+
 
 def run_pitch_extraction(files, devices, f0_method, hop_length, num_processes):
     devices_str = ", ".join(devices)
@@ -148,63 +269,369 @@ def run_pitch_extraction(files, devices, f0_method, hop_length, num_processes):
     )
     start_time = time.time()
     fe = FeatureInput()
-    # split the task between devices
-    ps = []
-    num_devices = len(devices)
-    for i, device in enumerate(devices):
-        p = mp.Process(
-            target=fe.process_files,
-            args=(
-                files[i::num_devices],
-                f0_method,
-                hop_length,
-                i,
-                device,
-                num_processes // num_devices,
-            ),
-        )
-        ps.append(p)
-        p.start()
-    for i, device in enumerate(devices):
-        ps[i].join()
+    run_extraction_processes(
+        "pitch",
+        fe.process_files,
+        lambda worker_files, i, device, n_threads: (
+            worker_files,
+            f0_method,
+            hop_length,
+            i,
+            device,
+            n_threads,
+        ),
+        files,
+        devices,
+        num_processes,
+        (f0_method, hop_length, None, None, None),
+    )
 
     elapsed_time = time.time() - start_time
     print(f"Pitch extraction completed in {elapsed_time:.2f} seconds.")
 
 
-def process_file_embedding(
-    files, version, embedder_model, embedder_model_custom, device_num, device, n_threads
-):
+def cpu_supports_bf16():
+    """Returns whether the CPU computes bfloat16 natively, where autocast speeds it up."""
+    checks = ("_is_avx512_bf16_supported", "_is_amx_tile_supported")
+    return any(getattr(torch.cpu, check, lambda: False)() for check in checks)
+
+
+def embed_batch(model, audios, version, cpu_bf16=False):
+    """
+    Returns the unpadded embedder features of a batch of 16 kHz slices as float32 arrays.
+
+    Args:
+        model (HubertModelWithFinalProj): The embedder.
+        audios (list): 1-D float tensors.
+        version (str): Model version, v1 features go through the final projection.
+        cpu_bf16 (bool, optional): Autocast to bfloat16 on the CPU.
+    """
+    with torch.no_grad(), torch.autocast(
+        "cpu", dtype=torch.bfloat16, enabled=cpu_bf16
+    ):
+        feats = model.forward_batch(audios, final_proj=version == "v1")
+    return [feat.float().cpu().numpy() for feat in feats]
+
+
+def load_embedder(embedder_model, embedder_model_custom, device):
+    """Load the embedder for extraction, in half precision on GPUs when enabled."""
     dtype = torch.float16 if config.is_half and "cuda" in device else torch.float32
     model = load_embedding(embedder_model, embedder_model_custom).to(dtype).to(device)
+    return model.eval()
+
+
+def embed_slices(model, audios, version, device, progress=None):
+    """
+    Returns the features of slices of similar length, embedded in batches, with None
+    for the slices of a failed batch.
+
+    Args:
+        model (HubertModelWithFinalProj): The embedder.
+        audios (list): 16 kHz slices as numpy arrays.
+        version (str): Model version, v1 features go through the final projection.
+        device (str): Device of the embedder.
+        progress (callable, optional): Called with the size of each finished batch.
+    """
+    batch_size = config.embedder_batch_size or (32 if "cuda" in device else 8)
+    cpu_bf16 = device == "cpu" and config.embedder_cpu_bf16 and cpu_supports_bf16()
+    feats = []
+    for start in range(0, len(audios), batch_size):
+        batch = [
+            torch.from_numpy(audio).float()
+            for audio in audios[start : start + batch_size]
+        ]
+        try:
+            feats += embed_batch(model, batch, version, cpu_bf16)
+        except Exception as error:
+            print(f"An error occurred extracting embeddings on {device}: {error}")
+            feats += [None] * len(batch)
+        if progress is not None:
+            progress(len(batch))
+    return feats
+
+
+def save_embedding(file_info, feats):
+    """Save the features of a slice unless they contain NaN, returning whether saved."""
+    if np.isnan(feats).any():
+        print(f"{file_info[0]} contains NaN values and will be skipped.")
+        return False
+    np.save(file_info[3], feats, allow_pickle=False)
+    return True
+
+
+def process_file_embedding(
+    files,
+    version,
+    embedder_model,
+    embedder_model_custom,
+    device_num,
+    device,
+    n_threads,
+    chunk_size=256,
+):
+    model = load_embedder(embedder_model, embedder_model_custom, device)
     n_threads = 1 if n_threads == 0 else n_threads
 
-    def process_file_embedding_wrapper(file_info):
-        wav_file_path, _, _, out_file_path = file_info
-        if os.path.exists(out_file_path):
-            return
-        feats = torch.from_numpy(load_audio(wav_file_path, 16000)).to(dtype).to(device)
-        feats = feats.view(1, -1)
-        with torch.no_grad():
-            feats = model(feats)["last_hidden_state"]
-            feats = (
-                model.final_proj(feats[0]).unsqueeze(0) if version == "v1" else feats
-            )
-        feats = feats.squeeze(0).float().cpu().numpy()
-        if not np.isnan(feats).any():
-            np.save(out_file_path, feats, allow_pickle=False)
-        else:
-            print(f"{file} contains NaN values and will be skipped.")
+    files = [file_info for file_info in files if not os.path.exists(file_info[3])]
+    # neighbouring slices have similar lengths, so batches carry little padding
+    sort_by_size(files)
 
     with tqdm.tqdm(total=len(files), leave=True, position=device_num) as pbar:
-        # using multi-threading
+        # threads only read the audio, the model runs on whole batches
         with concurrent.futures.ThreadPoolExecutor(max_workers=n_threads) as executor:
-            futures = [
-                executor.submit(process_file_embedding_wrapper, file_info)
-                for file_info in files
-            ]
-            for future in concurrent.futures.as_completed(futures):
-                pbar.update(1)
+            for start in range(0, len(files), chunk_size):
+                chunk = files[start : start + chunk_size]
+                loaded = [
+                    (file_info, audio)
+                    for file_info, audio in zip(chunk, executor.map(load_slice, chunk))
+                    if audio is not None
+                ]
+                feats = embed_slices(
+                    model, [audio for _, audio in loaded], version, device, pbar.update
+                )
+                for (file_info, _), feat in zip(loaded, feats):
+                    if feat is not None:
+                        save_embedding(file_info, feat)
+                pbar.update(len(chunk) - len(loaded))
+
+
+def process_files_fused(
+    files,
+    f0_method,
+    hop_length,
+    version,
+    embedder_model,
+    embedder_model_custom,
+    device_num,
+    f0_device,
+    embedder_device,
+    chunk_size=64,
+):
+    """
+    Extract F0 and features of slices in one pass, decoding every slice once.
+
+    While the embedder runs on a chunk of slices, the F0 predictor runs on the same
+    chunk in a second thread and the next chunk is read in a third. The F0, coarse
+    F0 and features of a slice are written together once both models are done.
+
+    Args:
+        files (list): File infos, [16 kHz wav, coarse F0, F0, features].
+        f0_method (str): F0 method.
+        hop_length (int): Hop length of crepe.
+        version (str): Model version.
+        embedder_model (str): Embedder name.
+        embedder_model_custom (str): Path of a custom embedder.
+        device_num (int): Position of the progress bar.
+        f0_device (str): Device of the F0 predictor.
+        embedder_device (str): Device of the embedder, may be the F0 device.
+    """
+    fe = FeatureInput()
+    fe.load_model(f0_method, f0_device)
+    model = load_embedder(embedder_model, embedder_model_custom, embedder_device)
+
+    files = [
+        file_info
+        for file_info in files
+        if not all(os.path.exists(path) for path in file_info[1:])
+    ]
+    if not files:
+        return
+    sort_by_size(files)
+    chunks = [files[i : i + chunk_size] for i in range(0, len(files), chunk_size)]
+
+    def read_chunk(chunk):
+        return [load_slice(file_info) for file_info in chunk]
+
+    with tqdm.tqdm(total=len(files), leave=True, position=device_num) as pbar:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            pending = executor.submit(read_chunk, chunks[0])
+            for i, chunk in enumerate(chunks):
+                audios = pending.result()
+                if i + 1 < len(chunks):
+                    pending = executor.submit(read_chunk, chunks[i + 1])
+                loaded = [
+                    (file_info, audio)
+                    for file_info, audio in zip(chunk, audios)
+                    if audio is not None
+                ]
+                slices = [audio for _, audio in loaded]
+                f0_future = executor.submit(
+                    fe.compute_f0_batch, slices, f0_method, hop_length
+                )
+                feats = embed_slices(model, slices, version, embedder_device)
+                f0s = f0_future.result()
+                for (file_info, _), feature_pit, feat in zip(loaded, f0s, feats):
+                    if feature_pit is None or feat is None:
+                        continue
+                    if save_embedding(file_info, feat):
+                        fe.save_f0(file_info, feature_pit)
+                pbar.update(len(chunk))
+
+
+def calibrate_extraction(
+    task,
+    f0_method,
+    hop_length,
+    version,
+    embedder_model,
+    embedder_model_custom,
+    paths,
+):
+    """
+    Times the extraction of a few slices on the CPU without saving anything, returning
+    the number of slices and the seconds they took, model loading left out.
+
+    Args:
+        task (str): "pitch", "embedding" or "fused".
+        f0_method (str): F0 method of the pitch and fused tasks.
+        hop_length (int): Hop length of crepe.
+        version (str): Model version of the embedding and fused tasks.
+        embedder_model (str): Embedder name.
+        embedder_model_custom (str): Path of a custom embedder.
+        paths (list): 16 kHz slices to extract.
+    """
+    audios = [load_audio(path, 16000) for path in paths]
+    if task != "embedding":
+        fe = FeatureInput()
+        fe.load_model(f0_method, "cpu")
+    if task != "pitch":
+        model = load_embedder(embedder_model, embedder_model_custom, "cpu")
+
+    def run(slices):
+        if task == "pitch":
+            fe.compute_f0_batch(slices, f0_method, hop_length)
+        elif task == "embedding":
+            embed_slices(model, slices, version, "cpu")
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                f0_future = executor.submit(
+                    fe.compute_f0_batch, slices, f0_method, hop_length
+                )
+                embed_slices(model, slices, version, "cpu")
+                f0_future.result()
+
+    # the first call pays for lazy initialization
+    run(audios[:1])
+    start_time = time.perf_counter()
+    run(audios)
+    return len(audios), time.perf_counter() - start_time
+
+
+def run_extraction_processes(
+    task, target, make_args, files, devices, num_processes, calibration_args
+):
+    """
+    Runs an extraction on the files split between the devices. On the CPU the files are
+    split between worker processes instead, each with its own models and a fixed number
+    of threads, so the workers don't oversubscribe the cores.
+
+    Args:
+        task (str): "pitch", "embedding" or "fused", names the CPU calibration.
+        target (callable): Extraction function of a process.
+        make_args (callable): Returns the arguments of target from the files, index,
+            device and threads of a process.
+        files (list): File infos.
+        devices (list): Devices to extract on.
+        num_processes (int): Cores to use.
+        calibration_args (tuple): F0 method, hop length, version, embedder model and
+            custom embedder of calibrate_extraction.
+    """
+    # neighbouring file infos are handed to different processes, balancing their lengths
+    files = list(files)
+    sort_by_size(files)
+    if devices == ["cpu"]:
+        middle = len(files) // 2
+        paths = [
+            file_info[0]
+            for file_info in files[middle : middle + CALIBRATION_SLICES]
+            if os.path.exists(file_info[0])
+        ]
+        if not paths:
+            workers, threads = 1, max(1, num_processes)
+        else:
+            workers, threads = plan_cpu_workers(
+                f"{task}-{calibration_args[0]}" if task != "embedding" else task,
+                num_processes,
+                calibrate_extraction,
+                (task, *calibration_args, paths),
+                workers=config.cpu_workers,
+                threads=config.cpu_worker_threads,
+                max_workers=max(1, int(get_available_memory() // CPU_WORKER_MEMORY)),
+                affinity=config.cpu_worker_affinity,
+            )
+        print(f"Using {workers} CPU workers with {threads} threads each.")
+        processes = start_cpu_workers(
+            target,
+            [make_args(files[i::workers], i, "cpu", threads) for i in range(workers)],
+            threads,
+            config.cpu_worker_affinity,
+        )
+    else:
+        processes = []
+        for i, device in enumerate(devices):
+            process = mp.Process(
+                target=target,
+                args=make_args(
+                    files[i :: len(devices)], i, device, num_processes // len(devices)
+                ),
+            )
+            process.start()
+            processes.append(process)
+    for process in processes:
+        process.join()
+
+
+def benchmark(slices: int = 48, batch_size: int = 8, version: str = "v2"):
+    """
+    Compares embedding training slices one at a time, as extraction used to, with the
+    length-bucketed batches of process_file_embedding, on a randomly initialized embedder
+    on the CPU.
+
+    Args:
+        slices: Number of synthetic slices, 1 to 3.3 seconds long.
+        batch_size: Slices per batch.
+        version: Model version, v1 features go through the final projection.
+    """
+    from transformers import HubertConfig
+    from rvc.lib.utils import HubertModelWithFinalProj
+    from rvc.infer.benchmark import generate_voiced_audio
+
+    torch.manual_seed(0)
+    model = HubertModelWithFinalProj(HubertConfig()).eval()
+    rng = np.random.default_rng(0)
+    audios = [
+        torch.from_numpy(
+            generate_voiced_audio(rng.uniform(1.0, 3.3), 16000, seed=i)
+        ).float()
+        for i in range(slices)
+    ]
+    audios.sort(key=lambda audio: audio.shape[0])
+
+    start_time = time.perf_counter()
+    reference = []
+    with torch.no_grad():
+        for audio in audios:
+            feats = model(audio.view(1, -1))["last_hidden_state"]
+            feats = model.final_proj(feats[0]) if version == "v1" else feats[0]
+            reference.append(feats.numpy())
+    results = {
+        "slices": slices,
+        "per_slice": slices / (time.perf_counter() - start_time),
+    }
+
+    runs = {"batched": False}
+    if cpu_supports_bf16():
+        runs["batched_bf16"] = True
+    for name, cpu_bf16 in runs.items():
+        start_time = time.perf_counter()
+        feats = []
+        for i in range(0, slices, batch_size):
+            feats += embed_batch(model, audios[i : i + batch_size], version, cpu_bf16)
+        results[name] = slices / (time.perf_counter() - start_time)
+        results[f"{name}_max_abs_diff"] = max(
+            float(np.abs(a - b).max()) for a, b in zip(reference, feats)
+        )
+    return results
 
 
 def run_embedding_extraction(
@@ -215,31 +642,72 @@ def run_embedding_extraction(
     print(
         f"Starting embedding extraction with {num_processes} cores on {devices_str}..."
     )
-    # split the task between devices
-    ps = []
-    num_devices = len(devices)
-    for i, device in enumerate(devices):
-        p = mp.Process(
-            target=process_file_embedding,
-            args=(
-                files[i::num_devices],
-                version,
-                embedder_model,
-                embedder_model_custom,
-                i,
-                device,
-                num_processes // num_devices,
-            ),
-        )
-        ps.append(p)
-        p.start()
-    for i, device in enumerate(devices):
-        ps[i].join()
+    run_extraction_processes(
+        "embedding",
+        process_file_embedding,
+        lambda worker_files, i, device, n_threads: (
+            worker_files,
+            version,
+            embedder_model,
+            embedder_model_custom,
+            i,
+            device,
+            n_threads,
+        ),
+        files,
+        devices,
+        num_processes,
+        (None, None, version, embedder_model, embedder_model_custom),
+    )
     elapsed_time = time.time() - start_time
     print(f"Embedding extraction completed in {elapsed_time:.2f} seconds.")
 
 
+def run_fused_extraction(
+    files,
+    devices,
+    f0_method,
+    hop_length,
+    version,
+    embedder_model,
+    embedder_model_custom,
+    num_processes,
+):
+    start_time = time.time()
+    devices_str = ", ".join(devices)
+    print(
+        f"Starting pitch and embedding extraction with {num_processes} cores on {devices_str} using {f0_method}..."
+    )
+    # each process runs both models on the same device
+    run_extraction_processes(
+        "fused",
+        process_files_fused,
+        lambda worker_files, i, device, n_threads: (
+            worker_files,
+            f0_method,
+            hop_length,
+            version,
+            embedder_model,
+            embedder_model_custom,
+            i,
+            device,
+            device,
+        ),
+        files,
+        devices,
+        num_processes,
+        (f0_method, hop_length, version, embedder_model, embedder_model_custom),
+    )
+    elapsed_time = time.time() - start_time
+    print(f"Pitch and embedding extraction completed in {elapsed_time:.2f} seconds.")
+
+
 if __name__ == "__main__":
+    if sys.argv[1] == "benchmark":
+        slices = int(sys.argv[2]) if len(sys.argv) > 2 else 48
+        batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+        print(json.dumps(benchmark(slices, batch_size), indent=2))
+        sys.exit(0)
 
     exp_dir = sys.argv[1]
     f0_method = sys.argv[2]
@@ -275,8 +743,19 @@ if __name__ == "__main__":
     with open(file_path, "w") as f:
         json.dump(data, f, indent=4)
 
+    # extract the slices of the preprocessing manifest, so stale slices are never used
+    slice_names = get_slice_names(exp_dir)
+    if slice_names is None:
+        wav_files = glob.glob(os.path.join(wav_path, "*.wav"))
+    else:
+        wav_files = [
+            os.path.join(wav_path, f"{name}.wav")
+            for name in slice_names
+            if os.path.exists(os.path.join(wav_path, f"{name}.wav"))
+        ]
+
     files = []
-    for file in glob.glob(os.path.join(wav_path, "*.wav")):
+    for file in wav_files:
         file_name = os.path.basename(file)
         file_info = [
             file,  # full path to sliced 16k wav
@@ -287,16 +766,45 @@ if __name__ == "__main__":
             ),
         ]
         files.append(file_info)
+    pending = sum(
+        not all(os.path.exists(path) for path in file_info[1:]) for file_info in files
+    )
+    print(f"{pending} of {len(files)} slices need extraction.")
 
     devices = ["cpu"] if gpus == "-" else [f"cuda:{idx}" for idx in gpus.split("-")]
-    # Run Pitch Extraction
-    run_pitch_extraction(files, devices, f0_method, hop_length, num_processes)
+    if config.fused_feature_extraction:
+        # Run Pitch and Embedding Extraction in one pass
+        run_fused_extraction(
+            files,
+            devices,
+            f0_method,
+            hop_length,
+            version,
+            embedder_model,
+            embedder_model_custom,
+            num_processes,
+        )
+    else:
+        # Run Pitch Extraction
+        run_pitch_extraction(files, devices, f0_method, hop_length, num_processes)
+
+        # Run Embedding Extraction
+        run_embedding_extraction(
+            files, devices, version, embedder_model, embedder_model_custom
+        )
 
-    # Run Embedding Extraction
-    run_embedding_extraction(
-        files, devices, version, embedder_model, embedder_model_custom
+    # Run Spectrogram Extraction
+    generate_config(version, sample_rate, exp_dir)
+    wav_paths = [
+        os.path.join(exp_dir, "sliced_audios", os.path.basename(file_info[0]))
+        for file_info in files
+    ]
+    wav_paths.append(
+        os.path.join(now_dir, "logs", "mute", "sliced_audios", f"mute{sample_rate}.wav")
     )
+    extract_spectrograms(exp_dir, wav_paths, devices[0])
 
     # Run Preparing Files
-    generate_config(version, sample_rate, exp_dir)
     generate_filelist(exp_dir, version, sample_rate)
+    if config.pack_training_shards:
+        pack_shards(exp_dir, config.training_shard_audio_dtype)
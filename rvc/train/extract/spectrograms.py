@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import time
+import tqdm
+import torch
+import numpy as np
+from scipy.io import wavfile
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+from rvc.train.mel_processing import spectrogram_torch_batch
+
+SPEC_DIR_NAME = "spectrograms"
+SPEC_PARAMS_NAME = "params.json"
+SPEC_PARAMS_KEYS = ("sample_rate", "filter_length", "hop_length", "win_length")
+
+
+def get_spec_dir(exp_dir: str) -> str:
+    """
+    Returns the directory holding the precomputed spectrograms of an experiment.
+
+    Args:
+        exp_dir (str): Experiment directory.
+    """
+    return os.path.join(exp_dir, SPEC_DIR_NAME)
+
+
+def get_spec_path(spec_dir: str, wav_path: str) -> str:
+    """
+    Returns the path of the spectrogram of a training wav.
+
+    Args:
+        spec_dir (str): Directory of the spectrograms.
+        wav_path (str): Path to the wav at the training sample rate.
+    """
+    return os.path.join(
+        spec_dir, os.path.splitext(os.path.basename(wav_path))[0] + ".npy"
+    )
+
+
+def get_spec_params(data_config) -> dict:
+    """
+    Returns the STFT parameters the spectrograms depend on.
+
+    Args:
+        data_config: The "data" section of the experiment config, as a dict or HParams.
+    """
+    if not isinstance(data_config, dict):
+        data_config = {key: getattr(data_config, key) for key in SPEC_PARAMS_KEYS}
+    return {key: data_config[key] for key in SPEC_PARAMS_KEYS}
+
+
+def spectrograms_are_current(spec_dir: str, data_config) -> bool:
+    """
+    Returns whether the spectrograms in a directory were computed with the given STFT parameters.
+
+    Args:
+        spec_dir (str): Directory of the spectrograms.
+        data_config: The "data" section of the experiment config.
+    """
+    params_path = os.path.join(spec_dir, SPEC_PARAMS_NAME)
+    if not os.path.exists(params_path):
+        return False
+    with open(params_path, "r") as f:
+        return json.load(f) == get_spec_params(data_config)
+
+
+def load_spectrogram(spec_path: str) -> torch.Tensor:
+    """
+    Loads a precomputed spectrogram as a float32 tensor.
+
+    Args:
+        spec_path (str): Path to the .npy spectrogram.
+    """
+    return torch.from_numpy(np.load(spec_path).astype(np.float32))
+
+
+def extract_spectrograms(
+    exp_dir: str, wav_paths: list, device: str = "cpu", batch_size: int = None
+):
+    """
+    Computes the linear spectrograms of training wavs in batches of similar length and
+    stores them as float16 .npy files, skipping the ones already computed.
+
+    Args:
+        exp_dir (str): Experiment directory, holding config.json.
+        wav_paths (list): Paths to the wavs at the training sample rate.
+        device (str, optional): Device to compute on.
+        batch_size (int, optional): Number of wavs per STFT, 64 on GPUs and 1 on the CPU
+            by default, where batching only adds the padding to the FFT work.
+    """
+    if batch_size is None:
+        batch_size = 1 if str(device) == "cpu" else 64
+    start_time = time.time()
+    with open(os.path.join(exp_dir, "config.json"), "r") as f:
+        params = get_spec_params(json.load(f)["data"])
+    spec_dir = get_spec_dir(exp_dir)
+    os.makedirs(spec_dir, exist_ok=True)
+    if not spectrograms_are_current(spec_dir, params):
+        # computed with other parameters, or by an older version
+        for name in os.listdir(spec_dir):
+            if name.endswith(".npy"):
+                os.remove(os.path.join(spec_dir, name))
+        with open(os.path.join(spec_dir, SPEC_PARAMS_NAME), "w") as f:
+            json.dump(params, f, indent=4)
+
+    pending = [
+        path
+        for path in dict.fromkeys(wav_paths)
+        if not os.path.exists(get_spec_path(spec_dir, path))
+    ]
+    print(f"Starting spectrogram extraction of {len(pending)} files on {device}...")
+    # similar lengths in a batch keep the padding small
+    pending.sort(key=os.path.getsize)
+    with tqdm.tqdm(total=len(pending), leave=True) as pbar:
+        for start in range(0, len(pending), batch_size):
+            paths = pending[start : start + batch_size]
+            waves = []
+            for path in paths:
+                sample_rate, audio = wavfile.read(path)
+                if sample_rate != params["sample_rate"]:
+                    raise ValueError(
+                        f"{path}: {sample_rate} SR doesn't match target {params['sample_rate']} SR"
+                    )
+                waves.append(torch.from_numpy(audio.astype(np.float32)).to(device))
+            with torch.no_grad():
+                specs = spectrogram_torch_batch(
+                    waves,
+                    params["filter_length"],
+                    params["hop_length"],
+                    params["win_length"],
+                )
+            for path, spec in zip(paths, specs):
+                np.save(
+                    get_spec_path(spec_dir, path),
+                    spec.half().cpu().numpy(),
+                    allow_pickle=False,
+                )
+            pbar.update(len(paths))
+    elapsed_time = time.time() - start_time
+    print(f"Spectrogram extraction completed in {elapsed_time:.2f} seconds.")
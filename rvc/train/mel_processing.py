@@ -94,6 +94,53 @@ def spectrogram_torch(y, n_fft, hop_size, win_size, center=False):
     return spec
 
 
+def spectrogram_torch_batch(waves, n_fft, hop_size, win_size):
+    """
+    Compute the spectrograms of signals of different lengths with one batched STFT,
+    equal to spectrogram_torch on each signal with center=False.
+
+    Every signal is reflect-padded on its own and zero-padded to the longest one,
+    and the frames past the end of a signal are cropped from its spectrogram.
+
+    Args:
+        waves (list): 1D signals on the same device.
+        n_fft (int): FFT window size.
+        hop_size (int): Hop size between frames.
+        win_size (int): Window size.
+    """
+    padding = int((n_fft - hop_size) / 2)
+    padded = [
+        torch.nn.functional.pad(
+            wave.view(1, 1, -1), (padding, padding), mode="reflect"
+        ).view(-1)
+        for wave in waves
+    ]
+    frames = [(wave.shape[0] - n_fft) // hop_size + 1 for wave in padded]
+    batch = torch.nn.utils.rnn.pad_sequence(padded, batch_first=True)
+
+    global hann_window
+    dtype_device = str(batch.dtype) + "_" + str(batch.device)
+    wnsize_dtype_device = str(win_size) + "_" + dtype_device
+    if wnsize_dtype_device not in hann_window:
+        hann_window[wnsize_dtype_device] = torch.hann_window(win_size).to(
+            dtype=batch.dtype, device=batch.device
+        )
+
+    spec = torch.stft(
+        batch,
+        n_fft=n_fft,
+        hop_length=hop_size,
+        win_length=win_size,
+        window=hann_window[wnsize_dtype_device],
+        center=False,
+        normalized=False,
+        onesided=True,
+        return_complex=True,
+    )
+    spec = torch.sqrt(spec.real.pow(2) + spec.imag.pow(2) + 1e-6)
+    return [spec[i, :, :length] for i, length in enumerate(frames)]
+
+
 def spec_to_mel_torch(spec, n_fft, num_mels, sample_rate, fmin, fmax):
     """
     Convert a spectrogram to a mel-spectrogram.
@@ -0,0 +1,135 @@
+import os
+import glob
+import json
+import hashlib
+
+MANIFEST_NAME = "preprocess_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def get_manifest_path(exp_dir: str) -> str:
+    """
+    Returns the path of the preprocessing manifest of an experiment.
+
+    Args:
+        exp_dir (str): Experiment directory.
+    """
+    return os.path.join(exp_dir, MANIFEST_NAME)
+
+
+def load_manifest(exp_dir: str):
+    """
+    Loads the preprocessing manifest of an experiment, None when there is no usable one.
+
+    Args:
+        exp_dir (str): Experiment directory.
+    """
+    manifest_path = get_manifest_path(exp_dir)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as error:
+        print(f"Could not read {manifest_path}, preprocessing everything: {error}")
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(exp_dir: str, manifest: dict):
+    """
+    Writes the preprocessing manifest of an experiment, replacing the previous one at once.
+
+    Args:
+        exp_dir (str): Experiment directory.
+        manifest (dict): The manifest.
+    """
+    manifest_path = get_manifest_path(exp_dir)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def hash_file(file_path: str) -> str:
+    """
+    Computes the SHA-256 content hash of a file.
+
+    Args:
+        file_path (str): Path to the file.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def describe_source(file_path: str, known: dict = None) -> dict:
+    """
+    Returns size, mtime and content hash of a source file, reusing the hash of an unchanged known entry.
+
+    Args:
+        file_path (str): Path to the source audio.
+        known (dict, optional): The entry of the file in the existing manifest.
+    """
+    stat = os.stat(file_path)
+    if (
+        known is not None
+        and known["size"] == stat.st_size
+        and known["mtime"] == stat.st_mtime
+    ):
+        content_hash = known["hash"]
+    else:
+        content_hash = hash_file(file_path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "hash": content_hash}
+
+
+def get_slice_files(exp_dir: str, name: str) -> list:
+    """
+    Returns the files derived from a slice: both sliced audios, its F0, features and spectrogram.
+
+    Args:
+        exp_dir (str): Experiment directory.
+        name (str): Slice name without extension, "{sid}_{idx0}_{idx1}".
+    """
+    files = [
+        os.path.join(exp_dir, "sliced_audios", f"{name}.wav"),
+        os.path.join(exp_dir, "sliced_audios_16k", f"{name}.wav"),
+        os.path.join(exp_dir, "f0", f"{name}.wav.npy"),
+        os.path.join(exp_dir, "f0_voiced", f"{name}.wav.npy"),
+        os.path.join(exp_dir, "spectrograms", f"{name}.npy"),
+    ]
+    for feature_dir in glob.glob(os.path.join(exp_dir, "*_extracted")):
+        files.append(os.path.join(feature_dir, f"{name}.npy"))
+    return files
+
+
+def remove_slices(exp_dir: str, names: list):
+    """
+    Deletes slices together with the F0, features and spectrograms extracted from them.
+
+    Args:
+        exp_dir (str): Experiment directory.
+        names (list): Slice names without extension.
+    """
+    for name in names:
+        for file_path in get_slice_files(exp_dir, name):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+
+def get_slice_names(exp_dir: str):
+    """
+    Returns the names of the slices listed in the manifest, None when there is no manifest.
+
+    Args:
+        exp_dir (str): Experiment directory.
+    """
+    manifest = load_manifest(exp_dir)
+    if manifest is None:
+        return None
+    return [
+        name for source in manifest["sources"].values() for name in source["slices"]
+    ]
@@ -10,13 +10,31 @@ import json
 from distutils.util import strtobool
 import librosa
 import multiprocessing
-import noisereduce as nr
+from math import gcd
+
+try:
+    import soxr
+except ImportError:
+    soxr = None
 
 now_directory = os.getcwd()
 sys.path.append(now_directory)
 
 from rvc.lib.utils import load_audio
+from rvc.lib.spectral_gate import reduce_noise
 from rvc.train.preprocess.slicer import Slicer
+from rvc.train.cpu_workers import (
+    get_cpu_cores,
+    init_cpu_worker,
+    worker_thread_environment,
+)
+from rvc.train.preprocess.manifest import (
+    MANIFEST_VERSION,
+    load_manifest,
+    save_manifest,
+    describe_source,
+    remove_slices,
+)
 
 # Remove colab logs
 import logging
@@ -61,28 +79,65 @@ class PreProcess:
             return None
         return (audio / tmp_max * (MAX_AMPLITUDE * ALPHA)) + (1 - ALPHA) * audio
 
+    def resample_16k(self, audio: np.ndarray):
+        """
+        Resamples audio at the training sample rate to 16 kHz with a polyphase filter,
+        soxr when it is installed and scipy otherwise.
+
+        Args:
+            audio: The audio at self.sr.
+        """
+        if soxr is not None:
+            return soxr.resample(
+                audio.astype(np.float32), self.sr, SAMPLE_RATE_16K, quality="HQ"
+            )
+        ratio = gcd(self.sr, SAMPLE_RATE_16K)
+        return signal.resample_poly(
+            audio.astype(np.float32), SAMPLE_RATE_16K // ratio, self.sr // ratio
+        )
+
+    def segment_ranges(self, audio: np.ndarray, cut_preprocess: bool):
+        """
+        Returns the (start, end) sample indices of the segments written for an audio file.
+
+        Args:
+            audio: The processed audio at self.sr.
+            cut_preprocess: Whether to slice on silences and into overlapping windows of self.per seconds.
+        """
+        if not cut_preprocess:
+            return [(0, audio.shape[0])]
+        ranges = []
+        for segment_start, segment_end in self.slicer.slice_ranges(audio):
+            i = 0
+            while True:
+                start = int(self.sr * (self.per - OVERLAP) * i)
+                i += 1
+                remaining = segment_end - segment_start - start
+                if remaining > (self.per + OVERLAP) * self.sr:
+                    end = segment_start + start + int(self.per * self.sr)
+                    ranges.append((segment_start + start, end))
+                else:
+                    ranges.append((segment_start + start, segment_end))
+                    break
+        return ranges
+
     def process_audio_segment(
         self,
-        normalized_audio: np.ndarray,
+        audio: np.ndarray,
+        audio_16k: np.ndarray,
         sid: int,
         idx0: int,
         idx1: int,
     ):
-        if normalized_audio is None:
-            print(f"{sid}-{idx0}-{idx1}-filtered")
-            return
         wavfile.write(
             os.path.join(self.gt_wavs_dir, f"{sid}_{idx0}_{idx1}.wav"),
             self.sr,
-            normalized_audio.astype(np.float32),
-        )
-        audio_16k = librosa.resample(
-            normalized_audio, orig_sr=self.sr, target_sr=SAMPLE_RATE_16K
+            audio.astype(np.float32),
         )
         wavfile.write(
             os.path.join(self.wavs16k_dir, f"{sid}_{idx0}_{idx1}.wav"),
             SAMPLE_RATE_16K,
-            audio_16k.astype(np.float32),
+            audio_16k,
         )
 
     def process_audio(
@@ -102,48 +157,33 @@ class PreProcess:
             if process_effects:
                 audio = signal.lfilter(self.b_high, self.a_high, audio)
                 audio = self._normalize_audio(audio)
+                if audio is None:
+                    print(f"{sid}-{idx0}-filtered")
+                    return audio_length, []
             if noise_reduction:
-                audio = nr.reduce_noise(
-                    y=audio, sr=self.sr, prop_decrease=reduction_strength
+                audio = reduce_noise(
+                    audio, self.sr, reduction_strength, device=self.device
                 )
-            idx1 = 0
-            if cut_preprocess:
-                for audio_segment in self.slicer.slice(audio):
-                    i = 0
-                    while True:
-                        start = int(self.sr * (self.per - OVERLAP) * i)
-                        i += 1
-                        if len(audio_segment[start:]) > (self.per + OVERLAP) * self.sr:
-                            tmp_audio = audio_segment[
-                                start : start + int(self.per * self.sr)
-                            ]
-                            self.process_audio_segment(
-                                tmp_audio,
-                                sid,
-                                idx0,
-                                idx1,
-                            )
-                            idx1 += 1
-                        else:
-                            tmp_audio = audio_segment[start:]
-                            self.process_audio_segment(
-                                tmp_audio,
-                                sid,
-                                idx0,
-                                idx1,
-                            )
-                            idx1 += 1
-                            break
-            else:
+            # resample the whole file once and cut the same segments from both rates,
+            # instead of resampling every (overlapping) segment on its own
+            audio_16k = self.resample_16k(audio)
+            scale = audio_16k.shape[0] / audio.shape[0]
+            slices = []
+            for idx1, (start, end) in enumerate(
+                self.segment_ranges(audio, cut_preprocess)
+            ):
                 self.process_audio_segment(
-                    audio,
+                    audio[start:end],
+                    audio_16k[round(start * scale) : round(end * scale)],
                     sid,
                     idx0,
                     idx1,
                 )
+                slices.append(f"{sid}_{idx0}_{idx1}")
         except Exception as error:
             print(f"Error processing audio: {error}")
-        return audio_length
+            return audio_length, None
+        return audio_length, slices
 
 
 def format_duration(seconds):
@@ -176,7 +216,8 @@ def process_audio_wrapper(args):
         args
     )
     file_path, idx0, sid = file
-    return pp.process_audio(
+    description = describe_source(file_path)
+    audio_length, slices = pp.process_audio(
         file_path,
         idx0,
         sid,
@@ -185,6 +226,7 @@ def process_audio_wrapper(args):
         noise_reduction,
         reduction_strength,
     )
+    return description, audio_length, slices
 
 
 def preprocess_training_set(
@@ -200,48 +242,106 @@ def preprocess_training_set(
 ):
     start_time = time.time()
     pp = PreProcess(sr, exp_dir, per)
+    # one single-threaded process per core, more would only compete for the cores
+    num_processes = max(1, min(num_processes, len(get_cpu_cores())))
     print(f"Starting preprocess with {num_processes} processes...")
 
-    files = []
-    idx = 0
+    params = {
+        "sample_rate": sr,
+        "per": per,
+        "overlap": OVERLAP,
+        "cut_preprocess": bool(cut_preprocess),
+        "process_effects": bool(process_effects),
+        "noise_reduction": bool(noise_reduction),
+        "reduction_strength": reduction_strength if noise_reduction else None,
+    }
+    manifest = load_manifest(exp_dir)
+    if manifest is not None and manifest["params"] != params:
+        print("Preprocessing parameters changed, preprocessing every file again.")
+        manifest = None
+    if manifest is None:
+        # slices of earlier runs can not be traced back to their source files
+        remove_slices(
+            exp_dir,
+            [os.path.splitext(name)[0] for name in os.listdir(pp.gt_wavs_dir)],
+        )
+        manifest = {"version": MANIFEST_VERSION, "params": params, "sources": {}}
+    known = manifest["sources"]
 
+    files = {}
     for root, _, filenames in os.walk(input_root):
         try:
             sid = 0 if root == input_root else int(os.path.basename(root))
             for f in filenames:
                 if f.lower().endswith((".wav", ".mp3", ".flac", ".ogg")):
-                    files.append((os.path.join(root, f), idx, sid))
-                    idx += 1
+                    files[os.path.abspath(os.path.join(root, f))] = sid
         except ValueError:
             print(
                 f'Speaker ID folder is expected to be integer, got "{os.path.basename(root)}" instead.'
             )
 
-    # print(f"Number of files: {len(files)}")
-    audio_length = []
-    with tqdm(total=len(files)) as pbar:
-        with concurrent.futures.ProcessPoolExecutor(
-            max_workers=num_processes
-        ) as executor:
-            futures = [
-                executor.submit(
-                    process_audio_wrapper,
-                    (
-                        pp,
-                        file,
-                        cut_preprocess,
-                        process_effects,
-                        noise_reduction,
-                        reduction_strength,
-                    ),
-                )
-                for file in files
-            ]
-            for future in concurrent.futures.as_completed(futures):
-                audio_length.append(future.result())
-                pbar.update(1)
+    # only new and changed files are processed, keeping the slice names of changed ones
+    sources = {}
+    pending = []
+    next_idx0 = max((source["idx0"] for source in known.values()), default=-1) + 1
+    for path, sid in files.items():
+        entry = known.get(path)
+        if entry is None or entry["sid"] != sid:
+            if entry is not None:
+                remove_slices(exp_dir, entry["slices"])
+            pending.append((path, next_idx0, sid))
+            next_idx0 += 1
+            continue
+        description = describe_source(path, entry)
+        if description["hash"] == entry["hash"]:
+            sources[path] = {**entry, **description}
+            continue
+        remove_slices(exp_dir, entry["slices"])
+        pending.append((path, entry["idx0"], sid))
+    removed = [path for path in known if path not in files]
+    for path in removed:
+        remove_slices(exp_dir, known[path]["slices"])
+    print(
+        f"{len(pending)} new or changed files, {len(sources)} up to date, {len(removed)} removed."
+    )
+
+    if pending:
+        with tqdm(total=len(pending)) as pbar:
+            with worker_thread_environment(1), concurrent.futures.ProcessPoolExecutor(
+                max_workers=num_processes, initializer=init_cpu_worker, initargs=(1,)
+            ) as executor:
+                futures = {
+                    executor.submit(
+                        process_audio_wrapper,
+                        (
+                            pp,
+                            file,
+                            cut_preprocess,
+                            process_effects,
+                            noise_reduction,
+                            reduction_strength,
+                        ),
+                    ): file
+                    for file in pending
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    path, idx0, sid = futures[future]
+                    description, audio_length, slices = future.result()
+                    # failed files are left out so the next run tries them again
+                    if slices is not None:
+                        sources[path] = {
+                            **description,
+                            "sid": sid,
+                            "idx0": idx0,
+                            "duration": audio_length,
+                            "slices": slices,
+                        }
+                    pbar.update(1)
 
-    audio_length = sum(audio_length)
+    manifest["sources"] = dict(sorted(sources.items()))
+    save_manifest(exp_dir, manifest)
+
+    audio_length = sum(source["duration"] for source in sources.values())
     save_dataset_duration(
         os.path.join(exp_dir, "model_info.json"), dataset_duration=audio_length
     )
@@ -251,7 +351,78 @@ def preprocess_training_set(
     )
 
 
+def benchmark(
+    seconds: float = 600.0, sr: int = 40000, per: float = 3.0, repeats: int = 3
+):
+    """
+    Compares resampling every segment to 16 kHz with librosa's former default kaiser_best
+    filter against resampling the whole audio once, with that filter and with the polyphase
+    resampler used by PreProcess.
+
+    Args:
+        seconds: Length of the synthetic audio.
+        sr: Training sample rate.
+        per: Segment length in seconds.
+        repeats: Timed runs, the fastest is reported.
+    """
+    import tempfile
+    from rvc.infer.benchmark import generate_voiced_audio
+
+    audio = generate_voiced_audio(seconds, sr).astype(np.float64)
+    # a second of near silence every ten seconds for the slicer to cut at
+    t = np.arange(audio.shape[0]) / sr
+    audio[t % 10 >= 9] *= 0.001
+
+    def fastest(function):
+        timings = []
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start_time)
+        return min(timings)
+
+    with tempfile.TemporaryDirectory() as exp_dir:
+        pp = PreProcess(sr, exp_dir, per)
+        ranges = pp.segment_ranges(audio, True)
+        per_segment = fastest(
+            lambda: [
+                librosa.resample(
+                    audio[start:end],
+                    orig_sr=sr,
+                    target_sr=SAMPLE_RATE_16K,
+                    res_type="kaiser_best",
+                )
+                for start, end in ranges
+            ]
+        )
+        single_pass = fastest(
+            lambda: librosa.resample(
+                audio, orig_sr=sr, target_sr=SAMPLE_RATE_16K, res_type="kaiser_best"
+            )
+        )
+        polyphase = fastest(lambda: pp.resample_16k(audio))
+    return {
+        "seconds": seconds,
+        "sample_rate": sr,
+        "polyphase_resampler": "soxr" if soxr is not None else "scipy",
+        "segments": len(ranges),
+        "resampled_seconds_per_segment": sum(end - start for start, end in ranges)
+        / sr,
+        "per_segment_librosa_seconds": per_segment,
+        "single_pass_librosa_seconds": single_pass,
+        "single_pass_polyphase_seconds": polyphase,
+        "per_segment_librosa_realtime": seconds / per_segment,
+        "single_pass_polyphase_realtime": seconds / polyphase,
+        "speedup": per_segment / polyphase,
+    }
+
+
 if __name__ == "__main__":
+    if sys.argv[1] == "benchmark":
+        seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 600.0
+        sample_rate = int(sys.argv[3]) if len(sys.argv) > 3 else 40000
+        print(json.dumps(benchmark(seconds, sample_rate), indent=2))
+        sys.exit(0)
     experiment_directory = str(sys.argv[1])
     input_root = str(sys.argv[2])
     sample_rate = int(sys.argv[3])
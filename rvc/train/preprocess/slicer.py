@@ -1,3 +1,4 @@
+import sys
 import numpy as np
 
 
@@ -15,6 +16,7 @@ class Slicer:
 
     Methods:
         slice(waveform): Slices the given waveform into segments.
+        slice_ranges(waveform): Returns the sample ranges of the segments.
     """
 
     def __init__(
@@ -54,53 +56,64 @@ class Slicer:
         self.min_interval = round(min_interval / self.hop_size)
         self.max_sil_kept = round(sr * max_sil_kept / 1000 / self.hop_size)
 
-    def _apply_slice(self, waveform, begin, end):
+    def _sample_range(self, begin, end, length):
         """
-        Applies a slice to the waveform.
+        Converts a range of RMS frames to a range of samples.
 
         Args:
-            waveform (numpy.ndarray): The waveform to slice.
             begin (int): Start frame index.
             end (int): End frame index.
+            length (int): Number of samples of the waveform.
         """
-        start_idx = begin * self.hop_size
-        if len(waveform.shape) > 1:
-            end_idx = min(waveform.shape[1], end * self.hop_size)
-            return waveform[:, start_idx:end_idx]
-        else:
-            end_idx = min(waveform.shape[0], end * self.hop_size)
-            return waveform[start_idx:end_idx]
+        return begin * self.hop_size, min(length, end * self.hop_size)
 
     def slice(self, waveform):
         """
         Slices the given waveform into segments.
 
+        Args:
+            waveform (numpy.ndarray): The waveform to slice.
+        """
+        return [waveform[..., start:end] for start, end in self.slice_ranges(waveform)]
+
+    def slice_ranges(self, waveform):
+        """
+        Returns the (start, end) sample indices of the segments slice would return.
+
         Args:
             waveform (numpy.ndarray): The waveform to slice.
         """
         # Calculate RMS for each frame
         samples = waveform.mean(axis=0) if len(waveform.shape) > 1 else waveform
-        if samples.shape[0] <= self.min_length:
-            return [waveform]
+        length = samples.shape[0]
+        if length <= self.min_length:
+            return [(0, length)]
 
         rms_list = get_rms(
             y=samples, frame_length=self.win_size, hop_length=self.hop_size
         ).squeeze(0)
 
-        # Detect silence segments and mark them
-        sil_tags = []
-        silence_start, clip_start = None, 0
-        for i, rms in enumerate(rms_list):
-            # If current frame is silent
-            if rms < self.threshold:
-                if silence_start is None:
-                    silence_start = i
-                continue
+        # Find the runs of silent frames, as [start, end) frame indices
+        total_frames = rms_list.shape[0]
+        silent = (rms_list < self.threshold).astype(np.int8)
+        edges = np.flatnonzero(np.diff(silent, prepend=0, append=0))
+        run_starts, run_ends = edges[0::2], edges[1::2]
+        trailing_start = None
+        if run_ends.size and run_ends[-1] == total_frames:
+            trailing_start = run_starts[-1]
+            run_starts, run_ends = run_starts[:-1], run_ends[:-1]
 
-            # If current frame is not silent
-            if silence_start is None:
-                continue
+        # Only leading silences and runs of at least min_interval frames can be cut at
+        candidates = (run_ends - run_starts >= self.min_interval) | (
+            (run_starts == 0) & (run_ends > self.max_sil_kept)
+        )
 
+        # Mark the silences to cut at, in order since each cut moves clip_start
+        sil_tags = []
+        clip_start = 0
+        for silence_start, i in zip(
+            run_starts[candidates].tolist(), run_ends[candidates].tolist()
+        ):
             # Check if current silence segment is leading silence or need to slice
             is_leading_silence = silence_start == 0 and i > self.max_sil_kept
             need_slice_middle = (
@@ -110,7 +123,6 @@ class Slicer:
 
             # If not leading silence and not need to slice middle
             if not is_leading_silence and not need_slice_middle:
-                silence_start = None
                 continue
 
             # Handle different cases of silence segments
@@ -163,37 +175,35 @@ class Slicer:
                 else:
                     sil_tags.append((pos_l, pos_r))
                 clip_start = pos_r
-            silence_start = None
 
         # Handle trailing silence
-        total_frames = rms_list.shape[0]
         if (
-            silence_start is not None
-            and total_frames - silence_start >= self.min_interval
+            trailing_start is not None
+            and total_frames - trailing_start >= self.min_interval
         ):
-            silence_end = min(total_frames, silence_start + self.max_sil_kept)
-            pos = rms_list[silence_start : silence_end + 1].argmin() + silence_start
+            silence_end = min(total_frames, trailing_start + self.max_sil_kept)
+            pos = rms_list[trailing_start : silence_end + 1].argmin() + trailing_start
             sil_tags.append((pos, total_frames + 1))
 
         # Extract segments based on silence tags
         if not sil_tags:
-            return [waveform]
+            return [(0, length)]
         else:
-            chunks = []
+            ranges = []
             if sil_tags[0][0] > 0:
-                chunks.append(self._apply_slice(waveform, 0, sil_tags[0][0]))
+                ranges.append(self._sample_range(0, sil_tags[0][0], length))
 
             for i in range(len(sil_tags) - 1):
-                chunks.append(
-                    self._apply_slice(waveform, sil_tags[i][1], sil_tags[i + 1][0])
+                ranges.append(
+                    self._sample_range(sil_tags[i][1], sil_tags[i + 1][0], length)
                 )
 
             if sil_tags[-1][1] < total_frames:
-                chunks.append(
-                    self._apply_slice(waveform, sil_tags[-1][1], total_frames)
+                ranges.append(
+                    self._sample_range(sil_tags[-1][1], total_frames, length)
                 )
 
-            return chunks
+            return ranges
 
 
 def get_rms(
@@ -233,3 +243,172 @@ def get_rms(
 
     power = np.mean(np.abs(x) ** 2, axis=-2, keepdims=True)
     return np.sqrt(power)
+
+
+def _reference_slice_ranges(slicer, waveform):
+    """
+    Frozen copy of the per-frame loop Slicer used before slice_ranges, kept for check.
+
+    Args:
+        slicer (Slicer): The slicer whose parameters to use.
+        waveform (numpy.ndarray): The waveform to slice.
+    """
+    samples = waveform.mean(axis=0) if len(waveform.shape) > 1 else waveform
+    length = samples.shape[0]
+    if length <= slicer.min_length:
+        return [(0, length)]
+
+    rms_list = get_rms(
+        y=samples, frame_length=slicer.win_size, hop_length=slicer.hop_size
+    ).squeeze(0)
+
+    sil_tags = []
+    silence_start, clip_start = None, 0
+    for i, rms in enumerate(rms_list):
+        if rms < slicer.threshold:
+            if silence_start is None:
+                silence_start = i
+            continue
+
+        if silence_start is None:
+            continue
+
+        is_leading_silence = silence_start == 0 and i > slicer.max_sil_kept
+        need_slice_middle = (
+            i - silence_start >= slicer.min_interval
+            and i - clip_start >= slicer.min_length
+        )
+
+        if not is_leading_silence and not need_slice_middle:
+            silence_start = None
+            continue
+
+        if i - silence_start <= slicer.max_sil_kept:
+            pos = rms_list[silence_start : i + 1].argmin() + silence_start
+            if silence_start == 0:
+                sil_tags.append((0, pos))
+            else:
+                sil_tags.append((pos, pos))
+            clip_start = pos
+        elif i - silence_start <= slicer.max_sil_kept * 2:
+            pos = rms_list[
+                i - slicer.max_sil_kept : silence_start + slicer.max_sil_kept + 1
+            ].argmin()
+            pos += i - slicer.max_sil_kept
+            pos_l = (
+                rms_list[
+                    silence_start : silence_start + slicer.max_sil_kept + 1
+                ].argmin()
+                + silence_start
+            )
+            pos_r = (
+                rms_list[i - slicer.max_sil_kept : i + 1].argmin()
+                + i
+                - slicer.max_sil_kept
+            )
+            if silence_start == 0:
+                sil_tags.append((0, pos_r))
+                clip_start = pos_r
+            else:
+                sil_tags.append((min(pos_l, pos), max(pos_r, pos)))
+                clip_start = max(pos_r, pos)
+        else:
+            pos_l = (
+                rms_list[
+                    silence_start : silence_start + slicer.max_sil_kept + 1
+                ].argmin()
+                + silence_start
+            )
+            pos_r = (
+                rms_list[i - slicer.max_sil_kept : i + 1].argmin()
+                + i
+                - slicer.max_sil_kept
+            )
+            if silence_start == 0:
+                sil_tags.append((0, pos_r))
+            else:
+                sil_tags.append((pos_l, pos_r))
+            clip_start = pos_r
+        silence_start = None
+
+    total_frames = rms_list.shape[0]
+    if (
+        silence_start is not None
+        and total_frames - silence_start >= slicer.min_interval
+    ):
+        silence_end = min(total_frames, silence_start + slicer.max_sil_kept)
+        pos = rms_list[silence_start : silence_end + 1].argmin() + silence_start
+        sil_tags.append((pos, total_frames + 1))
+
+    if not sil_tags:
+        return [(0, length)]
+    ranges = []
+    if sil_tags[0][0] > 0:
+        ranges.append(slicer._sample_range(0, sil_tags[0][0], length))
+    for i in range(len(sil_tags) - 1):
+        ranges.append(slicer._sample_range(sil_tags[i][1], sil_tags[i + 1][0], length))
+    if sil_tags[-1][1] < total_frames:
+        ranges.append(slicer._sample_range(sil_tags[-1][1], total_frames, length))
+    return ranges
+
+
+def _random_case(rng):
+    # blocks of noise at random lengths and levels around typical thresholds, with
+    # random slicer parameters satisfying the constructor's constraints
+    sr = int(rng.choice([16000, 32000, 40000, 48000]))
+    length = int(rng.integers(sr // 10, sr * 40))
+    waveform = np.zeros(length)
+    position = 0
+    while position < length:
+        block = int(rng.exponential(sr * rng.choice([0.05, 0.3, 1.0, 3.0]))) + 1
+        level = rng.choice([0, 1e-5, 1e-3, 0.005, 0.008, 0.1, 0.5])
+        end = min(length, position + block)
+        waveform[position:end] = level * rng.standard_normal(end - position)
+        position = end
+    if rng.random() < 0.2:
+        waveform = np.stack([waveform, waveform * rng.uniform(0, 1)])
+    min_interval = int(rng.integers(30, 800))
+    hop_size = min(int(rng.integers(5, 30)), min_interval)
+    params = dict(
+        sr=sr,
+        threshold=float(rng.uniform(-60, -30)),
+        min_length=int(rng.integers(min_interval, 6000)),
+        min_interval=min_interval,
+        hop_size=hop_size,
+        max_sil_kept=int(rng.integers(hop_size, 3000)),
+    )
+    return waveform, params
+
+
+def check(cases: int = 400, seed: int = 0):
+    """
+    Checks that slice_ranges returns the cut points of the old per-frame loop on random
+    waveforms and parameters, raising a ValueError on the first difference.
+
+    Args:
+        cases (int, optional): Number of random waveforms. Defaults to 400.
+        seed (int, optional): Seed of the random corpus. Defaults to 0.
+    """
+    rng = np.random.default_rng(seed)
+    segments = 0
+    for case in range(cases):
+        waveform, params = _random_case(rng)
+        slicer = Slicer(**params)
+        ranges = slicer.slice_ranges(waveform)
+        expected = _reference_slice_ranges(slicer, waveform)
+        if ranges != expected:
+            raise ValueError(
+                f"Case {case} with {params} is cut at {ranges}, the old loop cuts at {expected}."
+            )
+        segments += len(ranges)
+    return {"cases": cases, "segments": segments, "mismatches": 0}
+
+
+if __name__ == "__main__":
+    import json
+
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        cases = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+        print(json.dumps(check(cases), indent=2))
+    else:
+        print("Unknown command, expected 'check'")
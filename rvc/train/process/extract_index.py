@@ -1,90 +1,698 @@
 import os
 import sys
+import json
+import time
+import hashlib
 import faiss
 import numpy as np
-from sklearn.cluster import MiniBatchKMeans
-from multiprocessing import cpu_count
 
-# Parse command line arguments
-exp_dir = str(sys.argv[1])
-version = str(sys.argv[2])
-index_algorithm = str(sys.argv[3])
+INDEX_TYPES = ["Flat", "IVF-Flat", "IVF-PQ", "HNSW", "SQ"]
+# PQ sub-quantizers by feature dimension, they have to divide it
+DEFAULT_PQ_M = {256: 32, 768: 64}
+# IVF training vectors per list, and at most this many in total (768 MB of 768-dim features)
+TRAIN_VECTORS_PER_LIST = 64
+MAX_TRAIN_VECTORS = 1 << 18
 
-try:
-    feature_dir = os.path.join(exp_dir, f"{version}_extracted")
-    model_name = os.path.basename(exp_dir)
 
-    index_filename_added = f"added_{model_name}_{version}.index"
-    index_filepath_added = os.path.join(exp_dir, index_filename_added)
+def list_feature_files(feature_dir: str) -> list:
+    """
+    Lists the feature files of an experiment in index order.
 
-    # index_filename_trained = f"trained_{model_name}_{version}.index"
-    # index_filepath_trained = os.path.join(exp_dir, index_filename_trained)
+    Args:
+        feature_dir (str): Directory containing the extracted .npy features.
+    """
+    return sorted(name for name in os.listdir(feature_dir) if name.endswith(".npy"))
 
-    if os.path.exists(index_filepath_added):
-        pass
-    else:
-        npys = []
-        listdir_res = sorted(os.listdir(feature_dir))
 
-        for name in listdir_res:
-            file_path = os.path.join(feature_dir, name)
-            phone = np.load(file_path)
-            npys.append(phone)
+class FeatureStore:
+    """
+    Memory-mapped view over the per-slice feature files of an experiment.
+
+    Features are streamed from disk in fixed-size chunks, so building an index never needs
+    more than one chunk plus the training sample in memory.
+    """
+
+    def __init__(self, feature_dir: str, names: list = None):
+        """
+        Initializes the FeatureStore by reading the headers of the feature files.
+
+        Args:
+            feature_dir (str): Directory containing the extracted .npy features.
+            names (list, optional): Feature file names to include. Defaults to all of them.
+        """
+        if names is None:
+            names = list_feature_files(feature_dir)
+        self.feature_dir = feature_dir
+        self.names = names
+        self.paths = [os.path.join(feature_dir, name) for name in names]
+        shapes = [np.load(path, mmap_mode="r").shape for path in self.paths]
+        self.lengths = [shape[0] for shape in shapes]
+        self.total = sum(self.lengths)
+        self.dim = shapes[0][1] if shapes else 0
+
+    def iter_chunks(self, chunk_size: int = 8192):
+        """
+        Yields contiguous float32 chunks of at most chunk_size vectors, in file order.
+
+        Args:
+            chunk_size (int): Maximum number of vectors per chunk.
+        """
+        buffer, buffered = [], 0
+        for path in self.paths:
+            features = np.load(path, mmap_mode="r")
+            start = 0
+            while start < features.shape[0]:
+                take = min(chunk_size - buffered, features.shape[0] - start)
+                buffer.append(features[start : start + take])
+                buffered += take
+                start += take
+                if buffered == chunk_size:
+                    yield np.ascontiguousarray(np.concatenate(buffer), dtype=np.float32)
+                    buffer, buffered = [], 0
+        if buffered:
+            yield np.ascontiguousarray(np.concatenate(buffer), dtype=np.float32)
+
+    def reservoir_sample(self, n_samples: int, seed: int = 0) -> np.ndarray:
+        """
+        Draws a uniform sample of vectors in a single streaming pass (reservoir sampling).
+
+        Args:
+            n_samples (int): Number of vectors to sample.
+            seed (int): Seed of the random generator.
+        """
+        n_samples = min(n_samples, self.total)
+        rng = np.random.default_rng(seed)
+        reservoir = np.empty((n_samples, self.dim), dtype=np.float32)
+        seen = 0
+        for chunk in self.iter_chunks():
+            positions = np.arange(seen, seen + chunk.shape[0])
+            fill = positions < n_samples
+            reservoir[positions[fill]] = chunk[fill]
+            # every later vector replaces a random slot with probability n_samples / (position + 1)
+            rows = np.flatnonzero(~fill)
+            if rows.size:
+                slots = rng.integers(0, positions[rows] + 1)
+                keep = slots < n_samples
+                slots, rows = slots[keep], rows[keep]
+                # later rows win when several hit the same slot, as in the sequential algorithm
+                _, last = np.unique(slots[::-1], return_index=True)
+                last = slots.size - 1 - last
+                reservoir[slots[last]] = chunk[rows[last]]
+            seen += chunk.shape[0]
+        return reservoir
+
+
+def get_speaker_id(name: str) -> str:
+    """
+    Returns the speaker id prefix of a feature file name ("<sid>_<idx0>_<idx1>.npy").
+
+    Args:
+        name (str): Feature file name.
+    """
+    return name.split("_")[0]
+
+
+def add_speaker_ranges(speaker_ranges: dict, blocks: list, offset: int) -> dict:
+    """
+    Extends the per-speaker id ranges of an index with consecutive blocks of vectors.
+
+    Args:
+        speaker_ranges (dict): Existing ranges, mapping speaker id to a list of [start, end) pairs.
+        blocks (list): (speaker id, number of vectors) pairs in insertion order.
+        offset (int): Id of the first vector of the first block.
+    """
+    for sid, count in blocks:
+        ranges = speaker_ranges.setdefault(sid, [])
+        if ranges and ranges[-1][1] == offset:
+            ranges[-1][1] += count
+        else:
+            ranges.append([offset, offset + count])
+        offset += count
+    return speaker_ranges
+
+
+def get_n_ivf(n_vectors: int, index_params: dict) -> int:
+    """
+    Returns the number of IVF lists, either from the index parameters or derived from the dataset size.
+
+    Args:
+        n_vectors (int): Number of vectors the index is trained on.
+        index_params (dict): Tunable index parameters.
+    """
+    if "nlist" in index_params:
+        return int(index_params["nlist"])
+    return max(1, min(int(16 * np.sqrt(n_vectors)), n_vectors // 39))
 
-        big_npy = np.concatenate(npys, axis=0)
 
-        big_npy_idx = np.arange(big_npy.shape[0])
-        np.random.shuffle(big_npy_idx)
-        big_npy = big_npy[big_npy_idx]
+def get_pq_m(dim: int, index_params: dict) -> int:
+    """
+    Returns the number of PQ sub-quantizers, raising a ValueError when it doesn't divide the dimension.
 
-        if big_npy.shape[0] > 2e5 and (
-            index_algorithm == "Auto" or index_algorithm == "KMeans"
+    Args:
+        dim (int): Dimension of the feature vectors.
+        index_params (dict): Tunable index parameters.
+    """
+    if "pq_m" not in index_params:
+        if dim in DEFAULT_PQ_M:
+            return DEFAULT_PQ_M[dim]
+        return max(m for m in range(1, max(1, dim // 8) + 1) if dim % m == 0)
+    pq_m = int(index_params["pq_m"])
+    if pq_m <= 0 or dim % pq_m != 0:
+        divisors = [m for m in range(1, dim + 1) if dim % m == 0]
+        raise ValueError(
+            f"pq_m must divide the feature dimension {dim}, got {pq_m}. Valid values: {divisors}."
+        )
+    return pq_m
+
+
+def get_index_factory_string(
+    index_type: str, n_vectors: int, dim: int, index_params: dict
+) -> str:
+    """
+    Builds the FAISS index factory string for the selected index type.
+
+    Args:
+        index_type (str): One of INDEX_TYPES.
+        n_vectors (int): Number of vectors the index is trained on.
+        dim (int): Dimension of the feature vectors.
+        index_params (dict): Tunable index parameters.
+    """
+    if index_type == "Flat":
+        return "Flat"
+    elif index_type == "IVF-Flat":
+        return f"IVF{get_n_ivf(n_vectors, index_params)},Flat"
+    elif index_type == "IVF-PQ":
+        pq_m = get_pq_m(dim, index_params)
+        pq_nbits = int(index_params.get("pq_nbits", 8))
+        return f"IVF{get_n_ivf(n_vectors, index_params)},PQ{pq_m}x{pq_nbits}"
+    elif index_type == "HNSW":
+        return f"HNSW{int(index_params.get('hnsw_m', 32))}"
+    elif index_type == "SQ":
+        return index_params.get("sq_type", "SQ8")
+    raise ValueError(f"Unknown index type: {index_type}")
+
+
+def configure_index(index, index_type: str, index_params: dict):
+    """
+    Applies the search-time parameters of the selected index type.
+
+    Args:
+        index: The FAISS index.
+        index_type (str): One of INDEX_TYPES.
+        index_params (dict): Tunable index parameters.
+    """
+    if index_type.startswith("IVF"):
+        faiss.extract_index_ivf(index).nprobe = int(index_params.get("nprobe", 1))
+    elif index_type == "HNSW":
+        index.hnsw.efConstruction = int(index_params.get("ef_construction", 40))
+        index.hnsw.efSearch = int(index_params.get("ef_search", 64))
+
+
+def benchmark_index(
+    index, index_path: str, queries: np.ndarray, database_chunks, k: int = 8
+):
+    """
+    Measures recall@k against exact search, query latency and file size of an index.
+
+    Args:
+        index: The FAISS index to benchmark.
+        index_path (str): Path the index was written to.
+        queries (np.ndarray): Feature vectors used as queries.
+        database_chunks: Iterable over the vectors stored in the index, in insertion order.
+        k (int): Number of neighbours retrieved per query.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+
+    # exact search streamed over the database, merging per-chunk results
+    heap = faiss.ResultHeap(queries.shape[0], k)
+    offset = 0
+    for chunk in database_chunks:
+        distances, ix = faiss.knn(queries, chunk, min(k, chunk.shape[0]))
+        if ix.shape[1] < k:
+            pad = ((0, 0), (0, k - ix.shape[1]))
+            distances = np.pad(distances, pad, constant_values=np.inf)
+            ix = np.pad(ix, pad, constant_values=-1 - offset)
+        heap.add_result(distances, ix + offset)
+        offset += chunk.shape[0]
+    heap.finalize()
+    ground_truth = heap.I
+
+    start_time = time.perf_counter()
+    _, ix = index.search(queries, k)
+    latency = (time.perf_counter() - start_time) / queries.shape[0]
+
+    recall = np.mean(
+        [
+            len(set(found[found >= 0]) & set(expected[expected >= 0])) / k
+            for found, expected in zip(ix, ground_truth)
+        ]
+    )
+    return {
+        f"recall_at_{k}": round(float(recall), 4),
+        "latency_ms_per_query": round(latency * 1000, 4),
+        "file_size_mb": round(os.path.getsize(index_path) / 1024**2, 2),
+    }
+
+
+def get_manifest_path(index_path: str) -> str:
+    """
+    Returns the path of the manifest stored next to an index file.
+
+    Args:
+        index_path (str): Path to the index file.
+    """
+    return os.path.splitext(index_path)[0] + ".json"
+
+
+def hash_file(file_path: str) -> str:
+    """
+    Computes the SHA-256 content hash of a file.
+
+    Args:
+        file_path (str): Path to the file.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def describe_feature_files(feature_dir: str, names: list, known: dict = None) -> dict:
+    """
+    Returns size, mtime and content hash of feature files, reusing known hashes of unchanged files.
+
+    Args:
+        feature_dir (str): Directory containing the extracted .npy features.
+        names (list): Feature file names to describe.
+        known (dict, optional): File entries of an existing manifest.
+    """
+    known = known or {}
+    files = {}
+    for name in names:
+        stat = os.stat(os.path.join(feature_dir, name))
+        entry = known.get(name)
+        if (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime"] == stat.st_mtime
         ):
-            big_npy = (
-                MiniBatchKMeans(
-                    n_clusters=10000,
-                    verbose=True,
-                    batch_size=256 * cpu_count(),
-                    compute_labels=False,
-                    init="random",
+            content_hash = entry["hash"]
+        else:
+            content_hash = hash_file(os.path.join(feature_dir, name))
+        files[name] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "hash": content_hash,
+        }
+    return files
+
+
+def get_mean_coarse_distance(index, vectors: np.ndarray) -> float:
+    """
+    Returns the mean distance of vectors to their nearest IVF centroid.
+
+    Args:
+        index: An IVF FAISS index.
+        vectors (np.ndarray): Vectors to assign to the coarse quantizer.
+    """
+    distances, _ = faiss.extract_index_ivf(index).quantizer.search(vectors, 1)
+    return float(distances.mean())
+
+
+def get_imbalance_factor(index) -> float:
+    """
+    Returns the imbalance factor of the inverted lists of an IVF index (1.0 is perfectly balanced).
+
+    Args:
+        index: An IVF FAISS index.
+    """
+    ivf = faiss.extract_index_ivf(index)
+    sizes = np.array(
+        [ivf.invlists.list_size(i) for i in range(ivf.nlist)], dtype=np.float64
+    )
+    total = sizes.sum()
+    return float(ivf.nlist * np.square(sizes).sum() / total**2) if total else 1.0
+
+
+def save_index_info(exp_dir: str, index_info: dict):
+    """
+    Records the chosen index and its measured numbers in model_info.json.
+
+    Args:
+        exp_dir (str): Experiment directory.
+        index_info (dict): Index description to store under the "index" key.
+    """
+    file_path = os.path.join(exp_dir, "model_info.json")
+    if os.path.exists(file_path):
+        with open(file_path, "r") as f:
+            data = json.load(f)
+    else:
+        data = {}
+    data.update({"index": index_info})
+    with open(file_path, "w") as f:
+        json.dump(data, f, indent=4)
+
+
+def kmeans_reduce(
+    store: FeatureStore, dim: int, n_clusters: int, index_params: dict
+) -> np.ndarray:
+    """
+    Reduces the features of a FeatureStore to KMeans centroids with FAISS's multithreaded clustering.
+
+    Args:
+        store (FeatureStore): Features to cluster.
+        dim (int): Dimension of the feature vectors.
+        n_clusters (int): Number of centroids.
+        index_params (dict): Tunable index parameters.
+    """
+    kmeans_sample = store.reservoir_sample(
+        n_clusters * int(index_params.get("kmeans_points_per_centroid", 40))
+    )
+    kmeans = faiss.Kmeans(
+        dim,
+        n_clusters,
+        niter=int(index_params.get("kmeans_niter", 20)),
+        verbose=True,
+        seed=1234,
+        max_points_per_centroid=max(1, kmeans_sample.shape[0] // n_clusters),
+    )
+    kmeans.train(kmeans_sample)
+    return np.ascontiguousarray(kmeans.centroids, dtype=np.float32)
+
+
+def build_index(
+    store: FeatureStore,
+    dim: int,
+    index_algorithm: str,
+    index_type: str,
+    index_params: dict,
+    speaker_partitioned: bool = False,
+):
+    """
+    Trains a new index and fills it with the vectors of a FeatureStore.
+
+    Args:
+        store (FeatureStore): Features to index.
+        dim (int): Dimension of the feature vectors.
+        index_algorithm (str): "Auto", "Faiss" or "KMeans".
+        index_type (str): One of INDEX_TYPES.
+        index_params (dict): Tunable index parameters.
+        speaker_partitioned (bool, optional): Whether to record the id range of every speaker.
+
+    Returns:
+        The index, its factory string, a callable yielding the indexed vectors in order,
+        the training statistics stored in the manifest and the speaker id ranges.
+    """
+    if index_type == "IVF-PQ":
+        # fail before sampling and clustering instead of in FAISS
+        get_pq_m(dim, index_params)
+    kmeans_reduced = store.total > 2e5 and (
+        index_algorithm == "Auto" or index_algorithm == "KMeans"
+    )
+    if kmeans_reduced:
+        n_clusters = 10000
+        if speaker_partitioned:
+            # cluster every speaker on its own so the centroids keep their speaker
+            speakers = {}
+            for name in store.names:
+                speakers.setdefault(get_speaker_id(name), []).append(name)
+            centroids, blocks = [], []
+            for sid, names in speakers.items():
+                speaker_store = FeatureStore(store.feature_dir, names)
+                speaker_clusters = min(
+                    speaker_store.total,
+                    max(1, round(n_clusters * speaker_store.total / store.total)),
                 )
-                .fit(big_npy)
-                .cluster_centers_
-            )
+                centroids.append(
+                    kmeans_reduce(speaker_store, dim, speaker_clusters, index_params)
+                )
+                blocks.append((sid, speaker_clusters))
+            centroids = np.concatenate(centroids)
+        else:
+            centroids = kmeans_reduce(store, dim, n_clusters, index_params)
+            blocks = None
+        n_vectors = centroids.shape[0]
+        train_sample = centroids
+
+        def database_chunks():
+            return iter([centroids])
+
+    else:
+        n_vectors = store.total
+        # a bounded sample, so the reservoir never holds the whole feature set
+        n_train = min(
+            n_vectors,
+            TRAIN_VECTORS_PER_LIST * get_n_ivf(n_vectors, index_params),
+            int(index_params.get("max_train_vectors", MAX_TRAIN_VECTORS)),
+        )
+        train_sample = (
+            store.reservoir_sample(n_train)
+            if index_type not in ("Flat", "HNSW")
+            else None
+        )
+        database_chunks = store.iter_chunks
+        blocks = [
+            (get_speaker_id(name), length)
+            for name, length in zip(store.names, store.lengths)
+        ]
 
-        # np.save(os.path.join(exp_dir, "total_fea.npy"), big_npy)
+    factory_string = get_index_factory_string(
+        index_type, n_vectors, dim, index_params
+    )
 
-        n_ivf = min(int(16 * np.sqrt(big_npy.shape[0])), big_npy.shape[0] // 39)
+    index = faiss.index_factory(dim, factory_string)
+    configure_index(index, index_type, index_params)
+    if train_sample is not None:
+        index.train(train_sample)
 
-        """
-        # index_trained
-        index_trained = faiss.index_factory(
-            256 if version == "v1" else 768, f"IVF{n_ivf},Flat"
+    for chunk in database_chunks():
+        index.add(chunk)
+
+    training = {"kmeans_reduced": kmeans_reduced}
+    if index_type.startswith("IVF"):
+        training["mean_distance"] = get_mean_coarse_distance(index, train_sample)
+        training["imbalance_factor"] = get_imbalance_factor(index)
+    speaker_ranges = (
+        add_speaker_ranges({}, blocks, 0)
+        if speaker_partitioned and blocks is not None
+        else None
+    )
+    return index, factory_string, database_chunks, training, speaker_ranges
+
+
+def update_index(
+    index,
+    manifest: dict,
+    store: FeatureStore,
+    index_params: dict,
+) -> bool:
+    """
+    Adds the vectors of new feature files to an existing index.
+
+    IVF indexes keep their trained centroids unless the new vectors drift away from them or
+    the inverted lists become too unbalanced, in which case False is returned and the caller
+    rebuilds the index from scratch.
+
+    Args:
+        index: The existing FAISS index.
+        manifest (dict): Manifest of the existing index.
+        store (FeatureStore): Features of the new files only.
+        index_params (dict): Tunable index parameters.
+    """
+    training = manifest["training"]
+    is_ivf = manifest["type"].startswith("IVF")
+    if is_ivf:
+        sample = store.reservoir_sample(int(index_params.get("drift_sample", 10000)))
+        drift = get_mean_coarse_distance(index, sample) / max(
+            training["mean_distance"], 1e-12
         )
-        index_ivf_trained = faiss.extract_index_ivf(index_trained)
-        index_ivf_trained.nprobe = 1
-        index_trained.train(big_npy)
+        print(f"Feature drift of the new data: {drift:.3f}")
+        if drift > float(index_params.get("drift_threshold", 1.25)):
+            return False
 
-        faiss.write_index(index_trained, index_filepath_trained)
-        """
+    for chunk in store.iter_chunks():
+        index.add(chunk)
+
+    if is_ivf:
+        imbalance = get_imbalance_factor(index)
+        growth = imbalance / max(training["imbalance_factor"], 1e-12)
+        print(f"Inverted list imbalance: {imbalance:.3f} ({growth:.3f}x at training)")
+        if growth > float(index_params.get("imbalance_threshold", 1.5)):
+            return False
+    return True
+
+
+def extract_index(
+    exp_dir: str,
+    version: str,
+    index_algorithm: str,
+    index_type: str = "IVF-Flat",
+    index_params: dict = None,
+    benchmark: bool = True,
+    incremental: bool = False,
+    speaker_partitioned: bool = False,
+):
+    """
+    Builds the retrieval index of an experiment from its extracted features.
+
+    Args:
+        exp_dir (str): Experiment directory.
+        version (str): Model version ("v1" or "v2").
+        index_algorithm (str): "Auto", "Faiss" or "KMeans".
+        index_type (str): One of INDEX_TYPES.
+        index_params (dict, optional): Tunable index parameters.
+        benchmark (bool, optional): Whether to benchmark the index after building it.
+        incremental (bool, optional): Whether to add new feature files to an existing index.
+        speaker_partitioned (bool, optional): Whether to record per-speaker id ranges so
+            inference only searches the target speaker's vectors.
+    """
+    index_params = index_params or {}
+    feature_dir = os.path.join(exp_dir, f"{version}_extracted")
+    model_name = os.path.basename(exp_dir)
+
+    index_filename_added = f"added_{model_name}_{version}.index"
+    index_filepath_added = os.path.join(exp_dir, index_filename_added)
+    manifest_path = get_manifest_path(index_filepath_added)
+
+    manifest = None
+    if os.path.exists(index_filepath_added):
+        if not incremental:
+            return
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+        else:
+            print("The existing index has no manifest, rebuilding it.")
+
+    names = list_feature_files(feature_dir)
+    if speaker_partitioned:
+        # keep the vectors of every speaker contiguous
+        names = sorted(names, key=lambda name: (int(get_speaker_id(name)), name))
+    files = describe_feature_files(
+        feature_dir, names, manifest["files"] if manifest else None
+    )
+    dim = 256 if version == "v1" else 768
+
+    index = None
+    if manifest is not None:
+        indexed = manifest["files"]
+        new_names = [name for name in names if name not in indexed]
+        changed = [
+            name
+            for name in names
+            if name in indexed and indexed[name]["hash"] != files[name]["hash"]
+        ]
+        removed = [name for name in indexed if name not in files]
+        if changed or removed:
+            print(
+                f"{len(changed)} changed and {len(removed)} removed feature files, rebuilding the index."
+            )
+        elif (manifest.get("speaker_ranges") is not None) != speaker_partitioned:
+            print("The speaker partitioning changed, rebuilding the index.")
+        elif manifest["training"]["kmeans_reduced"] and new_names:
+            print("The index holds KMeans centroids, rebuilding the index.")
+        elif not new_names:
+            print(f"Index file '{index_filepath_added}' is up to date.")
+            return
+        else:
+            index = faiss.read_index(index_filepath_added)
+            print(f"Adding {len(new_names)} new feature files to the index...")
+            new_store = FeatureStore(feature_dir, new_names)
+            offset = index.ntotal
+            if update_index(index, manifest, new_store, index_params):
+                index_type = manifest["type"]
+                factory_string = manifest["factory_string"]
+                index_params = manifest["params"]
+                training = manifest["training"]
+                speaker_ranges = manifest.get("speaker_ranges")
+                if speaker_ranges is not None:
+                    blocks = [
+                        (get_speaker_id(name), length)
+                        for name, length in zip(new_store.names, new_store.lengths)
+                    ]
+                    add_speaker_ranges(speaker_ranges, blocks, offset)
+                # keep the manifest in index order
+                names = list(indexed) + new_names
+                files = {name: files[name] for name in names}
+            else:
+                print("The new data no longer fits the trained index, retraining.")
+                index = None
+
+    store = FeatureStore(feature_dir, names)
+    if index is None:
+        index, factory_string, database_chunks, training, speaker_ranges = (
+            build_index(
+                store,
+                dim,
+                index_algorithm,
+                index_type,
+                index_params,
+                speaker_partitioned,
+            )
+        )
+    else:
+        database_chunks = store.iter_chunks
 
-        # index_added
-        index_added = faiss.index_factory(
-            256 if version == "v1" else 768, f"IVF{n_ivf},Flat"
+    faiss.write_index(index, index_filepath_added)
+    print(f"Saved index file '{index_filepath_added}'")
+
+    index_info = {
+        "type": index_type,
+        "factory_string": factory_string,
+        "params": index_params,
+        "n_vectors": int(index.ntotal),
+        "speaker_partitioned": speaker_ranges is not None,
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(
+            {
+                **index_info,
+                "training": training,
+                "speaker_ranges": speaker_ranges,
+                "files": files,
+            },
+            f,
+            indent=4,
         )
-        index_ivf_added = faiss.extract_index_ivf(index_added)
-        index_ivf_added.nprobe = 1
-        index_added.train(big_npy)
 
-        batch_size_add = 8192
-        for i in range(0, big_npy.shape[0], batch_size_add):
-            index_added.add(big_npy[i : i + batch_size_add])
+    if benchmark:
+        index_info["benchmark"] = benchmark_index(
+            index,
+            index_filepath_added,
+            store.reservoir_sample(1000, seed=1),
+            database_chunks(),
+        )
+        print(f"Index benchmark: {index_info['benchmark']}")
+    save_index_info(exp_dir, index_info)
 
-        faiss.write_index(index_added, index_filepath_added)
-        print(f"Saved index file '{index_filepath_added}'")
 
-except Exception as error:
-    print(f"An error occurred extracting the index: {error}")
-    print(
-        "If you are running this code in a virtual environment, make sure you have enough GPU available to generate the Index file."
+if __name__ == "__main__":
+    # Parse command line arguments
+    exp_dir = str(sys.argv[1])
+    version = str(sys.argv[2])
+    index_algorithm = str(sys.argv[3])
+    index_type = str(sys.argv[4]) if len(sys.argv) > 4 else "IVF-Flat"
+    index_params = json.loads(sys.argv[5]) if len(sys.argv) > 5 else {}
+    benchmark = sys.argv[6].lower() == "true" if len(sys.argv) > 6 else True
+    incremental = sys.argv[7].lower() == "true" if len(sys.argv) > 7 else False
+    speaker_partitioned = (
+        sys.argv[8].lower() == "true" if len(sys.argv) > 8 else False
     )
+
+    try:
+        extract_index(
+            exp_dir,
+            version,
+            index_algorithm,
+            index_type,
+            index_params,
+            benchmark,
+            incremental,
+            speaker_partitioned,
+        )
+    except Exception as error:
+        print(f"An error occurred extracting the index: {error}")
+        print(
+            "If you are running this code in a virtual environment, make sure you have enough GPU available to generate the Index file."
+        )
@@ -4,6 +4,8 @@ import hashlib
 import datetime
 from collections import OrderedDict
 
+from rvc.lib.weights import load_weights
+
 
 def replace_keys_in_dict(d, old_key_part, new_key_part):
     # Use OrderedDict if the original is an OrderedDict
@@ -31,7 +33,7 @@ def extract_small_model(
     step: int,
 ):
     try:
-        ckpt = torch.load(path, map_location="cpu")
+        ckpt = load_weights(path)
         pth_file = f"{name}.pth"
         pth_file_old_version_path = os.path.join("logs", f"{pth_file}_old_version.pth")
         opt = OrderedDict(
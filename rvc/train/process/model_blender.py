@@ -2,6 +2,8 @@ import os
 import torch
 from collections import OrderedDict
 
+from rvc.lib.weights import load_weights
+
 
 def extract(ckpt):
     a = ckpt["model"]
@@ -17,8 +19,8 @@ def extract(ckpt):
 def model_blender(name, path1, path2, ratio):
     try:
         message = f"Model {path1} and {path2} are merged with alpha {ratio}."
-        ckpt1 = torch.load(path1, map_location="cpu")
-        ckpt2 = torch.load(path2, map_location="cpu")
+        ckpt1 = load_weights(path1, pth_layout=True)
+        ckpt2 = load_weights(path2, pth_layout=True)
 
         if ckpt1["sr"] != ckpt2["sr"]:
             return "The sample rates of the two models are not the same."
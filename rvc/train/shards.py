@@ -0,0 +1,353 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import numpy as np
+import torch
+from scipy.io import wavfile
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+from rvc.train.mel_processing import spectrogram_torch
+from rvc.train.extract.spectrograms import (
+    get_spec_dir,
+    get_spec_path,
+    spectrograms_are_current,
+)
+
+SHARD_VERSION = 1
+SHARD_DIR_NAME = "shards"
+SHARD_INDEX_NAME = "index.json"
+ALIGNMENT = 64
+AUDIO_DTYPES = {"int16": np.int16, "float16": np.float16, "float32": np.float32}
+# fixed dtypes of the other arrays, the features are repeated twice and cast to float32 on read
+ARRAY_DTYPES = {
+    "phone": np.float16,
+    "pitch": np.uint8,
+    "pitchf": np.float32,
+    "spec": np.float16,
+}
+
+
+def get_shard_dir(exp_dir: str) -> str:
+    """
+    Returns the directory holding the training shards of an experiment.
+
+    Args:
+        exp_dir (str): Experiment directory.
+    """
+    return os.path.join(exp_dir, SHARD_DIR_NAME)
+
+
+def hash_filelist(filelist_path: str) -> str:
+    """
+    Computes the SHA-256 hash of a filelist, shards are only used for the filelist they were packed from.
+
+    Args:
+        filelist_path (str): Path to filelist.txt.
+    """
+    with open(filelist_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_shard_index(shard_dir: str):
+    """
+    Loads the index of packed shards, None when there is none.
+
+    Args:
+        shard_dir (str): Directory of the shards.
+    """
+    index_path = os.path.join(shard_dir, SHARD_INDEX_NAME)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, "r") as f:
+        index = json.load(f)
+    if index.get("version") != SHARD_VERSION:
+        return None
+    return index
+
+
+def shards_are_current(shard_dir: str, filelist_path: str) -> bool:
+    """
+    Returns whether the shards in a directory were packed from the current filelist and
+    from the current versions of the files it lists.
+
+    Args:
+        shard_dir (str): Directory of the shards.
+        filelist_path (str): Path to filelist.txt.
+    """
+    index = load_shard_index(shard_dir)
+    if (
+        index is None
+        or not os.path.exists(filelist_path)
+        or index["filelist_hash"] != hash_filelist(filelist_path)
+        or not all(
+            os.path.exists(os.path.join(shard_dir, shard)) for shard in index["shards"]
+        )
+    ):
+        return False
+    # extracting again without packing keeps the filelist but rewrites the files it lists
+    try:
+        return index["source_signature"] == _source_signature(_read_rows(filelist_path))
+    except OSError:
+        return False
+
+
+def _read_rows(filelist_path: str) -> list:
+    with open(filelist_path, encoding="utf-8") as f:
+        return [line.strip().split("|") for line in f if line.strip()]
+
+
+def _source_signature(rows: list) -> str:
+    sha256 = hashlib.sha256()
+    for row in rows:
+        for path in row[:4]:
+            stat = os.stat(path)
+            sha256.update(f"{path}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    return sha256.hexdigest()
+
+
+class ShardWriter:
+    """
+    Appends arrays to numbered shard files, starting a new file once one reaches shard_size bytes.
+    """
+
+    def __init__(self, shard_dir: str, shard_size: int):
+        self.shard_dir = shard_dir
+        self.shard_size = shard_size
+        self.shards = []
+        self.file = None
+        self.offset = 0
+
+    def _next_shard(self):
+        if self.file is not None:
+            self.file.close()
+        name = f"shard_{len(self.shards):03d}.bin.tmp"
+        self.shards.append(name)
+        self.file = open(os.path.join(self.shard_dir, name), "wb")
+        self.offset = 0
+
+    def write_block(self, arrays: dict) -> dict:
+        """
+        Writes the arrays of one sample contiguously, returning their shard and offsets.
+
+        Args:
+            arrays (dict): Arrays by name, already in their stored dtype.
+        """
+        size = sum(
+            -(-array.nbytes // ALIGNMENT) * ALIGNMENT for array in arrays.values()
+        )
+        if self.file is None or (self.offset and self.offset + size > self.shard_size):
+            self._next_shard()
+        block = {"shard": len(self.shards) - 1}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            self.file.write(array.tobytes())
+            padding = -array.nbytes % ALIGNMENT
+            self.file.write(b"\0" * padding)
+            block[name] = [self.offset, list(array.shape)]
+            self.offset += array.nbytes + padding
+        return block
+
+    def close(self) -> list:
+        """
+        Closes the last shard and moves the shards in place, returning their names.
+        """
+        if self.file is not None:
+            self.file.close()
+        names = []
+        for name in self.shards:
+            os.replace(
+                os.path.join(self.shard_dir, name),
+                os.path.join(self.shard_dir, name[: -len(".tmp")]),
+            )
+            names.append(name[: -len(".tmp")])
+        return names
+
+
+def pack_shards(
+    exp_dir: str,
+    audio_dtype: str = "int16",
+    shard_size: int = 1 << 30,
+    force: bool = False,
+):
+    """
+    Packs the audio, features, coarse and fine F0 and spectrogram of every training sample
+    in filelist.txt into a few large shard files with a JSON offset index.
+
+    Samples are laid out by length, so the batches of the length-bucketed sampler read
+    neighbouring parts of the shards. Samples repeated in the filelist are stored once.
+
+    Args:
+        exp_dir (str): Experiment directory.
+        audio_dtype (str, optional): Stored audio dtype, "int16", "float16" or "float32".
+        shard_size (int, optional): Approximate size of a shard file in bytes.
+        force (bool, optional): Pack even when the shards are up to date.
+    """
+    if audio_dtype not in AUDIO_DTYPES:
+        raise ValueError(
+            f"Invalid audio dtype '{audio_dtype}', expected one of {list(AUDIO_DTYPES)}."
+        )
+    start_time = time.time()
+    filelist_path = os.path.join(exp_dir, "filelist.txt")
+    with open(os.path.join(exp_dir, "config.json"), "r") as f:
+        data_config = json.load(f)["data"]
+    rows = _read_rows(filelist_path)
+
+    shard_dir = get_shard_dir(exp_dir)
+    filelist_hash = hash_filelist(filelist_path)
+    signature = _source_signature(rows)
+    index = load_shard_index(shard_dir)
+    if (
+        not force
+        and index is not None
+        and index["filelist_hash"] == filelist_hash
+        and index["source_signature"] == signature
+        and index["audio_dtype"] == audio_dtype
+    ):
+        print(f"Training shards in {shard_dir} are up to date.")
+        return index
+    os.makedirs(shard_dir, exist_ok=True)
+
+    # samples repeated in the filelist, like the mute ones, share one block
+    block_keys = list(dict.fromkeys(tuple(row[:4]) for row in rows))
+    file_sizes = [os.path.getsize(key[0]) for key in block_keys]
+    order = sorted(range(len(block_keys)), key=lambda i: file_sizes[i])
+
+    # spectrograms precomputed by extract.py are reused
+    spec_dir = get_spec_dir(exp_dir)
+    use_spec_dir = spectrograms_are_current(spec_dir, data_config)
+    writer = ShardWriter(shard_dir, shard_size)
+    blocks = [None] * len(block_keys)
+    for i in order:
+        key = block_keys[i]
+        wav_path, phone_path, pitch_path, pitchf_path = key
+        sample_rate, audio = wavfile.read(wav_path)
+        if sample_rate != data_config["sample_rate"]:
+            raise ValueError(
+                f"{sample_rate} SR doesn't match target {data_config['sample_rate']} SR"
+            )
+        audio = audio.astype(np.float32)
+        spec_path = get_spec_path(spec_dir, wav_path)
+        if use_spec_dir and os.path.exists(spec_path):
+            spec = np.load(spec_path)
+        else:
+            spec = spectrogram_torch(
+                torch.from_numpy(audio).unsqueeze(0),
+                data_config["filter_length"],
+                data_config["hop_length"],
+                data_config["win_length"],
+                center=False,
+            ).squeeze(0)
+            spec = spec.numpy()
+        if audio_dtype == "int16":
+            stored_audio = np.clip(np.round(audio * 32768), -32768, 32767)
+        else:
+            stored_audio = audio
+        block = writer.write_block(
+            {
+                "audio": stored_audio.astype(AUDIO_DTYPES[audio_dtype]),
+                "phone": np.load(phone_path).astype(ARRAY_DTYPES["phone"]),
+                "pitch": np.load(pitch_path).astype(ARRAY_DTYPES["pitch"]),
+                "pitchf": np.load(pitchf_path).astype(ARRAY_DTYPES["pitchf"]),
+                "spec": spec.astype(ARRAY_DTYPES["spec"]),
+            }
+        )
+        # the sampler buckets samples by wav file size, as the file-based dataset does
+        block["file_size"] = file_sizes[i]
+        blocks[i] = block
+    block_ids = {key: i for i, key in enumerate(block_keys)}
+
+    index = {
+        "version": SHARD_VERSION,
+        "filelist_hash": filelist_hash,
+        "source_signature": signature,
+        "audio_dtype": audio_dtype,
+        "sample_rate": data_config["sample_rate"],
+        "shards": writer.close(),
+        "blocks": blocks,
+        "samples": [[block_ids[tuple(row[:4])], row[4]] for row in rows],
+    }
+    index_path = os.path.join(shard_dir, SHARD_INDEX_NAME)
+    with open(index_path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(index_path + ".tmp", index_path)
+    # drop shards of a previous, larger packing
+    for name in os.listdir(shard_dir):
+        if name.startswith("shard_") and name not in index["shards"]:
+            os.remove(os.path.join(shard_dir, name))
+
+    total_bytes = sum(
+        os.path.getsize(os.path.join(shard_dir, shard)) for shard in index["shards"]
+    )
+    print(
+        f"Packed {len(rows)} samples into {len(index['shards'])} shards ({total_bytes / 1024**2:.1f} MB) in {time.time() - start_time:.2f} seconds."
+    )
+    return index
+
+
+class ShardReader:
+    """
+    Reads sample arrays from packed shards through copy-on-write memory maps.
+
+    The shards are mapped on first use, so a reader created in the main process maps
+    them again in every DataLoader worker instead of pickling the mappings.
+    """
+
+    def __init__(self, shard_dir: str, index: dict = None):
+        """
+        Initializes the ShardReader.
+
+        Args:
+            shard_dir (str): Directory of the shards.
+            index (dict, optional): The shard index, loaded from shard_dir by default.
+        """
+        self.shard_dir = shard_dir
+        self.index = index or load_shard_index(shard_dir)
+        if self.index is None:
+            raise FileNotFoundError(f"No training shards found in {shard_dir}.")
+        self.audio_dtype = AUDIO_DTYPES[self.index["audio_dtype"]]
+        self.maps = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["maps"] = None
+        return state
+
+    def _array(self, block: dict, name: str, dtype) -> np.ndarray:
+        offset, shape = block[name]
+        count = int(np.prod(shape))
+        return np.frombuffer(
+            self.maps[block["shard"]], dtype=dtype, count=count, offset=offset
+        ).reshape(shape)
+
+    def read(self, block_id: int) -> dict:
+        """
+        Returns the arrays of a block as views of the shard, with the audio as float32.
+
+        Args:
+            block_id (int): Index of the block.
+        """
+        if self.maps is None:
+            self.maps = [
+                np.memmap(
+                    os.path.join(self.shard_dir, shard), dtype=np.uint8, mode="c"
+                )
+                for shard in self.index["shards"]
+            ]
+        block = self.index["blocks"][block_id]
+        audio = self._array(block, "audio", self.audio_dtype)
+        if self.audio_dtype == np.int16:
+            audio = audio.astype(np.float32) / 32768
+        arrays = {"audio": audio.astype(np.float32, copy=False)}
+        for name, dtype in ARRAY_DTYPES.items():
+            arrays[name] = self._array(block, name, dtype)
+        return arrays
+
+
+if __name__ == "__main__":
+    exp_dir = sys.argv[1]
+    audio_dtype = sys.argv[2] if len(sys.argv) > 2 else "int16"
+    pack_shards(exp_dir, audio_dtype, force=True)
@@ -26,6 +26,8 @@ sys.path.append(os.path.join(now_dir))
 
 # Zluda hijack
 import rvc.lib.zluda
+from rvc.lib.weights import load_weights
+from rvc.train.shards import get_shard_dir, shards_are_current
 
 from utils import (
     HParams,
@@ -121,7 +123,7 @@ class EpochRecorder:
 
 
 def verify_checkpoint_shapes(checkpoint_path, model):
-    checkpoint = torch.load(checkpoint_path, map_location="cpu")
+    checkpoint = load_weights(checkpoint_path)
     checkpoint_state_dict = checkpoint["model"]
     try:
         if hasattr(model, "module"):
@@ -330,9 +332,16 @@ def run(
         DistributedBucketSampler,
         TextAudioCollateMultiNSFsid,
         TextAudioLoaderMultiNSFsid,
+        TextAudioShardLoaderMultiNSFsid,
     )
 
-    train_dataset = TextAudioLoaderMultiNSFsid(config.data)
+    shard_dir = get_shard_dir(experiment_dir)
+    if shards_are_current(shard_dir, config.data.training_files):
+        if rank == 0:
+            print(f"Reading training samples from the shards in {shard_dir}")
+        train_dataset = TextAudioShardLoaderMultiNSFsid(config.data, shard_dir)
+    else:
+        train_dataset = TextAudioLoaderMultiNSFsid(config.data)
     collate_fn = TextAudioCollateMultiNSFsid()
     train_sampler = DistributedBucketSampler(
         train_dataset,
@@ -409,25 +418,17 @@ def run(
                 verify_checkpoint_shapes(pretrainG, net_g)
                 print(f"Loaded pretrained (G) '{pretrainG}'")
             if hasattr(net_g, "module"):
-                net_g.module.load_state_dict(
-                    torch.load(pretrainG, map_location="cpu")["model"]
-                )
+                net_g.module.load_state_dict(load_weights(pretrainG)["model"])
             else:
-                net_g.load_state_dict(
-                    torch.load(pretrainG, map_location="cpu")["model"]
-                )
+                net_g.load_state_dict(load_weights(pretrainG)["model"])
 
         if pretrainD != "" and pretrainD != "None":
             if rank == 0:
                 print(f"Loaded pretrained (D) '{pretrainD}'")
             if hasattr(net_d, "module"):
-                net_d.module.load_state_dict(
-                    torch.load(pretrainD, map_location="cpu")["model"]
-                )
+                net_d.module.load_state_dict(load_weights(pretrainD)["model"])
             else:
-                net_d.load_state_dict(
-                    torch.load(pretrainD, map_location="cpu")["model"]
-                )
+                net_d.load_state_dict(load_weights(pretrainD)["model"])
 
     # Initialize schedulers and scaler
     scheduler_g = torch.optim.lr_scheduler.ExponentialLR(
@@ -6,6 +6,8 @@ from scipy.io.wavfile import read
 from collections import OrderedDict
 import matplotlib.pyplot as plt
 
+from rvc.lib.weights import load_weights
+
 MATPLOTLIB_FLAG = False
 
 
@@ -45,7 +47,7 @@ def load_checkpoint(checkpoint_path, model, optimizer=None, load_opt=1):
         checkpoint_path
     ), f"Checkpoint file not found: {checkpoint_path}"
 
-    checkpoint_dict = torch.load(checkpoint_path, map_location="cpu")
+    checkpoint_dict = load_weights(checkpoint_path)
     checkpoint_dict = replace_keys_in_dict(
         replace_keys_in_dict(
             checkpoint_dict, ".weight_v", ".parametrizations.weight.original1"
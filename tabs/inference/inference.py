@@ -4,7 +4,6 @@ import regex as re
 import shutil
 import datetime
 import json
-import torch
 
 from core import (
     run_infer_script,
@@ -14,6 +13,7 @@ from core import (
 from assets.i18n.i18n import I18nAuto
 
 from rvc.lib.utils import format_title
+from rvc.lib.model_library import get_model_library
 from tabs.settings.sections.restart import stop_infer
 
 i18n = I18nAuto()
@@ -52,31 +52,38 @@ sup_audioext = {
     "ac3",
 }
 
-names = [
-    os.path.join(root, file)
-    for root, _, files in os.walk(model_root_relative, topdown=False)
-    for file in files
-    if (
-        file.endswith((".pth", ".onnx"))
-        and not (file.startswith("G_") or file.startswith("D_"))
-    )
-]
+model_library = get_model_library()
+
+
+def get_model_names():
+    return [
+        model.path
+        for model in model_library.files(
+            model_root_relative, (".pth", ".onnx", ".safetensors")
+        )
+        if not (model.name.startswith("G_") or model.name.startswith("D_"))
+    ]
+
+
+def get_audio_paths():
+    return [
+        audio.path
+        for audio in model_library.files(
+            audio_root_relative, tuple(sup_audioext), recursive=False
+        )
+        if "_output" not in audio.name
+    ]
+
+
+names = get_model_names()
 
 indexes_list = [
-    os.path.join(root, name)
-    for root, _, files in os.walk(model_root_relative, topdown=False)
-    for name in files
-    if name.endswith(".index") and "trained" not in name
+    index.path
+    for index in model_library.files(model_root_relative, (".index",))
+    if "trained" not in index.name
 ]
 
-audio_paths = [
-    os.path.join(root, name)
-    for root, _, files in os.walk(audio_root_relative, topdown=False)
-    for name in files
-    if name.endswith(tuple(sup_audioext))
-    and root == audio_root_relative
-    and "_output" not in name
-]
+audio_paths = get_audio_paths()
 
 custom_embedders = [
     os.path.join(dirpath, dirname)
@@ -179,31 +186,9 @@ def change_choices(model):
         speakers = get_speakers_id(model)
     else:
         speakers = [0]
-    names = [
-        os.path.join(root, file)
-        for root, _, files in os.walk(model_root_relative, topdown=False)
-        for file in files
-        if (
-            file.endswith((".pth", ".onnx"))
-            and not (file.startswith("G_") or file.startswith("D_"))
-        )
-    ]
-
-    indexes_list = [
-        os.path.join(root, name)
-        for root, _, files in os.walk(model_root_relative, topdown=False)
-        for name in files
-        if name.endswith(".index") and "trained" not in name
-    ]
-
-    audio_paths = [
-        os.path.join(root, name)
-        for root, _, files in os.walk(audio_root_relative, topdown=False)
-        for name in files
-        if name.endswith(tuple(sup_audioext))
-        and root == audio_root_relative
-        and "_output" not in name
-    ]
+    names = get_model_names()
+    indexes_list = get_indexes() or []
+    audio_paths = get_audio_paths()
 
     return (
         {"choices": sorted(names), "__type__": "update"},
@@ -230,10 +215,9 @@ def change_choices(model):
 
 def get_indexes():
     indexes_list = [
-        os.path.join(dirpath, filename)
-        for dirpath, _, filenames in os.walk(model_root_relative)
-        for filename in filenames
-        if filename.endswith(".index") and "trained" not in filename
+        index.path
+        for index in model_library.files(model_root_relative, (".index",))
+        if "trained" not in index.name
     ]
 
     return indexes_list if indexes_list else ""
@@ -323,7 +307,7 @@ def refresh_embedders_folders():
 def get_speakers_id(model):
     if model:
         try:
-            model_data = torch.load(os.path.join(now_dir, model), map_location="cpu")
+            model_data = model_library.metadata(os.path.join(now_dir, model))
             speakers_id = model_data.get("speakers_id")
             if speakers_id:
                 return list(range(speakers_id))
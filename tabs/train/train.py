@@ -15,6 +15,7 @@ from core import (
 )
 from rvc.configs.config import get_gpu_info, get_number_of_gpus, max_vram_gpu
 from rvc.lib.utils import format_title
+from rvc.lib.model_library import get_model_library
 from tabs.settings.sections.restart import stop_train
 
 i18n = I18nAuto()
@@ -240,19 +241,20 @@ def refresh_embedders_folders():
 ## Get Pth and Index Files
 def get_pth_list():
     return [
-        os.path.relpath(os.path.join(dirpath, filename), now_dir)
-        for dirpath, _, filenames in os.walk(models_path)
-        for filename in filenames
-        if filename.endswith(".pth")
+        model.path
+        for model in get_model_library().files(
+            os.path.relpath(models_path, now_dir), (".pth",)
+        )
     ]
 
 
 def get_index_list():
     return [
-        os.path.relpath(os.path.join(dirpath, filename), now_dir)
-        for dirpath, _, filenames in os.walk(models_path)
-        for filename in filenames
-        if filename.endswith(".index") and "trained" not in filename
+        index.path
+        for index in get_model_library().files(
+            os.path.relpath(models_path, now_dir), (".index",)
+        )
+        if "trained" not in index.name
     ]
 
 
@@ -731,6 +733,15 @@ def train_tab():
                     value="Auto",
                     interactive=True,
                 )
+                index_type = gr.Radio(
+                    label=i18n("Index Type"),
+                    info=i18n(
+                        "Type of the FAISS index. IVF-Flat is the default, Flat is exact but slower on large datasets, IVF-PQ and SQ are smaller, HNSW is faster to search."
+                    ),
+                    choices=["Flat", "IVF-Flat", "IVF-PQ", "HNSW", "SQ"],
+                    value="IVF-Flat",
+                    interactive=True,
+                )
 
         def enforce_terms(terms_accepted, *args):
             if not terms_accepted:
@@ -794,7 +805,7 @@ def train_tab():
             index_button = gr.Button(i18n("Generate Index"))
             index_button.click(
                 fn=run_index_script,
-                inputs=[model_name, rvc_version, index_algorithm],
+                inputs=[model_name, rvc_version, index_algorithm, index_type],
                 outputs=[train_output_info],
             )
 